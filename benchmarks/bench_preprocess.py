@@ -0,0 +1,99 @@
+# benchmarks/bench_preprocess.py
+"""
+Micro-benchmark del preprocesamiento por registro.
+  legacy: extract_identifier_field + json.dumps/sha256 + build_texto_unificado
+          + json.dumps del dedup + json.dumps del upsert (lo que hacía el ingestor)
+  single: preprocess_record (un recorrido + json canónico reutilizado + blake2b)
+
+Uso: python -m benchmarks.bench_preprocess [--records 20000] [--repeat 3]
+"""
+
+import argparse
+import hashlib
+import json
+import random
+import string
+import time
+
+from ingestor.utils.identifier import extract_identifier_field
+from ingestor.utils.text_unifier import build_texto_unificado
+from ingestor.utils.preprocess import preprocess_record
+
+
+def _legacy_hash_completo(record: dict) -> str:
+    t = json.dumps(record, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(t.encode("utf-8")).hexdigest()
+
+
+def legacy(record: dict):
+    id_estable = extract_identifier_field(record, "email")
+    hcomp = _legacy_hash_completo(record)
+    texto = build_texto_unificado(record) or " "
+    json.dumps(record, sort_keys=True)  # clave de dedup en merge_sources
+    payload = json.dumps(record)  # payload jsonb en upsert_batch
+    return id_estable, hcomp, payload, texto
+
+
+def _word(rng: random.Random) -> str:
+    return "".join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(3, 10)))
+
+
+def make_record(rng: random.Random, i: int) -> dict:
+    return {
+        "id": i,
+        "nombre": f"{_word(rng)} {_word(rng)}",
+        "dni": str(10_000_000 + i),
+        "contacto": {"email": f"user{i}@empresa.pe", "telefono": str(rng.randint(900_000_000, 999_999_999))},
+        "area": rng.choice(["redes", "soporte", "desarrollo", "datos"]),
+        "ubicacion": rng.choice(["Lima", "Arequipa", "Cusco", "Trujillo"]),
+        "activo": rng.random() > 0.1,
+        "experiencia": [
+            {"empresa": _word(rng), "cargo": _word(rng), "anios": rng.randint(1, 10),
+             "descripcion": " ".join(_word(rng) for _ in range(rng.randint(10, 40)))}
+            for _ in range(rng.randint(1, 4))
+        ],
+        "certificaciones": [_word(rng).upper() for _ in range(rng.randint(0, 5))],
+    }
+
+
+def bench(fn, records, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for r in records:
+            fn(r)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--records", type=int, default=20000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    records = [make_record(rng, i) for i in range(args.records)]
+
+    # mismos id y texto que las funciones originales
+    for r in records[:1000]:
+        old, new = legacy(r), preprocess_record(r)
+        assert old[0] == new[0], "id_estable distinto"
+        assert old[3] == (new[3] or " "), "texto_unificado distinto"
+
+    t_legacy = bench(legacy, records, args.repeat)
+    t_single = bench(preprocess_record, records, args.repeat)
+
+    print(json.dumps({
+        "records": args.records,
+        "legacy_s": round(t_legacy, 4),
+        "single_pass_s": round(t_single, 4),
+        "legacy_records_per_s": round(args.records / t_legacy),
+        "single_pass_records_per_s": round(args.records / t_single),
+        "speedup": round(t_legacy / t_single, 2),
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
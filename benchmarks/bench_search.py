@@ -0,0 +1,158 @@
+# benchmarks/bench_search.py
+"""
+Benchmark de latencia de la búsqueda semántica (p50/p95/p99 y QPS con N usuarios concurrentes).
+Crea una tabla sintética (no toca trabajadores), construye el índice ANN pedido y lanza
+consultas concurrentes a través de SearchService.
+
+Por defecto los vectores de consulta son aleatorios (aísla pgvector); con --tei-url
+las consultas pasan por TEI + LRU como en producción.
+
+Uso: DATABASE_URL=... python -m benchmarks.bench_search [--rows 100000] [--users 16]
+     [--queries 200] [--index hnsw|ivfflat|none] [--ef-search 40] [--probes 10] [--filtered]
+"""
+
+import os
+import json
+import time
+import random
+import asyncio
+import argparse
+from typing import List
+
+import asyncpg
+import numpy as np
+
+from ingestor.core import init_connection
+from ingestor.tei_client import TEIClient
+from ingestor.embedding_cache import EmbeddingCache
+from ingestor.monitoring.search import SearchService, ensure_ann_index
+
+TABLE = "bench_search_trabajadores"
+AREAS = ["data", "cloud", "backend", "frontend", "qa", "devops", "seguridad", "soporte"]
+SENIORITY = ["junior", "semi-senior", "senior"]
+
+
+class _RandomEmbedder:
+    """Sustituto de TEIClient: vectores unitarios aleatorios, sin red."""
+
+    def __init__(self, dim: int, seed: int):
+        self.dim = dim
+        self.rng = np.random.default_rng(seed)
+
+    async def embed_batch(self, session, texts: List[str]):
+        v = self.rng.standard_normal((len(texts), self.dim)).astype(np.float32)
+        return v / np.linalg.norm(v, axis=1, keepdims=True)
+
+
+async def populate(pool: asyncpg.Pool, rows: int, dim: int, seed: int):
+    rng = np.random.default_rng(seed)
+    prng = random.Random(seed)
+
+    async with pool.acquire() as conn:
+        await conn.execute(f"DROP TABLE IF EXISTS {TABLE}")
+        await conn.execute(
+            f"CREATE TABLE {TABLE} (id_estable text PRIMARY KEY, json_data jsonb NOT NULL, "
+            f"embedding vector({dim}))"
+        )
+
+        chunk = 10000
+        for offset in range(0, rows, chunk):
+            n = min(chunk, rows - offset)
+            vectors = rng.standard_normal((n, dim)).astype(np.float32)
+            vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+            records = [
+                (
+                    f"user{offset + i}@example.com",
+                    json.dumps({"area": prng.choice(AREAS), "seniority": prng.choice(SENIORITY)}),
+                    vectors[i],
+                )
+                for i in range(n)
+            ]
+            await conn.copy_records_to_table(TABLE, records=records,
+                                             columns=["id_estable", "json_data", "embedding"])
+        await conn.execute(f"ANALYZE {TABLE}")
+
+
+def _percentile(values: List[float], p: float) -> float:
+    return round(float(np.percentile(values, p)), 2) if values else 0.0
+
+
+async def run_load(service: SearchService, users: int, queries: int, k: int,
+                   ef_search, probes, filtered: bool, seed: int):
+    latencies: List[float] = []
+    prng = random.Random(seed)
+
+    async def user(uid: int):
+        for q in range(queries):
+            filters = {"area": prng.choice(AREAS)} if filtered else None
+            start = time.perf_counter()
+            await service.search(f"perfil {uid}-{q}", k=k, filters=filters,
+                                 ef_search=ef_search, probes=probes)
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(user(u) for u in range(users)))
+    elapsed = time.perf_counter() - start
+
+    return {
+        "queries": len(latencies),
+        "qps": round(len(latencies) / elapsed, 1),
+        "p50_ms": _percentile(latencies, 50),
+        "p95_ms": _percentile(latencies, 95),
+        "p99_ms": _percentile(latencies, 99),
+        "max_ms": round(max(latencies), 2) if latencies else 0.0,
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--users", type=int, default=16)
+    parser.add_argument("--queries", type=int, default=200, help="consultas por usuario")
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--index", choices=["hnsw", "ivfflat", "none"], default="hnsw")
+    parser.add_argument("--ef-search", type=int, default=None)
+    parser.add_argument("--probes", type=int, default=None)
+    parser.add_argument("--filtered", action="store_true", help="añade un filtro JSONB por área")
+    parser.add_argument("--tei-url", default=None)
+    parser.add_argument("--skip-populate", action="store_true")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    pool = await asyncpg.create_pool(os.environ["DATABASE_URL"], min_size=1,
+                                     max_size=args.users + 2, init=init_connection)
+    try:
+        if not args.skip_populate:
+            start = time.perf_counter()
+            await populate(pool, args.rows, args.dim, args.seed)
+            print(json.dumps({"event": "populated", "rows": args.rows,
+                              "seconds": round(time.perf_counter() - start, 2)}))
+
+        if args.index != "none":
+            start = time.perf_counter()
+            await ensure_ann_index(pool, kind=args.index, table=TABLE)
+            print(json.dumps({"event": "index_built", "index": args.index,
+                              "seconds": round(time.perf_counter() - start, 2)}))
+
+        if args.tei_url:
+            embedder = TEIClient(args.tei_url, cache=EmbeddingCache("bench", max_items=10000))
+        else:
+            embedder = _RandomEmbedder(args.dim, args.seed)
+
+        service = SearchService(pool, embedder, table=TABLE, expected_dim=args.dim)
+        await service.start()
+        result = await run_load(service, args.users, args.queries, args.k,
+                                args.ef_search, args.probes, args.filtered, args.seed)
+        result.update({"index": args.index, "users": args.users, "rows": args.rows,
+                       "ef_search": args.ef_search, "probes": args.probes, "filtered": args.filtered})
+        print(json.dumps(result))
+
+        if args.tei_url:
+            await embedder.close()
+    finally:
+        await pool.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
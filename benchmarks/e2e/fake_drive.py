@@ -0,0 +1,70 @@
+# benchmarks/e2e/fake_drive.py
+"""
+Fuente Drive falsa: documentos sintéticos con el mismo formato de registro que
+DriveSource ({"documento", "contenido", "mime_type", "file_id"} + email), latencia simulada
+de listado por página y de descarga+extracción por archivo (en paralelo acotado).
+"""
+
+import asyncio
+import random
+from typing import Any, AsyncIterator, Dict, List
+
+from ingestor.sources.base_source import BaseSource
+
+from benchmarks.e2e.generator import WORDS
+
+
+class FakeDriveSource(BaseSource):
+    key = "drive"
+
+    def __init__(self, files: int = 200, words: int = 1500, page_size: int = 100,
+                 list_latency_ms: float = 50, file_latency_ms: float = 30,
+                 download_concurrency: int = 8, seed: int = 7):
+        self.folder_id = "fake-drive"
+        self.page_size = page_size
+        self.list_latency_ms = list_latency_ms
+        self.file_latency_ms = file_latency_ms
+        self.words = words
+        self.rng = random.Random(seed)
+        self._sem = asyncio.Semaphore(download_concurrency)
+        self.files: List[Dict[str, Any]] = [self._file(i) for i in range(files)]
+
+    def _file(self, i: int) -> Dict[str, Any]:
+        return {
+            "id": f"file{i:06d}",
+            "name": f"cv_trabajador{i:07d}.pdf",
+            "text": " ".join(self.rng.choice(WORDS) for _ in range(self.words)),
+        }
+
+    def mutate(self, churn: float) -> int:
+        n = int(len(self.files) * churn)
+        for idx in self.rng.sample(range(len(self.files)), n):
+            self.files[idx] = dict(self._file(idx), text=" ".join(self.rng.choice(WORDS) for _ in range(self.words)))
+        return n
+
+    async def _process(self, f: Dict[str, Any]) -> Dict[str, Any]:
+        async with self._sem:
+            await asyncio.sleep(self.file_latency_ms / 1000)
+        return {
+            "raw": {
+                # id estable del CV: sin email el registro no tendría clave para el upsert
+                "email": f"{f['id']}@drive.example.com",
+                "documento": f["name"],
+                "contenido": f["text"],
+                "mime_type": "application/pdf",
+                "file_id": f["id"],
+            },
+            "source": "google_drive",
+        }
+
+    async def iter_pages(self) -> AsyncIterator[List[Dict[str, Any]]]:
+        for start in range(0, len(self.files), self.page_size):
+            await asyncio.sleep(self.list_latency_ms / 1000)
+            chunk = self.files[start:start + self.page_size]
+            yield await asyncio.gather(*(self._process(f) for f in chunk))
+
+    async def fetch(self) -> List[Dict[str, Any]]:
+        results = []
+        async for page in self.iter_pages():
+            results.extend(page)
+        return results
@@ -0,0 +1,82 @@
+# benchmarks/e2e/fake_supabase.py
+"""
+Endpoint PostgREST falso sobre una lista de registros en memoria (la del generador).
+Soporta lo que usa GenericAPISource:
+ - paginación por header Range (Content-Range, 416 fuera de rango)
+ - keyset: order=<col>.asc, limit=N, <col>=gt.<valor>
+ - filtro incremental <col>=gte.<valor>
+ - ETag / If-None-Match -> 304
+"""
+
+import asyncio
+import hashlib
+from typing import Any, Callable, Dict, List
+
+import orjson
+from aiohttp import web
+
+
+def _cast(value: str, sample: Any):
+    return type(sample)(value) if isinstance(sample, (int, float)) else value
+
+
+class FakeSupabase:
+    def __init__(self, records: Callable[[], List[Dict[str, Any]]], latency_ms: float = 5,
+                 per_row_us: float = 5):
+        self.records = records
+        self.latency_ms = latency_ms
+        self.per_row_us = per_row_us
+        self.requests = 0
+
+    def _filter(self, rows: List[Dict[str, Any]], params) -> List[Dict[str, Any]]:
+        for col, expr in params.items():
+            if col in ("order", "limit", "select", "offset"):
+                continue
+            op, _, value = expr.partition(".")
+            if not rows or op not in ("gt", "gte", "eq"):
+                continue
+            v = _cast(value, rows[0].get(col))
+            if op == "gt":
+                rows = [r for r in rows if r.get(col) is not None and r[col] > v]
+            elif op == "gte":
+                rows = [r for r in rows if r.get(col) is not None and r[col] >= v]
+            else:
+                rows = [r for r in rows if r.get(col) == v]
+
+        order = params.get("order")
+        if order:
+            col, _, direction = order.partition(".")
+            rows = sorted(rows, key=lambda r: r.get(col), reverse=direction == "desc")
+        return rows
+
+    async def handle(self, request: web.Request) -> web.Response:
+        self.requests += 1
+        rows = self._filter(self.records(), request.query)
+
+        total = len(rows)
+        headers = {}
+        rng = request.headers.get("Range")
+        if rng:
+            start, _, end = rng.partition("-")
+            start, end = int(start), int(end)
+            if start >= total and total > 0 or (total == 0 and start > 0):
+                return web.Response(status=416, headers={"Content-Range": f"*/{total}"})
+            rows = rows[start:end + 1]
+            headers["Content-Range"] = f"{start}-{start + len(rows) - 1}/{total}"
+        elif "limit" in request.query:
+            rows = rows[:int(request.query["limit"])]
+
+        body = orjson.dumps(rows)
+        etag = '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+        headers["ETag"] = etag
+
+        await asyncio.sleep((self.latency_ms + self.per_row_us * len(rows) / 1000) / 1000)
+
+        if request.headers.get("If-None-Match") == etag:
+            return web.Response(status=304, headers=headers)
+        return web.Response(body=body, content_type="application/json", headers=headers)
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_get("/rest/v1/trabajadores", self.handle)
+        return app
@@ -0,0 +1,102 @@
+# benchmarks/e2e/fake_tei.py
+"""
+TEI falso (POST /embed) con latencia, límites de batch e inyección de errores configurables.
+ - vectores determinísticos por texto (mismo texto -> mismo vector), normalizados
+ - 413 si el request supera max_batch textos o max_batch_tokens (estimación por palabras)
+ - 429 con Retry-After con probabilidad overload_rate; 500 con probabilidad error_rate
+ - `workers` requests en paralelo como máximo (simula la cola de un TEI real)
+
+Standalone: python -m benchmarks.e2e.fake_tei --port 8090 --latency-ms 20
+"""
+
+import asyncio
+import argparse
+import hashlib
+import random
+from typing import List
+
+import numpy as np
+import orjson
+from aiohttp import web
+
+
+class FakeTEI:
+    def __init__(self, dim: int = 384, latency_ms: float = 10, per_text_ms: float = 0.5,
+                 jitter_ms: float = 2, max_batch: int = 64, max_batch_tokens: int = 16384,
+                 error_rate: float = 0.0, overload_rate: float = 0.0, workers: int = 2, seed: int = 7):
+        self.dim = dim
+        self.latency_ms = latency_ms
+        self.per_text_ms = per_text_ms
+        self.jitter_ms = jitter_ms
+        self.max_batch = max_batch
+        self.max_batch_tokens = max_batch_tokens
+        self.error_rate = error_rate
+        self.overload_rate = overload_rate
+        self.rng = random.Random(seed)
+        self._workers = asyncio.Semaphore(workers)
+
+        self.requests = 0
+        self.texts = 0
+        self.rejected = {413: 0, 429: 0, 500: 0}
+
+    def _vectors(self, texts: List[str]) -> np.ndarray:
+        out = np.empty((len(texts), self.dim), dtype=np.float32)
+        for i, t in enumerate(texts):
+            seed = int.from_bytes(hashlib.blake2b(t.encode("utf-8"), digest_size=8).digest(), "little")
+            out[i] = np.random.default_rng(seed).standard_normal(self.dim)
+        return out / np.linalg.norm(out, axis=1, keepdims=True)
+
+    async def embed(self, request: web.Request) -> web.Response:
+        body = orjson.loads(await request.read())
+        texts = body.get("inputs") or []
+        if isinstance(texts, str):
+            texts = [texts]
+        self.requests += 1
+
+        tokens = sum(int(len(t.split()) * 1.3) + 2 for t in texts)
+        if len(texts) > self.max_batch or tokens > self.max_batch_tokens:
+            self.rejected[413] += 1
+            return web.json_response({"error": "batch too large"}, status=413)
+        if self.overload_rate and self.rng.random() < self.overload_rate:
+            self.rejected[429] += 1
+            return web.json_response({"error": "overloaded"}, status=429, headers={"Retry-After": "0.05"})
+        if self.error_rate and self.rng.random() < self.error_rate:
+            self.rejected[500] += 1
+            return web.json_response({"error": "injected"}, status=500)
+
+        async with self._workers:
+            delay = self.latency_ms + self.per_text_ms * len(texts) + self.rng.uniform(0, self.jitter_ms)
+            await asyncio.sleep(delay / 1000)
+            vectors = self._vectors(texts)
+
+        self.texts += len(texts)
+        return web.Response(body=orjson.dumps(vectors, option=orjson.OPT_SERIALIZE_NUMPY),
+                            content_type="application/json")
+
+    def stats(self):
+        return {"requests": self.requests, "texts": self.texts, "rejected": dict(self.rejected)}
+
+    def app(self) -> web.Application:
+        app = web.Application(client_max_size=64 * 1024 * 1024)
+        app.router.add_post("/embed", self.embed)
+        return app
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--latency-ms", type=float, default=10)
+    parser.add_argument("--per-text-ms", type=float, default=0.5)
+    parser.add_argument("--max-batch", type=int, default=64)
+    parser.add_argument("--max-batch-tokens", type=int, default=16384)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--overload-rate", type=float, default=0.0)
+    parser.add_argument("--workers", type=int, default=2)
+    args = parser.parse_args()
+
+    async def build():
+        return FakeTEI(latency_ms=args.latency_ms, per_text_ms=args.per_text_ms, max_batch=args.max_batch,
+                       max_batch_tokens=args.max_batch_tokens, error_rate=args.error_rate,
+                       overload_rate=args.overload_rate, workers=args.workers).app()
+
+    web.run_app(build(), host="127.0.0.1", port=args.port)
@@ -0,0 +1,72 @@
+# benchmarks/e2e/generator.py
+"""
+Generador sintético de registros de trabajadores (determinístico por seed).
+ - size: cantidad de palabras del texto libre (experiencia / resumen)
+ - nesting: profundidad de los objetos anidados (perfil -> historial -> ...)
+ - churn: fracción de registros que cambia entre rondas (mutate)
+"""
+
+import datetime
+import random
+from typing import Any, Dict, List
+
+AREAS = ["data", "cloud", "backend", "frontend", "qa", "devops", "seguridad", "soporte", "redes"]
+CIUDADES = ["Lima", "Arequipa", "Trujillo", "Cusco", "Piura", "Santiago", "Bogotá"]
+SKILLS = ["python", "java", "sql", "aws", "azure", "docker", "kubernetes", "cisco", "linux",
+          "react", "terraform", "spark", "excel", "itil", "scrum", "go", "node", "power bi"]
+WORDS = ("experiencia proyecto cliente equipo lideré implementación migración soporte redes "
+         "infraestructura desarrollo análisis datos nube seguridad monitoreo automatización "
+         "certificación gestión servicios plataforma integración pruebas despliegue").split()
+
+
+class RecordGenerator:
+    def __init__(self, seed: int = 7, size: int = 120, nesting: int = 2):
+        self.rng = random.Random(seed)
+        self.size = size
+        self.nesting = nesting
+        self.records: List[Dict[str, Any]] = []
+        self._clock = datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc)
+
+    def _tick(self) -> str:
+        self._clock += datetime.timedelta(milliseconds=1)
+        return self._clock.isoformat()
+
+    def _text(self, words: int) -> str:
+        return " ".join(self.rng.choice(WORDS) for _ in range(words))
+
+    def _nested(self, depth: int) -> Dict[str, Any]:
+        node: Dict[str, Any] = {
+            "empresa": f"empresa {self.rng.randint(1, 500)}",
+            "rol": self.rng.choice(SKILLS) + " " + self.rng.choice(["developer", "engineer", "analyst"]),
+            "anios": self.rng.randint(1, 15),
+        }
+        if depth > 1:
+            node["detalle"] = [self._nested(depth - 1) for _ in range(2)]
+        return node
+
+    def _record(self, i: int) -> Dict[str, Any]:
+        return {
+            "id": i,
+            "email": f"trabajador{i:07d}@example.com",
+            "nombre": f"Trabajador {i}",
+            "area": self.rng.choice(AREAS),
+            "ciudad": self.rng.choice(CIUDADES),
+            "skills": self.rng.sample(SKILLS, 5),
+            "resumen": self._text(self.size),
+            "historial": [self._nested(self.nesting) for _ in range(max(1, self.nesting))],
+            "updated_at": self._tick(),
+        }
+
+    def generate(self, n: int) -> List[Dict[str, Any]]:
+        self.records = [self._record(i) for i in range(1, n + 1)]
+        return self.records
+
+    def mutate(self, churn: float) -> int:
+        """Modifica in-place una fracción `churn` de los registros; devuelve cuántos cambió."""
+        n = int(len(self.records) * churn)
+        for idx in self.rng.sample(range(len(self.records)), n):
+            r = self.records[idx]
+            r["resumen"] = self._text(self.size)
+            r["skills"] = self.rng.sample(SKILLS, 5)
+            r["updated_at"] = self._tick()
+        return n
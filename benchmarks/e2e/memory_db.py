@@ -0,0 +1,179 @@
+# benchmarks/e2e/memory_db.py
+"""
+Sustituto en memoria de la capa asyncpg para correr el pipeline real sin Postgres.
+Implementa solo las sentencias que ejecuta el ingestor (se reconocen por el texto
+SQL de sus constantes) con una latencia de ida y vuelta configurable por llamada.
+Cualquier otra sentencia levanta NotImplementedError: si el ingestor agrega SQL
+nuevo, el benchmark lo hace notar en lugar de medir algo distinto en silencio.
+Las transacciones no hacen rollback (no hay errores de BD que simular).
+"""
+
+import asyncio
+import datetime
+from typing import Any, Dict, List, Optional
+
+from ingestor import core, hash_index, chunking, identity
+
+
+def _now():
+    return datetime.datetime.now(datetime.timezone.utc)
+
+
+class _Transaction:
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+
+class MemoryConnection:
+    def __init__(self, db: "MemoryDB"):
+        self.db = db
+        self.staging: List[tuple] = []  # tabla temporal: propia de cada conexión
+
+    def transaction(self):
+        return _Transaction()
+
+    async def _rtt(self):
+        if self.db.rtt_ms:
+            await asyncio.sleep(self.db.rtt_ms / 1000)
+        self.db.round_trips += 1
+
+    async def execute(self, sql: str, *args) -> str:
+        await self._rtt()
+        db = self.db
+
+        if sql.lstrip().startswith("CREATE TABLE IF NOT EXISTS"):
+            return "CREATE TABLE"
+        if sql == core.CREATE_STAGING_SQL:
+            self.staging = []
+            return "CREATE TABLE"
+        if sql == core.MERGE_STAGING_SQL:
+            for row in self.staging:
+                db.upsert(*row)
+            n = len(self.staging)
+            self.staging = []
+            return f"INSERT 0 {n}"
+        if sql == core.UPSERT_SQL:
+            db.upsert(*args)
+            return "INSERT 0 1"
+        if sql == identity.REGISTER_SQL:
+            for clave, id_canonico in zip(*args):
+                db.identity_keys.setdefault(clave, id_canonico)
+            return "INSERT"
+        if sql == identity.UPSERT_PARTS_SQL:
+            for id_canonico, fuente, h, j in zip(*args):
+                db.parts[(id_canonico, fuente)] = (h, j)
+            return "INSERT"
+        if sql == chunking.DELETE_CHUNKS_SQL:
+            for id_estable in args[0]:
+                db.chunks.pop(id_estable, None)
+            return "DELETE"
+        if sql == chunking.DELETE_CHUNK_ROWS_SQL:
+            for id_estable, chunk_no in zip(*args):
+                if id_estable in db.chunks:
+                    db.chunks[id_estable] = [c for c in db.chunks[id_estable] if c[0] != chunk_no]
+            return "DELETE"
+        raise NotImplementedError(f"SQL no soportado por MemoryDB: {sql.strip()[:80]}")
+
+    async def executemany(self, sql: str, args_list) -> None:
+        await self._rtt()
+        for args in args_list:
+            if sql != core.UPSERT_SQL:
+                raise NotImplementedError(f"SQL no soportado por MemoryDB: {sql.strip()[:80]}")
+            self.db.upsert(*args)
+
+    async def fetch(self, sql: str, *args) -> List[Dict[str, Any]]:
+        await self._rtt()
+        db = self.db
+
+        if sql == hash_index.LOAD_SQL:
+            last_id, limit = args
+            ids = sorted(i for i in db.rows if i > last_id)[:limit]
+            return [db.row(i) for i in ids]
+        if sql == hash_index.DELTA_SQL:
+            ts, last_id, limit = args
+            rows = sorted(
+                (r["updated_at"], i) for i, r in db.rows.items() if (r["updated_at"], i) > (ts, last_id)
+            )[:limit]
+            return [db.row(i) for _, i in rows]
+        if sql == identity.LOOKUP_SQL:
+            return [{"clave": k, "id_canonico": db.identity_keys[k]} for k in args[0] if k in db.identity_keys]
+        if sql == identity.LOAD_PARTS_SQL:
+            ids, skip = set(args[0]), set(args[1])
+            return [
+                {"id_canonico": i, "fuente": f, "json_data": j}
+                for (i, f), (_, j) in sorted(db.parts.items()) if i in ids and f not in skip
+            ]
+        if sql == chunking.SELECT_CHUNKS_SQL:
+            return [
+                {"id_estable": i, "chunk_no": n, "chunk_hash": h, "embedding": e}
+                for i in args[0] for (n, h, e) in db.chunks.get(i, [])
+            ]
+        if sql == chunking.CHUNKED_IDS_SQL:
+            return [{"id_estable": i} for i, chunks in db.chunks.items() if chunks]
+        raise NotImplementedError(f"SQL no soportado por MemoryDB: {sql.strip()[:80]}")
+
+    async def fetchval(self, sql: str, *args):
+        rows = await self.fetch(sql, *args)
+        return next(iter(rows[0].values())) if rows else None
+
+    async def copy_records_to_table(self, table: str, records, columns=None, **kwargs):
+        await self._rtt()
+        if table == core.STAGING_TABLE:
+            self.staging.extend(records)
+        elif table == "trabajador_chunks":
+            for id_estable, chunk_no, h, emb in records:
+                self.db.chunks.setdefault(id_estable, []).append((chunk_no, h, emb))
+        else:
+            raise NotImplementedError(f"COPY no soportado por MemoryDB: {table}")
+        return f"COPY {len(records)}"
+
+
+class _Acquire:
+    def __init__(self, db: "MemoryDB"):
+        self.db = db
+
+    async def __aenter__(self) -> MemoryConnection:
+        await self.db._slots.acquire()
+        return MemoryConnection(self.db)
+
+    async def __aexit__(self, *exc):
+        self.db._slots.release()
+        return False
+
+
+class MemoryDB:
+    """Se usa como `pool`: `async with pool.acquire() as conn`."""
+
+    def __init__(self, rtt_ms: float = 0.5, max_size: int = 10):
+        self.rtt_ms = rtt_ms
+        self.rows: Dict[str, Dict[str, Any]] = {}
+        self.chunks: Dict[str, list] = {}
+        self.identity_keys: Dict[str, str] = {}
+        self.parts: Dict[tuple, tuple] = {}
+        self.round_trips = 0
+        self._slots = asyncio.Semaphore(max_size)
+
+    def acquire(self) -> _Acquire:
+        return _Acquire(self)
+
+    def upsert(self, id_estable, hash_completo, json_data, texto_unificado, embedding):
+        self.rows[id_estable] = {
+            "hash_completo": hash_completo,
+            "json_data": json_data,
+            "texto_unificado": texto_unificado,
+            "embedding": embedding,
+            "updated_at": _now(),
+        }
+
+    def row(self, id_estable: str) -> Dict[str, Any]:
+        r = self.rows[id_estable]
+        return {"id_estable": id_estable, "hash_completo": r["hash_completo"], "updated_at": r["updated_at"]}
+
+    async def close(self):
+        pass
+
+    def stats(self) -> Dict[str, Optional[int]]:
+        return {"rows": len(self.rows), "round_trips": self.round_trips}
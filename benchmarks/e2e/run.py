@@ -0,0 +1,352 @@
+# benchmarks/e2e/run.py
+"""
+Benchmark end-to-end del ingestor con sustitutos locales.
+
+Corre el ciclo real (run_ingest_cycle: fuentes -> preparar -> diff -> TEI -> upsert, lo
+mismo que ejecuta el scheduler de ingest_loop por fuente) contra:
+ - un TEI falso (latencia, límites de batch, 413/429/500 inyectables)
+ - un endpoint PostgREST falso (Range / keyset / ETag) con registros sintéticos
+ - una fuente Drive falsa (latencia de listado y de descarga+extracción)
+ - Postgres+pgvector real (--database-url, p.ej. un contenedor local) o MemoryDB
+
+Escenarios: cold (BD vacía), steady (sin cambios), churn (--churn de registros cambia).
+Por escenario: registros/s, latencia por etapa (histogramas Prometheus del propio
+ingestor), TEI, upsert, fetch por fuente y pico de RSS. Salida JSON para comparar
+entre cambios. Los servidores falsos corren en el mismo proceso salvo --tei-url.
+
+Uso: python -m benchmarks.e2e.run [--records 20000] [--drive-files 200] [--churn 0.2]
+     [--db memory | --database-url postgresql://...  --reset] [--output result.json]
+"""
+
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import platform
+import resource
+from typing import Any, Dict, List, Optional
+
+import asyncpg
+from aiohttp import web
+from prometheus_client import REGISTRY
+
+from ingestor import core
+from ingestor.core import configure_core, init_connection, run_ingest_cycle
+from ingestor.hash_index import HashIndex
+from ingestor.schema import ensure_identity_schema, ensure_schema
+from ingestor.identity import IdentityResolver
+from ingestor.utils.projection import load_projector
+from ingestor.tei_client import TEIClient
+from ingestor.sources.impl.generic_api import GenericAPISource
+from ingestor.sources.http_session import close_http_session
+
+from benchmarks.e2e.generator import RecordGenerator
+from benchmarks.e2e.fake_tei import FakeTEI
+from benchmarks.e2e.fake_supabase import FakeSupabase
+from benchmarks.e2e.fake_drive import FakeDriveSource
+from benchmarks.e2e.memory_db import MemoryDB
+
+HISTOGRAMS = {
+    "ingestor_stage_seconds": "stages",
+    "ingestor_source_fetch_seconds": "source_fetch",
+    "ingestor_tei_request_seconds": "tei_request",
+    "ingestor_upsert_seconds": "upsert",
+    "ingestor_batch_process_seconds": "batch",
+}
+
+TRABAJADORES_DDL = """
+CREATE EXTENSION IF NOT EXISTS vector;
+CREATE TABLE IF NOT EXISTS trabajadores (
+    id_estable text PRIMARY KEY,
+    hash_completo text NOT NULL,
+    json_data jsonb NOT NULL,
+    texto_unificado text,
+    embedding vector({dim}),
+    updated_at timestamptz NOT NULL DEFAULT now()
+);
+"""
+
+
+#############################################
+# MÉTRICAS: HISTOGRAMAS Y RSS
+#############################################
+
+def _histograms() -> Dict[tuple, Dict[str, Any]]:
+    out: Dict[tuple, Dict[str, Any]] = {}
+    for metric in REGISTRY.collect():
+        if metric.name not in HISTOGRAMS:
+            continue
+        for s in metric.samples:
+            labels = tuple(sorted((k, v) for k, v in s.labels.items() if k != "le"))
+            d = out.setdefault((metric.name, labels), {"buckets": {}, "sum": 0.0, "count": 0.0})
+            if s.name.endswith("_bucket"):
+                d["buckets"][float(s.labels["le"])] = s.value
+            elif s.name.endswith("_sum"):
+                d["sum"] = s.value
+            elif s.name.endswith("_count"):
+                d["count"] = s.value
+    return out
+
+
+def _quantile(buckets: Dict[float, float], count: float, q: float) -> Optional[float]:
+    """Estimación por interpolación lineal dentro del bucket (como histogram_quantile)."""
+    if count <= 0:
+        return None
+    target = q * count
+    prev_bound, prev_cum = 0.0, 0.0
+    for bound in sorted(buckets):
+        cum = buckets[bound]
+        if cum >= target:
+            if bound == float("inf"):
+                return prev_bound
+            span = cum - prev_cum
+            frac = (target - prev_cum) / span if span else 1.0
+            return prev_bound + (bound - prev_bound) * frac
+        prev_bound, prev_cum = bound, cum
+    return prev_bound
+
+
+def _histogram_delta(before, after) -> Dict[str, Dict[str, Any]]:
+    report: Dict[str, Dict[str, Any]] = {}
+    for key, a in after.items():
+        b = before.get(key, {"buckets": {}, "sum": 0.0, "count": 0.0})
+        count = a["count"] - b["count"]
+        if count <= 0:
+            continue
+        buckets = {le: v - b["buckets"].get(le, 0.0) for le, v in a["buckets"].items()}
+        name, labels = key
+        label = ",".join(v for _, v in labels) or "all"
+        report.setdefault(HISTOGRAMS[name], {})[label] = {
+            "count": int(count),
+            "mean_ms": round((a["sum"] - b["sum"]) / count * 1000, 2),
+            "p50_ms": round(_quantile(buckets, count, 0.5) * 1000, 2),
+            "p95_ms": round(_quantile(buckets, count, 0.95) * 1000, 2),
+            "total_s": round(a["sum"] - b["sum"], 3),
+        }
+    return report
+
+
+def _reset_peak_rss() -> bool:
+    # Linux >= 4.0: escribir 5 en clear_refs reinicia VmHWM (pico de RSS)
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def _peak_rss_mb() -> float:
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+#############################################
+# INFRA LOCAL
+#############################################
+
+async def _serve(app: web.Application):
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = runner.addresses[0][1]
+    return runner, f"http://127.0.0.1:{port}"
+
+
+async def _make_pool(args):
+    if args.database_url is None:
+        return MemoryDB(rtt_ms=args.db_rtt_ms)
+
+    pool = await asyncpg.create_pool(
+        args.database_url,
+        min_size=1,
+        max_size=max(2, args.concurrency * 2),
+        statement_cache_size=0,
+        init=init_connection
+    )
+    async with pool.acquire() as conn:
+        await conn.execute(TRABAJADORES_DDL.format(dim=args.dim))
+        if args.reset:
+            await conn.execute("TRUNCATE trabajadores")
+            await conn.execute("DROP TABLE IF EXISTS trabajador_chunks")
+            await conn.execute("DROP TABLE IF EXISTS identidad_claves, trabajador_fuentes")
+    return pool
+
+
+#############################################
+# ESCENARIOS
+#############################################
+
+async def run_scenario(name: str, pool, tei_client, hash_index, sources, resolver=None,
+                       projector=None) -> Dict[str, Any]:
+    _reset_peak_rss()
+    before = _histograms()
+    start = time.perf_counter()
+
+    # una corrida por fuente en paralelo, como el scheduler cuando vencen todas a la vez
+    results = await asyncio.gather(*(
+        run_ingest_cycle(None, pool, tei_client, hash_index, sources=[s], resolver=resolver, projector=projector)
+        for s in sources
+    ))
+
+    elapsed = time.perf_counter() - start
+    totals = {k: sum(r[k] for r in results) for k in ("records", "changed", "errors")}
+
+    return {
+        "scenario": name,
+        **totals,
+        "seconds": round(elapsed, 3),
+        "records_per_s": round(totals["records"] / elapsed, 1) if elapsed else None,
+        "changed_per_s": round(totals["changed"] / elapsed, 1) if elapsed else None,
+        "peak_rss_mb": _peak_rss_mb(),
+        "latency": _histogram_delta(before, _histograms()),
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    # datos
+    parser.add_argument("--records", type=int, default=20000)
+    parser.add_argument("--record-words", type=int, default=120)
+    parser.add_argument("--nesting", type=int, default=2)
+    parser.add_argument("--drive-files", type=int, default=200)
+    parser.add_argument("--drive-words", type=int, default=1500)
+    parser.add_argument("--churn", type=float, default=0.2)
+    parser.add_argument("--seed", type=int, default=7)
+    # ingestor
+    parser.add_argument("--batch-size", type=int, default=128)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--page-size", type=int, default=1000)
+    parser.add_argument("--upsert-mode", choices=["copy", "row"], default="copy")
+    parser.add_argument("--no-chunking", action="store_true")
+    parser.add_argument("--identity", action="store_true", help="con resolución de identidad entre fuentes")
+    parser.add_argument("--text-templates", default=None,
+                        help="plantillas de texto por fuente (JSON; claves de fuente: api, drive)")
+    parser.add_argument("--text-token-budget", type=int, default=480)
+    parser.add_argument("--dim", type=int, default=384)
+    # TEI falso
+    parser.add_argument("--tei-url", default=None, help="TEI externo (real o fake_tei standalone)")
+    parser.add_argument("--tei-latency-ms", type=float, default=10)
+    parser.add_argument("--tei-per-text-ms", type=float, default=0.5)
+    parser.add_argument("--tei-max-batch", type=int, default=64)
+    parser.add_argument("--tei-max-batch-tokens", type=int, default=16384)
+    parser.add_argument("--tei-error-rate", type=float, default=0.0)
+    parser.add_argument("--tei-overload-rate", type=float, default=0.0)
+    parser.add_argument("--tei-workers", type=int, default=2)
+    # fuentes falsas
+    parser.add_argument("--api-latency-ms", type=float, default=5)
+    parser.add_argument("--drive-list-latency-ms", type=float, default=50)
+    parser.add_argument("--drive-file-latency-ms", type=float, default=30)
+    # BD
+    parser.add_argument("--database-url", default=None, help="Postgres+pgvector; sin esto usa MemoryDB")
+    parser.add_argument("--reset", action="store_true", help="TRUNCATE trabajadores antes de empezar")
+    parser.add_argument("--db-rtt-ms", type=float, default=0.5, help="latencia por llamada de MemoryDB")
+    parser.add_argument("--output", default=None)
+    args = parser.parse_args()
+
+    if args.database_url and not args.reset:
+        print("[WARN] sin --reset el escenario cold parte de lo que ya haya en trabajadores", file=sys.stderr)
+
+    configure_core(
+        database_url=args.database_url or "memory://",
+        tei_url=args.tei_url or "http://fake-tei",
+        batch_size=args.batch_size,
+        concurrency=args.concurrency,
+        tei_max_batch=args.tei_max_batch,
+        expected_embedding_dim=args.dim,
+        upsert_mode=args.upsert_mode,
+        hash_index_refresh_s=0,
+        hash_index_full_reload_s=0,
+        chunking_enabled=not args.no_chunking,
+    )
+
+    runners = []
+    generator = RecordGenerator(seed=args.seed, size=args.record_words, nesting=args.nesting)
+    generator.generate(args.records)
+
+    fake_tei = None
+    tei_url = args.tei_url
+    if tei_url is None:
+        fake_tei = FakeTEI(dim=args.dim, latency_ms=args.tei_latency_ms, per_text_ms=args.tei_per_text_ms,
+                           max_batch=args.tei_max_batch, max_batch_tokens=args.tei_max_batch_tokens,
+                           error_rate=args.tei_error_rate, overload_rate=args.tei_overload_rate,
+                           workers=args.tei_workers, seed=args.seed)
+        runner, tei_url = await _serve(fake_tei.app())
+        runners.append(runner)
+
+    supabase = FakeSupabase(lambda: generator.records, latency_ms=args.api_latency_ms)
+    runner, api_base = await _serve(supabase.app())
+    runners.append(runner)
+
+    api = GenericAPISource(f"{api_base}/rest/v1/trabajadores", pagination="range", page_size=args.page_size)
+    api.key = "api"
+    sources: List[Any] = [api]
+
+    drive = None
+    if args.drive_files:
+        drive = FakeDriveSource(files=args.drive_files, words=args.drive_words,
+                                list_latency_ms=args.drive_list_latency_ms,
+                                file_latency_ms=args.drive_file_latency_ms, seed=args.seed)
+        sources.append(drive)
+
+    tei_client = TEIClient(tei_url, max_batch=args.tei_max_batch, max_batch_tokens=args.tei_max_batch_tokens,
+                           max_in_flight=args.concurrency)
+    pool = await _make_pool(args)
+
+    results = []
+    try:
+        await ensure_schema(pool, args.dim, chunks=core.CHUNKING_ENABLED)
+        hash_index = HashIndex(refresh_interval=0, full_reload_interval=0)
+        await hash_index.load(pool)
+        resolver = None
+        if args.identity:
+            await ensure_identity_schema(pool)
+            resolver = IdentityResolver(["api", "drive"])
+        projector = load_projector(args.text_templates, tei_client.tokens, args.text_token_budget)
+
+        results.append(await run_scenario("cold", pool, tei_client, hash_index, sources, resolver, projector))
+        results.append(await run_scenario("steady", pool, tei_client, hash_index, sources, resolver, projector))
+
+        changed = generator.mutate(args.churn) + (drive.mutate(args.churn) if drive else 0)
+        churn = await run_scenario("churn", pool, tei_client, hash_index, sources, resolver, projector)
+        churn["mutated"] = changed
+        results.append(churn)
+    finally:
+        await tei_client.close()
+        await close_http_session()
+        if args.database_url:
+            await pool.close()
+        for r in runners:
+            await r.cleanup()
+
+    report = {
+        "config": {k: v for k, v in vars(args).items() if k != "database_url"},
+        "db": "postgres" if args.database_url else "memory",
+        "python": platform.python_version(),
+        "cpus": os.cpu_count(),
+        "scenarios": results,
+        "fake_tei": fake_tei.stats() if fake_tei else None,
+        "fake_supabase_requests": supabase.requests,
+    }
+    if isinstance(pool, MemoryDB):
+        report["memory_db"] = pool.stats()
+
+    out = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(out)
+    print(out)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,448 @@
+# ingestor/aggregates.py
+"""
+Agregados por grupo (área, equipo, ubicación, ... tomados de json_data) para
+brechas de habilidades y sugerencia de cursos.
+
+Escritura (ingestor):
+ - por (dimension, grupo) se materializa n, suma y suma de cuadrados del embedding
+   en grupo_agregados; centroide = suma/n, varianza = sumsq/n - centroide²
+ - incremental: en la misma transacción del upsert se leen los valores previos de
+   las filas (FOR UPDATE), se resta su aporte al grupo anterior y se suma el nuevo
+ - rebuild(): recálculo completo (scan por keyset) para corregir deriva numérica
+ - ensure_built(): al arrancar, si grupo_agregados está vacía (recién creada sobre una
+   tabla con datos, o truncada por el swap del re-embed) se reconstruye antes de aplicar
+   deltas; si no, los grupos quedarían con solo lo escrito desde la activación
+
+Lectura (SkillGapScorer):
+ - carga agregados y catálogo de cursos/certificaciones a matrices en memoria
+ - puntúa todos los grupos (o un trabajador / equipo) contra todo el catálogo con
+   un producto de matrices, sin escanear trabajadores
+"""
+
+import os
+import json
+import time
+import asyncio
+import logging
+import argparse
+from typing import Any, Dict, List, Optional, Tuple
+
+import asyncpg
+import numpy as np
+from dotenv import load_dotenv
+
+logger = logging.getLogger("aggregates")
+
+DEFAULT_DIMENSIONS = "area:area|departamento|gerencia,equipo:equipo|team|proyecto,ubicacion:ubicacion|ciudad|sede"
+
+PREVIOUS_SQL = """
+SELECT id_estable, json_data, embedding
+FROM trabajadores
+WHERE id_estable = ANY($1::text[])
+ORDER BY id_estable
+FOR UPDATE
+"""
+
+APPLY_DELTA_SQL = """
+INSERT INTO grupo_agregados AS g (dimension, grupo, n, sum_vec, sumsq_vec, updated_at)
+VALUES ($1, $2, $3, $4, $5, now())
+ON CONFLICT (dimension, grupo) DO UPDATE
+SET n = g.n + EXCLUDED.n,
+    sum_vec = g.sum_vec + EXCLUDED.sum_vec,
+    sumsq_vec = g.sumsq_vec + EXCLUDED.sumsq_vec,
+    updated_at = now();
+"""
+
+NEEDS_REBUILD_SQL = """
+SELECT NOT EXISTS (SELECT 1 FROM grupo_agregados)
+   AND EXISTS (SELECT 1 FROM trabajadores WHERE embedding IS NOT NULL)
+"""
+
+SCAN_SQL = """
+SELECT id_estable, json_data, embedding
+FROM trabajadores
+WHERE id_estable > $1 AND embedding IS NOT NULL
+ORDER BY id_estable
+LIMIT $2
+"""
+
+CATALOG_UPSERT_SQL = """
+INSERT INTO catalogo_cursos (curso_id, nombre, tipo, json_data, embedding, updated_at)
+VALUES ($1, $2, $3, $4::jsonb, $5, now())
+ON CONFLICT (curso_id) DO UPDATE
+SET nombre = EXCLUDED.nombre,
+    tipo = EXCLUDED.tipo,
+    json_data = EXCLUDED.json_data,
+    embedding = EXCLUDED.embedding,
+    updated_at = now();
+"""
+
+
+def parse_dimensions(spec: str) -> Dict[str, List[str]]:
+    """'area:area|departamento,equipo:equipo|team' -> {"area": ["area", "departamento"], ...}"""
+    dims: Dict[str, List[str]] = {}
+    for part in (spec or "").split(","):
+        if not part.strip():
+            continue
+        name, _, keys = part.partition(":")
+        dims[name.strip()] = [k.strip() for k in (keys or name).split("|") if k.strip()]
+    return dims
+
+
+def _as_dict(json_data: Any) -> Dict[str, Any]:
+    if isinstance(json_data, str):
+        return json.loads(json_data)
+    return json_data or {}
+
+
+def _lookup(record: Dict[str, Any], path: str) -> Any:
+    # claves anidadas con punto ("perfil.area"); comparación sin mayúsculas en cada nivel
+    value: Any = record
+    for key in path.split("."):
+        if not isinstance(value, dict):
+            return None
+        if key in value:
+            value = value[key]
+            continue
+        lowered = key.lower()
+        value = next((v for k, v in value.items() if isinstance(k, str) and k.lower() == lowered), None)
+    return value
+
+
+#############################################
+# ESCRITURA: AGREGADOS INCREMENTALES
+#############################################
+
+class GroupAggregates:
+    def __init__(self, dimensions: Optional[Dict[str, List[str]]] = None, page_size: int = 5000):
+        self.dimensions = dimensions or parse_dimensions(DEFAULT_DIMENSIONS)
+        self.page_size = page_size
+
+    def group_keys(self, json_data: Any) -> List[Tuple[str, str]]:
+        record = _as_dict(json_data)
+        keys = []
+        for dimension, paths in self.dimensions.items():
+            for path in paths:
+                value = _lookup(record, path)
+                if value not in (None, "") and not isinstance(value, (dict, list)):
+                    keys.append((dimension, str(value).strip().lower()))
+                    break
+        return keys
+
+    async def fetch_previous(self, conn: asyncpg.Connection, batch_items: List[Dict[str, Any]]) -> Dict[str, tuple]:
+        """Grupos y embedding vigentes antes del upsert (bloquea las filas hasta el commit)."""
+        # filas bloqueadas en orden de id: dos writers con ids en común no se cruzan (deadlock)
+        ids = sorted({it["id_estable"] for it in batch_items})
+        rows = await conn.fetch(PREVIOUS_SQL, ids)
+        return {
+            r["id_estable"]: (self.group_keys(r["json_data"]), r["embedding"])
+            for r in rows if r["embedding"] is not None
+        }
+
+    def _deltas(self, batch_items: List[Dict[str, Any]], embeddings: List[Any],
+                previous: Dict[str, tuple]) -> Dict[Tuple[str, str], list]:
+        # si un id se repite en el batch, gana la última versión (igual que el upsert)
+        latest: Dict[str, tuple] = {}
+        for it, emb in zip(batch_items, embeddings):
+            latest[it["id_estable"]] = (it["json_data"], emb)
+
+        deltas: Dict[Tuple[str, str], list] = {}
+
+        def add(key, sign, vec):
+            d = deltas.get(key)
+            if d is None:
+                d = deltas[key] = [0, np.zeros_like(vec), np.zeros_like(vec)]
+            d[0] += sign
+            d[1] += sign * vec
+            d[2] += sign * vec * vec
+
+        for id_estable, (json_data, emb) in latest.items():
+            vec = np.asarray(emb, dtype=np.float64)
+            old = previous.get(id_estable)
+            if old is not None:
+                old_vec = np.asarray(old[1], dtype=np.float64)
+                for key in old[0]:
+                    add(key, -1, old_vec)
+            for key in self.group_keys(json_data):
+                add(key, 1, vec)
+
+        return deltas
+
+    async def apply(self, conn: asyncpg.Connection, batch_items: List[Dict[str, Any]],
+                    embeddings: List[Any], previous: Dict[str, tuple]):
+        deltas = self._deltas(batch_items, embeddings, previous)
+        # orden fijo de claves: dos writers concurrentes bloquean los grupos en el mismo orden
+        args = [
+            (dimension, grupo, n, s.astype(np.float32), sq.astype(np.float32))
+            for (dimension, grupo), (n, s, sq) in sorted(deltas.items())
+            if n or np.any(s)
+        ]
+        if args:
+            await conn.executemany(APPLY_DELTA_SQL, args)
+
+    async def ensure_built(self, pool: asyncpg.Pool) -> bool:
+        """Reconstruye si grupo_agregados está vacía y trabajadores no. True si reconstruyó."""
+        async with pool.acquire() as conn:
+            needed = await conn.fetchval(NEEDS_REBUILD_SQL)
+        if not needed:
+            return False
+        logger.info(json.dumps({"event": "aggregates_empty", "action": "rebuild"}))
+        await self.rebuild(pool)
+        return True
+
+    async def rebuild(self, pool: asyncpg.Pool):
+        """Recalcula todos los agregados con un scan por keyset y los reemplaza en una transacción."""
+        start = time.time()
+        sums: Dict[Tuple[str, str], list] = {}
+        last_id = ""
+        rows = 0
+
+        while True:
+            async with pool.acquire() as conn:
+                page = await conn.fetch(SCAN_SQL, last_id, self.page_size)
+            if not page:
+                break
+            for r in page:
+                vec = np.asarray(r["embedding"], dtype=np.float64)
+                for key in self.group_keys(r["json_data"]):
+                    acc = sums.get(key)
+                    if acc is None:
+                        acc = sums[key] = [0, np.zeros_like(vec), np.zeros_like(vec)]
+                    acc[0] += 1
+                    acc[1] += vec
+                    acc[2] += vec * vec
+            rows += len(page)
+            last_id = page[-1]["id_estable"]
+
+        async with pool.acquire() as conn:
+            async with conn.transaction():
+                await conn.execute("DELETE FROM grupo_agregados")
+                await conn.copy_records_to_table(
+                    "grupo_agregados",
+                    records=[
+                        (dimension, grupo, n, s.astype(np.float32), sq.astype(np.float32))
+                        for (dimension, grupo), (n, s, sq) in sorted(sums.items())
+                    ],
+                    columns=("dimension", "grupo", "n", "sum_vec", "sumsq_vec"),
+                )
+
+        logger.info(json.dumps({
+            "event": "aggregates_rebuilt",
+            "rows": rows,
+            "groups": len(sums),
+            "time_seconds": round(time.time() - start, 2)
+        }))
+
+
+#############################################
+# CATÁLOGO DE CURSOS / CERTIFICACIONES
+#############################################
+
+async def sync_course_catalog(pool: asyncpg.Pool, tei_client, courses: List[Dict[str, Any]]):
+    """Embebe y guarda el catálogo. courses: [{"id", "nombre", "descripcion"?, "tipo"?, ...}]"""
+    texts = [" ".join(filter(None, [c.get("nombre"), c.get("descripcion")])) or c["id"] for c in courses]
+    embeddings = await tei_client.embed_batch(None, texts)
+
+    async with pool.acquire() as conn:
+        await conn.executemany(CATALOG_UPSERT_SQL, [
+            (str(c["id"]), c.get("nombre") or str(c["id"]), c.get("tipo") or "curso",
+             json.dumps(c, ensure_ascii=False), np.asarray(emb, dtype=np.float32))
+            for c, emb in zip(courses, embeddings)
+        ])
+
+    logger.info(json.dumps({"event": "course_catalog_synced", "courses": len(courses)}))
+
+
+#############################################
+# LECTURA: PUNTAJES VECTORIZADOS
+#############################################
+
+def _unit_rows(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+class SkillGapScorer:
+    def __init__(self, pool: asyncpg.Pool, refresh_interval: float = 300,
+                 dimensions: Optional[Dict[str, List[str]]] = None):
+        self.pool = pool
+        self.refresh_interval = refresh_interval
+        self.resolver = GroupAggregates(dimensions)
+
+        # por dimensión: nombres de grupo, n, centroides (G x d), varianzas (G x d)
+        self.groups: Dict[str, Dict[str, Any]] = {}
+        self.course_ids: List[str] = []
+        self.course_names: List[str] = []
+        self.courses: np.ndarray = np.zeros((0, 0), dtype=np.float32)
+        self._last_load = 0.0
+        self._lock = asyncio.Lock()
+
+    async def load(self):
+        async with self.pool.acquire() as conn:
+            agg = await conn.fetch(
+                "SELECT dimension, grupo, n, sum_vec, sumsq_vec FROM grupo_agregados "
+                "WHERE n > 0 ORDER BY dimension, grupo"
+            )
+            catalog = await conn.fetch("SELECT curso_id, nombre, embedding FROM catalogo_cursos ORDER BY curso_id")
+
+        groups: Dict[str, Dict[str, Any]] = {}
+        by_dim: Dict[str, list] = {}
+        for r in agg:
+            by_dim.setdefault(r["dimension"], []).append(r)
+        for dimension, rows in by_dim.items():
+            n = np.array([r["n"] for r in rows], dtype=np.float64)
+            sums = np.stack([np.asarray(r["sum_vec"], dtype=np.float64) for r in rows])
+            sumsq = np.stack([np.asarray(r["sumsq_vec"], dtype=np.float64) for r in rows])
+            means = sums / n[:, None]
+            groups[dimension] = {
+                "names": [r["grupo"] for r in rows],
+                "index": {r["grupo"]: i for i, r in enumerate(rows)},
+                "n": n,
+                "means": means.astype(np.float32),
+                "vars": np.clip(sumsq / n[:, None] - means * means, 0, None).astype(np.float32),
+                # centroide global de la dimensión (ponderado por n)
+                "global": (sums.sum(axis=0) / n.sum()).astype(np.float32),
+            }
+
+        self.groups = groups
+        self.course_ids = [r["curso_id"] for r in catalog]
+        self.course_names = [r["nombre"] for r in catalog]
+        self.courses = (
+            _unit_rows(np.stack([np.asarray(r["embedding"], dtype=np.float32) for r in catalog]))
+            if catalog else np.zeros((0, 0), dtype=np.float32)
+        )
+        self._last_load = time.monotonic()
+
+    async def maybe_refresh(self):
+        if self.refresh_interval and time.monotonic() - self._last_load < self.refresh_interval:
+            return
+        async with self._lock:
+            if not self.refresh_interval or time.monotonic() - self._last_load >= self.refresh_interval:
+                await self.load()
+
+    def _ranked(self, scores: np.ndarray, k: int, extra: Optional[Dict[str, np.ndarray]] = None) -> List[Dict[str, Any]]:
+        k = min(k, len(scores))
+        if k <= 0:
+            return []
+        top = np.argpartition(scores, -k)[-k:]
+        top = top[np.argsort(-scores[top])]
+        return [
+            {
+                "curso_id": self.course_ids[i],
+                "nombre": self.course_names[i],
+                "score": round(float(scores[i]), 6),
+                **{name: round(float(values[i]), 6) for name, values in (extra or {}).items()},
+            }
+            for i in top
+        ]
+
+    def score_groups(self, dimension: str, reference: Optional[str] = None) -> Dict[str, np.ndarray]:
+        """
+        Todos los grupos de una dimensión contra todo el catálogo (matrices G x cursos):
+          relevance: afinidad del centroide del grupo con cada curso
+          gap:       afinidad de la referencia (global o grupo) - afinidad del grupo
+          spread:    desviación estándar dentro del grupo de la proyección sobre el curso
+        """
+        g = self.groups[dimension]
+        ref = g["global"] if reference is None else g["means"][g["index"][reference]]
+
+        relevance = g["means"] @ self.courses.T
+        gap = (self.courses @ ref)[None, :] - relevance
+        spread = np.sqrt(g["vars"] @ (self.courses * self.courses).T)
+        return {"groups": g["names"], "relevance": relevance, "gap": gap, "spread": spread}
+
+    def recommend_for_group(self, dimension: str, grupo: str, k: int = 10,
+                            reference: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Cursos con mayor brecha del grupo respecto a la referencia."""
+        scored = self.score_groups(dimension, reference)
+        i = self.groups[dimension]["index"][grupo]
+        return self._ranked(scored["gap"][i], k, {
+            "relevance": scored["relevance"][i],
+            "spread": scored["spread"][i],
+        })
+
+    def score_vectors(self, vectors: np.ndarray, centroid: np.ndarray) -> Dict[str, np.ndarray]:
+        """N trabajadores (N x d) contra el catálogo y el centroide de su grupo en una sola operación."""
+        relevance = _unit_rows(np.asarray(vectors, dtype=np.float32)) @ self.courses.T
+        gap = (self.courses @ centroid)[None, :] - relevance
+        return {"relevance": relevance, "gap": gap}
+
+    async def recommend_for_workers(self, ids: List[str], dimension: str, k: int = 10) -> Dict[str, List[Dict[str, Any]]]:
+        """
+        Cursos para uno o más trabajadores (o un equipo completo): brecha entre lo que
+        su grupo domina y lo que domina cada trabajador. Lectura por PK, sin scans.
+        """
+        async with self.pool.acquire() as conn:
+            rows = await conn.fetch(
+                "SELECT id_estable, json_data, embedding FROM trabajadores "
+                "WHERE id_estable = ANY($1::text[]) AND embedding IS NOT NULL",
+                ids
+            )
+        if not rows or not len(self.courses):
+            return {}
+
+        g = self.groups.get(dimension)
+        centroids = []
+        for r in rows:
+            grupo = dict(self.resolver.group_keys(r["json_data"])).get(dimension)
+            if g is not None and grupo in g["index"]:
+                centroids.append(g["means"][g["index"][grupo]])
+            else:
+                centroids.append(g["global"] if g is not None else np.zeros(self.courses.shape[1], dtype=np.float32))
+
+        vectors = _unit_rows(np.stack([np.asarray(r["embedding"], dtype=np.float32) for r in rows]))
+        relevance = vectors @ self.courses.T
+        gap = np.stack(centroids) @ self.courses.T - relevance
+
+        return {
+            r["id_estable"]: self._ranked(gap[i], k, {"relevance": relevance[i]})
+            for i, r in enumerate(rows)
+        }
+
+
+async def main():
+    from ingestor.core import init_connection
+    from ingestor.schema import ensure_schema
+    from ingestor.tei_client import TEIClient
+
+    load_dotenv()
+    logging.basicConfig(
+        level=logging.INFO,
+        format='{"timestamp":"%(asctime)s","level":"%(levelname)s","message":%(message)s}'
+    )
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rebuild", action="store_true", help="recalcula grupo_agregados desde trabajadores")
+    parser.add_argument("--catalog", help="JSON con la lista de cursos/certificaciones a embeber")
+    args = parser.parse_args()
+
+    pool = await asyncpg.create_pool(
+        os.environ["DATABASE_URL"],
+        min_size=1,
+        max_size=2,
+        statement_cache_size=0,
+        max_cached_statement_lifetime=0,
+        max_cacheable_statement_size=0,
+        init=init_connection
+    )
+    try:
+        await ensure_schema(pool, int(os.getenv("EXPECTED_EMBEDDING_DIM", "384")), chunks=False, aggregates=True)
+
+        if args.catalog:
+            with open(args.catalog, encoding="utf-8") as f:
+                courses = json.load(f)
+            tei_client = TEIClient(os.environ["TEI_URL"], timeout=int(os.getenv("TEI_TIMEOUT", "60")))
+            try:
+                await sync_course_catalog(pool, tei_client, courses)
+            finally:
+                await tei_client.close()
+
+        if args.rebuild:
+            await GroupAggregates(parse_dimensions(os.getenv("AGGREGATE_DIMENSIONS", DEFAULT_DIMENSIONS))).rebuild(pool)
+    finally:
+        await pool.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,177 @@
+# ingestor/chunking.py
+"""
+Embeddings multi-vector para documentos largos.
+ - el texto se corta en pasajes acotados por tokens, con solapamiento
+ - cada pasaje se guarda en trabajador_chunks con su hash: al editar un documento
+   solo se re-embeben los pasajes cuyo hash cambió
+ - el vector por registro (trabajadores.embedding) es el promedio normalizado de sus chunks
+Los textos que caben en un solo pasaje siguen el camino normal (un vector, sin chunks).
+
+Escritura: solo se tocan los chunks que cambiaron (por chunk_no) y los que sobran; un
+registro de un solo pasaje solo genera DELETE si antes tenía chunks (ChunkedIds).
+"""
+
+import time
+import asyncio
+import hashlib
+from typing import Any, Dict, List, Optional, Sequence, Set, Tuple
+
+import asyncpg
+import numpy as np
+
+from ingestor.utils.tokens import TokenEstimator
+
+CHUNK_COLUMNS = ("id_estable", "chunk_no", "chunk_hash", "embedding")
+
+SELECT_CHUNKS_SQL = """
+SELECT id_estable, chunk_no, chunk_hash, embedding
+FROM trabajador_chunks
+WHERE id_estable = ANY($1)
+"""
+
+DELETE_CHUNKS_SQL = "DELETE FROM trabajador_chunks WHERE id_estable = ANY($1)"
+
+DELETE_CHUNK_ROWS_SQL = """
+DELETE FROM trabajador_chunks c
+USING unnest($1::text[], $2::int[]) AS d(id_estable, chunk_no)
+WHERE c.id_estable = d.id_estable AND c.chunk_no = d.chunk_no
+"""
+
+CHUNKED_IDS_SQL = "SELECT DISTINCT id_estable FROM trabajador_chunks"
+
+
+def chunk_text(text: str, estimator: TokenEstimator, max_tokens: int = 480,
+               overlap_tokens: int = 64) -> List[str]:
+    spans = estimator.spans(text)
+    if not spans:
+        return [text]
+
+    passages = []
+    start = 0
+    n = len(spans)
+
+    while start < n:
+        # avanzar hasta llenar el presupuesto de tokens del pasaje
+        end = start
+        tokens = 0.0
+        while end < n and (end == start or tokens + spans[end][2] <= max_tokens):
+            tokens += spans[end][2]
+            end += 1
+
+        passages.append(text[spans[start][0]:spans[end - 1][1]])
+        if end >= n:
+            break
+
+        # retroceder `overlap_tokens` para el siguiente pasaje (siempre avanzando al menos 1)
+        back = end
+        overlap = 0.0
+        while back > start + 1 and overlap + spans[back - 1][2] <= overlap_tokens:
+            overlap += spans[back - 1][2]
+            back -= 1
+        start = back
+
+    return passages
+
+
+def chunk_hash(passage: str) -> str:
+    return hashlib.blake2b(passage.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def mean_pool(vectors: Sequence[np.ndarray]) -> np.ndarray:
+    pooled = np.mean(np.stack(vectors), axis=0, dtype=np.float32)
+    norm = float(np.linalg.norm(pooled))
+    return pooled / norm if norm > 0 else pooled
+
+
+async def load_chunk_embeddings(conn: asyncpg.Connection,
+                                ids: List[str]) -> Dict[str, Dict[int, Tuple[str, np.ndarray]]]:
+    """{id_estable: {chunk_no: (chunk_hash, embedding)}} de los chunks ya guardados."""
+    if not ids:
+        return {}
+    rows = await conn.fetch(SELECT_CHUNKS_SQL, ids)
+    out: Dict[str, Dict[int, Tuple[str, np.ndarray]]] = {}
+    for r in rows:
+        out.setdefault(r["id_estable"], {})[r["chunk_no"]] = (r["chunk_hash"], r["embedding"])
+    return out
+
+
+class ChunkedIds:
+    """
+    ids con filas en trabajador_chunks. Se recarga cada refresh_interval (chunks escritos
+    por otras réplicas) y se mantiene con cada escritura confirmada de este proceso.
+    """
+
+    def __init__(self, refresh_interval: float = 300):
+        self.refresh_interval = refresh_interval
+        self._ids: Set[str] = set()
+        self._loaded_at: Optional[float] = None
+        self._lock = asyncio.Lock()
+
+    def __contains__(self, id_estable: str) -> bool:
+        return id_estable in self._ids
+
+    async def maybe_refresh(self, pool: asyncpg.Pool):
+        if self._loaded_at is not None and time.monotonic() - self._loaded_at < self.refresh_interval:
+            return
+        async with self._lock:
+            if self._loaded_at is not None and time.monotonic() - self._loaded_at < self.refresh_interval:
+                return
+            async with pool.acquire() as conn:
+                rows = await conn.fetch(CHUNKED_IDS_SQL)
+            self._ids = {r["id_estable"] for r in rows}
+            self._loaded_at = time.monotonic()
+
+    def update(self, batch_items: List[Dict[str, Any]]):
+        """Registrar lo escrito (llamar tras el commit)."""
+        for it in batch_items:
+            if it["id_estable"] is None:
+                continue
+            if it.get("chunks"):
+                self._ids.add(it["id_estable"])
+            else:
+                self._ids.discard(it["id_estable"])
+
+
+async def write_chunks(conn: asyncpg.Connection, batch_items: List[Dict[str, Any]],
+                       chunked: Optional[ChunkedIds] = None):
+    """
+    Actualiza los chunks de los registros del batch sin reescribir los que no cambiaron:
+     - registros con `chunks`: DELETE + COPY solo de los chunk_no cuyo hash cambió (contra
+       `chunks_stored`, cargado al embeber) y DELETE de los chunk_no que sobran
+     - registros de un solo pasaje: DELETE solo si tenían chunks (sin `chunked`: siempre)
+    """
+    latest: Dict[str, Dict[str, Any]] = {}
+    for it in batch_items:
+        if it["id_estable"] is not None:
+            latest[it["id_estable"]] = it  # gana la última versión (igual que el upsert)
+
+    gone: List[str] = []
+    del_ids: List[str] = []
+    del_nos: List[int] = []
+    records = []
+    for id_estable, it in latest.items():
+        chunks = it.get("chunks") or []
+        if not chunks:
+            if chunked is None or id_estable in chunked:
+                gone.append(id_estable)
+            continue
+        stored = it.get("chunks_stored") or {}
+        for c in chunks:
+            old = stored.get(c["chunk_no"])
+            if old == c["chunk_hash"]:
+                continue
+            if old is not None:
+                del_ids.append(id_estable)
+                del_nos.append(c["chunk_no"])
+            records.append((id_estable, c["chunk_no"], c["chunk_hash"], c["embedding"]))
+        for n in stored:
+            if n >= len(chunks):
+                del_ids.append(id_estable)
+                del_nos.append(n)
+
+    if gone:
+        await conn.execute(DELETE_CHUNKS_SQL, gone)
+    if del_ids:
+        await conn.execute(DELETE_CHUNK_ROWS_SQL, del_ids, del_nos)
+    if records:
+        await conn.copy_records_to_table("trabajador_chunks", records=records, columns=CHUNK_COLUMNS)
@@ -3,11 +3,32 @@
 Core del ingestor: batching, generación de embeddings via TEI, y upsert a PostgreSQL (pgvector).
 Se corrigieron/optimizron:
  - create_pool con statement_cache_size=0 (pgbouncer)
- - batching correcto: recorrer todo `data` en chunks de BATCH_SIZE
- - check previo en BD para evitar regenerar embeddings cuando hash_completo coincide
+ - pipeline en streaming con colas acotadas: fuentes -> preparar -> diff -> embed -> write
+ - batching correcto: el diff agrupa los registros cambiados en batches de BATCH_SIZE
+ - check previo contra un índice en memoria (HashIndex) para evitar regenerar embeddings
+   cuando hash_completo coincide, sin consultar la BD en cada chunk
  - batch de upsert reducido a los items realmente necesarios
  - logging mejorado
- - semáforo y release robusto
+ - concurrencia acotada por etapa (embed/write) en lugar de tareas sueltas con semáforo
+ - upsert bulk: COPY a tabla temporal + un solo merge (UPSERT_MODE=copy|row)
+ - embeddings float32 de punta a punta con codec binario de pgvector
+ - scheduler por fuente (intervalo + jitter + backoff si no hay cambios) con disparos
+   inmediatos por webhook HTTP o LISTEN/NOTIFY, en lugar de un while True sin pausa
+ - documentos largos: chunks con solapamiento en trabajador_chunks, solo se re-embeben
+   los chunks cuyo hash cambió y el vector del registro es el promedio de sus chunks
+ - snapshot local opcional de embeddings (mmap) actualizado tras cada upsert
+ - agregados por grupo (área/equipo/ubicación) actualizados en la misma transacción del upsert
+ - métricas Prometheus por etapa, por fuente, por sub-batch de TEI y por upsert
+ - cola de trabajo durable (Redis Streams) entre el diff y el embed/write: ack tras el
+   upsert, reclamo de pendientes y dead letters; una caída de TEI/BD solo reprocesa lo pendiente
+ - resolución de identidad entre fuentes (IDENTITY_RESOLUTION): claves normalizadas -> id
+   canónico persistente y mezcla campo a campo; una persona = un texto y un embedding
+ - versión del modelo de embeddings registrada en embedding_models: durante una migración
+   (jobs/reembed.py) la ingesta sigue; tras el swap, un ingestor con el modelo viejo no escribe
+ - texto unificado por plantilla de fuente (TEXT_TEMPLATES_FILE): campos elegidos, en orden,
+   con etiquetas y topes, dentro de un presupuesto de tokens; el resto usa el texto universal
+ - modo multi-worker (SHARD_COUNT > 1): shards por hash de id_estable con leases en Redis,
+   una réplica por fuente y un stream de trabajo por shard
 """
 
 import asyncio
@@ -16,13 +37,33 @@ import asyncpg
 import json
 import time
 import logging
-from typing import List, Any, Dict
-
-from ingestor.tei_client import TEIClient
-from ingestor.utils.identifier import extract_identifier_field
-from ingestor.utils.text_unifier import build_texto_unificado
-from ingestor.utils.hashing import compute_hash_completo, compute_hash_estable
-from ingestor.sources.merge_sources import fetch_all_sources
+import numpy as np
+from aiohttp import web
+from typing import List, Any, Dict, Optional
+
+from ingestor.tei_client import TEIClient, TEIOverloadError
+from ingestor.hash_index import HashIndex
+from ingestor.vector_snapshot import VectorSnapshotWriter
+from ingestor.aggregates import GroupAggregates, parse_dimensions
+from ingestor.sharding import ShardLeaseManager, SourceLease, default_worker_id
+from ingestor.work_queue import Message, SingleShard, WorkQueue
+from ingestor.utils.redis_client import get_redis
+from ingestor.monitoring.metrics import (
+    BATCH_PROCESS_SECONDS, BATCHES_PROCESSED, CYCLE_SECONDS, RECORDS_PROCESSED, RECORDS_SKIPPED,
+    SKIP_RATIO, UPSERT_SECONDS, WORK_QUEUE_LENGTH, WORK_QUEUE_MESSAGES, WORK_QUEUE_PENDING
+)
+from ingestor.utils.pgvector_codec import register_vector_codec, to_float32_vector
+from ingestor.utils.preprocess import preprocess_record
+from ingestor.utils.projection import TextProjector, load_projector
+from ingestor.pipeline import Pipeline
+from ingestor.schema import ensure_embedding_models_schema, ensure_identity_schema, ensure_schema
+from ingestor.identity import IdentityResolver
+from ingestor.model_registry import ModelVersionGate, ModelVersionMismatch
+from ingestor.chunking import ChunkedIds, chunk_hash, chunk_text, load_chunk_embeddings, mean_pool, write_chunks
+from ingestor.scheduler import Scheduler, SourceSchedule, add_trigger_routes, listen_pg_triggers
+from ingestor.sources.merge_sources import (
+    Deduplicator, SourceOwnership, commit_sources, exact_key, get_sources, schedule_config, stream_sources
+)
 
 logger = logging.getLogger("ingestor")
 logger.setLevel(logging.INFO)
@@ -35,6 +76,42 @@ CONCURRENCY: int
 TEI_MAX_BATCH: int
 TEI_TIMEOUT: int
 EXPECTED_EMBEDDING_DIM: int = 384  # intfloat/e5-small -> 384
+UPSERT_MODE: str = "copy"  # "copy" (COPY + merge) | "row" (un INSERT por registro)
+HASH_INDEX_REFRESH_S: float = 300  # re-sync por watermark de updated_at (0 = desactivado)
+HASH_INDEX_FULL_RELOAD_S: float = 3600  # recarga completa del índice (0 = desactivado)
+PIPELINE_QUEUE_SIZE: int = 4  # elementos (páginas/batches) en vuelo entre etapas
+SOURCE_CONCURRENCY: int = 4
+PREPARE_CONCURRENCY: int = 1
+EMBED_CONCURRENCY: int = 4
+WRITE_CONCURRENCY: int = 2
+CHUNKING_ENABLED: bool = True
+CHUNK_MAX_TOKENS: int = 480  # < 512 de e5-small (deja margen a la heurística)
+CHUNK_OVERLAP_TOKENS: int = 64
+TRIGGER_HTTP_PORT: int = 0  # 0 = sin webhook
+TRIGGER_TOKEN: Optional[str] = None
+TRIGGER_PG_CHANNEL: Optional[str] = None  # None = sin LISTEN/NOTIFY
+TRIGGER_PG_DSN: Optional[str] = None  # conexión directa (no pgbouncer); por defecto DATABASE_URL
+VECTOR_SNAPSHOT_DIR: Optional[str] = None  # None = sin snapshot local de embeddings
+AGGREGATES_ENABLED: bool = False
+AGGREGATE_DIMENSIONS: Optional[str] = None  # "area:area|departamento,equipo:equipo|team,..."
+WORK_QUEUE_ENABLED: bool = False  # implícito con SHARD_COUNT > 1
+WORK_QUEUE_CLAIM_IDLE_S: float = 60  # pendientes sin ack más de esto se reclaman
+WORK_QUEUE_MAX_FAILURES: int = 3  # fallos propios del registro antes de ir a dead letters
+IDENTITY_RESOLUTION: bool = False
+IDENTITY_SOURCE_PRIORITY: Optional[str] = None  # "api1,api2,drive": orden de la mezcla campo a campo
+IDENTITY_CACHE_SIZE: int = 200_000  # claves de identidad en la LRU en memoria
+EMBEDDING_MODEL_VERSION: Optional[str] = None  # None = sin control de versión del modelo
+EMBEDDING_MODEL_ID: Optional[str] = None
+TEXT_TEMPLATES_FILE: Optional[str] = None  # JSON con plantillas por fuente (None = texto universal)
+TEXT_TOKEN_BUDGET: int = 480  # presupuesto por texto de las plantillas que no fijan el suyo (0 = sin límite)
+SHARD_COUNT: int = 0  # 0/1 = un solo worker (sin Redis)
+WORKER_ID: Optional[str] = None  # por defecto hostname-pid
+SHARD_LEASE_TTL_S: float = 30
+SOURCE_LEASE_TTL_S: float = 120
+SOURCE_OWNER_TTL_S: float = 86400  # sin verlo en su fuente dueña este tiempo, otra fuente puede tomar el id
+
+# ids con chunks guardados: un registro que pasa a un solo pasaje solo borra si los tenía
+CHUNKED_IDS = ChunkedIds()
 
 
 #############################################
@@ -49,8 +126,53 @@ def configure_core(
     tei_max_batch: int = 8,
     tei_timeout: int = 30,
     expected_embedding_dim: int = 384,
+    upsert_mode: str = "copy",
+    hash_index_refresh_s: float = 300,
+    hash_index_full_reload_s: float = 3600,
+    pipeline_queue_size: int = 4,
+    source_concurrency: int = 4,
+    prepare_concurrency: int = 1,
+    embed_concurrency: Optional[int] = None,
+    write_concurrency: int = 2,
+    chunking_enabled: bool = True,
+    chunk_max_tokens: int = 480,
+    chunk_overlap_tokens: int = 64,
+    trigger_http_port: int = 0,
+    trigger_token: Optional[str] = None,
+    trigger_pg_channel: Optional[str] = None,
+    trigger_pg_dsn: Optional[str] = None,
+    vector_snapshot_dir: Optional[str] = None,
+    aggregates_enabled: bool = False,
+    aggregate_dimensions: Optional[str] = None,
+    identity_resolution: bool = False,
+    identity_source_priority: Optional[str] = None,
+    identity_cache_size: int = 200_000,
+    embedding_model_version: Optional[str] = None,
+    embedding_model_id: Optional[str] = None,
+    text_templates_file: Optional[str] = None,
+    text_token_budget: int = 480,
+    work_queue_enabled: bool = False,
+    work_queue_claim_idle_s: float = 60,
+    work_queue_max_failures: int = 3,
+    shard_count: int = 0,
+    worker_id: Optional[str] = None,
+    shard_lease_ttl_s: float = 30,
+    source_lease_ttl_s: float = 120,
+    source_owner_ttl_s: float = 86400,
 ):
     global DATABASE_URL, TEI_URL, BATCH_SIZE, CONCURRENCY, TEI_MAX_BATCH, TEI_TIMEOUT, EXPECTED_EMBEDDING_DIM
+    global UPSERT_MODE, HASH_INDEX_REFRESH_S, HASH_INDEX_FULL_RELOAD_S
+    global PIPELINE_QUEUE_SIZE, SOURCE_CONCURRENCY, PREPARE_CONCURRENCY, EMBED_CONCURRENCY, WRITE_CONCURRENCY
+    global CHUNKING_ENABLED, CHUNK_MAX_TOKENS, CHUNK_OVERLAP_TOKENS
+    global TRIGGER_HTTP_PORT, TRIGGER_TOKEN, TRIGGER_PG_CHANNEL, TRIGGER_PG_DSN
+    global VECTOR_SNAPSHOT_DIR, AGGREGATES_ENABLED, AGGREGATE_DIMENSIONS
+    global IDENTITY_RESOLUTION, IDENTITY_SOURCE_PRIORITY, IDENTITY_CACHE_SIZE, EMBEDDING_MODEL_VERSION, EMBEDDING_MODEL_ID
+    global TEXT_TEMPLATES_FILE, TEXT_TOKEN_BUDGET
+    global WORK_QUEUE_ENABLED, WORK_QUEUE_CLAIM_IDLE_S, WORK_QUEUE_MAX_FAILURES
+    global SHARD_COUNT, WORKER_ID, SHARD_LEASE_TTL_S, SOURCE_LEASE_TTL_S, SOURCE_OWNER_TTL_S
+
+    if upsert_mode not in ("copy", "row"):
+        raise ValueError(f"upsert_mode inválido: {upsert_mode} (usar 'copy' o 'row')")
 
     DATABASE_URL = database_url
     TEI_URL = tei_url
@@ -59,6 +181,39 @@ def configure_core(
     TEI_MAX_BATCH = tei_max_batch
     TEI_TIMEOUT = tei_timeout
     EXPECTED_EMBEDDING_DIM = expected_embedding_dim
+    UPSERT_MODE = upsert_mode
+    HASH_INDEX_REFRESH_S = hash_index_refresh_s
+    HASH_INDEX_FULL_RELOAD_S = hash_index_full_reload_s
+    PIPELINE_QUEUE_SIZE = pipeline_queue_size
+    SOURCE_CONCURRENCY = source_concurrency
+    PREPARE_CONCURRENCY = prepare_concurrency
+    EMBED_CONCURRENCY = embed_concurrency or concurrency
+    WRITE_CONCURRENCY = write_concurrency
+    CHUNKING_ENABLED = chunking_enabled
+    CHUNK_MAX_TOKENS = chunk_max_tokens
+    CHUNK_OVERLAP_TOKENS = chunk_overlap_tokens
+    TRIGGER_HTTP_PORT = trigger_http_port
+    TRIGGER_TOKEN = trigger_token
+    TRIGGER_PG_CHANNEL = trigger_pg_channel
+    TRIGGER_PG_DSN = trigger_pg_dsn
+    VECTOR_SNAPSHOT_DIR = vector_snapshot_dir
+    AGGREGATES_ENABLED = aggregates_enabled
+    AGGREGATE_DIMENSIONS = aggregate_dimensions
+    IDENTITY_RESOLUTION = identity_resolution
+    IDENTITY_SOURCE_PRIORITY = identity_source_priority
+    IDENTITY_CACHE_SIZE = identity_cache_size
+    EMBEDDING_MODEL_VERSION = embedding_model_version
+    EMBEDDING_MODEL_ID = embedding_model_id
+    TEXT_TEMPLATES_FILE = text_templates_file
+    TEXT_TOKEN_BUDGET = text_token_budget
+    WORK_QUEUE_ENABLED = work_queue_enabled or shard_count > 1
+    WORK_QUEUE_CLAIM_IDLE_S = work_queue_claim_idle_s
+    WORK_QUEUE_MAX_FAILURES = work_queue_max_failures
+    SHARD_COUNT = shard_count
+    WORKER_ID = worker_id or default_worker_id()
+    SHARD_LEASE_TTL_S = shard_lease_ttl_s
+    SOURCE_LEASE_TTL_S = source_lease_ttl_s
+    SOURCE_OWNER_TTL_S = source_owner_ttl_s
 
 
 #############################################
@@ -67,7 +222,34 @@ def configure_core(
 
 UPSERT_SQL = """
 INSERT INTO trabajadores (id_estable, hash_completo, json_data, texto_unificado, embedding, updated_at)
-VALUES ($1, $2, $3::jsonb, $4, $5::vector, now())
+VALUES ($1, $2, $3::jsonb, $4, $5, now())
+ON CONFLICT (id_estable) DO UPDATE
+SET hash_completo = EXCLUDED.hash_completo,
+    json_data = EXCLUDED.json_data,
+    texto_unificado = EXCLUDED.texto_unificado,
+    embedding = EXCLUDED.embedding,
+    updated_at = now();
+"""
+
+# Modo bulk: staging temporal (se elimina al terminar la transacción) + un solo merge.
+STAGING_TABLE = "trabajadores_staging"
+
+STAGING_COLUMNS = ("id_estable", "hash_completo", "json_data", "texto_unificado", "embedding")
+
+CREATE_STAGING_SQL = f"""
+CREATE TEMP TABLE {STAGING_TABLE} (
+    id_estable text,
+    hash_completo text,
+    json_data text,
+    texto_unificado text,
+    embedding vector
+) ON COMMIT DROP;
+"""
+
+MERGE_STAGING_SQL = f"""
+INSERT INTO trabajadores (id_estable, hash_completo, json_data, texto_unificado, embedding, updated_at)
+SELECT id_estable, hash_completo, json_data::jsonb, texto_unificado, embedding, now()
+FROM {STAGING_TABLE}
 ON CONFLICT (id_estable) DO UPDATE
 SET hash_completo = EXCLUDED.hash_completo,
     json_data = EXCLUDED.json_data,
@@ -81,75 +263,242 @@ SET hash_completo = EXCLUDED.hash_completo,
 # UTILIDADES
 #############################################
 
-def _embedding_to_pgvector_string(emb: List[float]) -> str:
-    if not isinstance(emb, (list, tuple)):
-        raise TypeError("Embedding debe ser lista/tupla de floats.")
-    if len(emb) != EXPECTED_EMBEDDING_DIM:
-        raise ValueError(f"Embedding length {len(emb)} != expected {EXPECTED_EMBEDDING_DIM}")
-    return str([float(x) for x in emb])
+def _embedding_to_pgvector(emb: Any) -> np.ndarray:
+    # El codec binario serializa directamente desde el buffer float32
+    return to_float32_vector(emb, EXPECTED_EMBEDDING_DIM)
+
+
+def _json_payload(it: Dict[str, Any]) -> str:
+    # json canónico ya calculado en el preprocesamiento (evita otro json.dumps)
+    return it.get("json_text") or json.dumps(it["json_data"])
+
 
+async def init_connection(conn: asyncpg.Connection):
+    """Callback `init` del pool: registra el codec binario de `vector`."""
+    await register_vector_codec(conn)
 
-async def upsert_batch(conn: asyncpg.Connection, batch_items: List[Dict[str, Any]], embeddings: List[str]):
+
+async def upsert_batch_rows(conn: asyncpg.Connection, batch_items: List[Dict[str, Any]], embeddings: List[np.ndarray]):
     # Usamos transaction para atomicidad
     async with conn.transaction():
-        for it, emb_str in zip(batch_items, embeddings):
+        for it, emb in zip(batch_items, embeddings):
             await conn.execute(
                 UPSERT_SQL,
                 it["id_estable"],
                 it["hash_completo"],
-                json.dumps(it["json_data"]),
+                _json_payload(it),
                 it["texto_unificado"],
-                emb_str,
+                emb,
             )
 
 
+async def upsert_batch_copy(conn: asyncpg.Connection, batch_items: List[Dict[str, Any]], embeddings: List[np.ndarray]):
+    """
+    Un solo round trip de datos: COPY del batch a una tabla temporal y
+    un único INSERT ... SELECT ... ON CONFLICT para mezclarlo en trabajadores.
+    """
+    # ON CONFLICT no admite tocar la misma fila dos veces en un mismo INSERT:
+    # si un id_estable se repite en el batch, gana la última versión.
+    latest: Dict[Any, tuple] = {}
+    for it, emb in zip(batch_items, embeddings):
+        latest[it["id_estable"]] = (
+            it["id_estable"],
+            it["hash_completo"],
+            _json_payload(it),
+            it["texto_unificado"],
+            emb,
+        )
+
+    async with conn.transaction():
+        await conn.execute(CREATE_STAGING_SQL)
+        await conn.copy_records_to_table(
+            STAGING_TABLE,
+            records=list(latest.values()),
+            columns=STAGING_COLUMNS,
+        )
+        await conn.execute(MERGE_STAGING_SQL)
+
+
+async def upsert_batch(conn: asyncpg.Connection, batch_items: List[Dict[str, Any]], embeddings: List[np.ndarray]):
+    start = time.perf_counter()
+    if UPSERT_MODE == "row":
+        await upsert_batch_rows(conn, batch_items, embeddings)
+        UPSERT_SECONDS.labels("row").observe(time.perf_counter() - start)
+        return
+
+    try:
+        await upsert_batch_copy(conn, batch_items, embeddings)
+        UPSERT_SECONDS.labels("copy").observe(time.perf_counter() - start)
+    except asyncpg.PostgresError as e:
+        # Se deshizo solo el bloque del COPY (dentro de write_items es un savepoint: la
+        # transacción exterior sigue viva gracias a él): reintentar con el camino fila a fila
+        logger.warning(json.dumps({
+            "event": "copy_upsert_fallback",
+            "error": str(e),
+            "records": len(batch_items)
+        }))
+        start = time.perf_counter()
+        await upsert_batch_rows(conn, batch_items, embeddings)
+        UPSERT_SECONDS.labels("row").observe(time.perf_counter() - start)
+
+
 #############################################
-# PROCESAR UN BATCH
+# ETAPAS: PREPARAR / EMBEBER / ESCRIBIR
 #############################################
 
-async def process_batch(session: aiohttp.ClientSession, pool: asyncpg.Pool, tei_client: TEIClient,
-                        batch_items: List[Dict[str, Any]], texts: List[str], sem: asyncio.Semaphore):
+def prepare_item(wrapper: Dict[str, Any], projector: Optional[TextProjector] = None) -> Dict[str, Any]:
+    record = wrapper.get("raw") or {}
+
+    # Un solo recorrido: id + hash + json canónico (reutilizado en el upsert) + texto
+    # (con plantilla de la fuente, el texto sale de la plantilla)
+    preprocess = preprocess_record
+    if projector is not None:
+        preprocess = projector.preprocessor_for(wrapper.get("source_key") or wrapper.get("source"))
+    id_estable, hcomp, json_text, texto = preprocess(record)
+
+    return {
+        # con resolución de identidad el id ya viene decidido (id canónico de la persona)
+        "id_estable": wrapper.get("id_estable") or id_estable,
+        "hash_completo": hcomp,
+        "json_data": record,
+        "json_text": json_text,
+        "texto_unificado": texto or " "
+    }
+
+
+async def embed_items(session: Optional[aiohttp.ClientSession], tei_client: TEIClient,
+                      texts: List[str]) -> List[np.ndarray]:
+    # Los reintentos viven en TEIClient, por sub-batch (no se reintenta la lista completa)
+    embeddings = await tei_client.embed_batch(session, texts)
+
+    if not isinstance(embeddings, list) or len(embeddings) != len(texts):
+        raise RuntimeError("TEI returned embeddings in unexpected format or length mismatch.")
+
+    return [_embedding_to_pgvector(emb) for emb in embeddings]
+
+
+async def embed_batch_items(session: Optional[aiohttp.ClientSession], pool: asyncpg.Pool, tei_client: TEIClient,
+                            batch_items: List[Dict[str, Any]]) -> List[np.ndarray]:
+    """
+    Un embedding por registro. Con chunking, los textos de más de un pasaje se
+    embeben por chunks (reutilizando los chunks guardados cuyo hash no cambió)
+    y se deja `it["chunks"]` listo para write_chunks.
+    """
+    if not CHUNKING_ENABLED:
+        return await embed_items(session, tei_client, [it["texto_unificado"] for it in batch_items])
+
+    passages = [
+        chunk_text(it["texto_unificado"], tei_client.tokens, CHUNK_MAX_TOKENS, CHUNK_OVERLAP_TOKENS)
+        for it in batch_items
+    ]
+    multi = [i for i, p in enumerate(passages) if len(p) > 1]
+
+    existing = {}
+    ids = [batch_items[i]["id_estable"] for i in multi if batch_items[i]["id_estable"] is not None]
+    if ids:
+        async with pool.acquire() as conn:
+            existing = await load_chunk_embeddings(conn, ids)
+
+    # Textos a enviar: registros de un pasaje + chunks nuevos o modificados
+    texts: List[str] = []
+    targets: List[tuple] = []  # (índice de registro, índice de chunk o None)
+    reused = 0
+
+    for i, it in enumerate(batch_items):
+        if len(passages[i]) == 1:
+            it["chunks"] = []
+            texts.append(it["texto_unificado"])
+            targets.append((i, None))
+            continue
+
+        stored = existing.get(it["id_estable"], {})
+        # lo guardado por chunk_no: write_chunks solo reescribe lo que cambió
+        it["chunks_stored"] = {n: h for n, (h, _) in stored.items()}
+        old = {h: e for h, e in stored.values()}
+        it["chunks"] = []
+        for n, passage in enumerate(passages[i]):
+            h = chunk_hash(passage)
+            emb = old.get(h)
+            it["chunks"].append({"chunk_no": n, "chunk_hash": h, "embedding": emb})
+            if emb is None:
+                texts.append(passage)
+                targets.append((i, n))
+            else:
+                reused += 1
+
+    fresh = await embed_items(session, tei_client, texts) if texts else []
+
+    embeddings: List[Optional[np.ndarray]] = [None] * len(batch_items)
+    for (i, n), emb in zip(targets, fresh):
+        if n is None:
+            embeddings[i] = emb
+        else:
+            batch_items[i]["chunks"][n]["embedding"] = emb
+
+    for i in multi:
+        chunk_vecs = [c["embedding"] for c in batch_items[i]["chunks"]]
+        embeddings[i] = _embedding_to_pgvector(mean_pool(chunk_vecs))
+
+    if multi:
+        logger.info(json.dumps({
+            "event": "chunks_embedded",
+            "records": len(multi),
+            "chunks_embedded": len([t for t in targets if t[1] is not None]),
+            "chunks_reused": reused
+        }))
 
-    start = time.time()
+    return embeddings
+
+
+async def write_items(pool: asyncpg.Pool, batch_items: List[Dict[str, Any]], embeddings: List[np.ndarray],
+                      hash_index: Optional[HashIndex] = None, snapshot: Optional[VectorSnapshotWriter] = None,
+                      aggregates: Optional[GroupAggregates] = None, gate: Optional[ModelVersionGate] = None):
+    if CHUNKING_ENABLED:
+        await CHUNKED_IDS.maybe_refresh(pool)
+
+    async with pool.acquire() as conn:
+        if CHUNKING_ENABLED or aggregates is not None or gate is not None:
+            # registro, chunks y agregados en la misma transacción
+            async with conn.transaction():
+                if gate is not None:
+                    # la versión se valida con la fila activa tomada: un swap no puede colarse
+                    await gate.check_write(conn)
+                previous = await aggregates.fetch_previous(conn, batch_items) if aggregates is not None else None
+                await upsert_batch(conn, batch_items, embeddings)
+                if CHUNKING_ENABLED:
+                    await write_chunks(conn, batch_items, CHUNKED_IDS)
+                if aggregates is not None:
+                    await aggregates.apply(conn, batch_items, embeddings, previous)
+        else:
+            await upsert_batch(conn, batch_items, embeddings)
+
+    if CHUNKING_ENABLED:
+        CHUNKED_IDS.update(batch_items)
+
+    if hash_index is not None:
+        hash_index.update(batch_items)
+
+    if snapshot is not None:
+        # I/O de archivo fuera del event loop; un fallo acá no invalida el upsert ya hecho
+        try:
+            await asyncio.to_thread(snapshot.update, [it["id_estable"] for it in batch_items], embeddings)
+        except Exception as e:
+            logger.error(json.dumps({"event": "vector_snapshot_error", "error": str(e)}))
 
-    try:
-        max_attempts = 3
-        attempt = 0
-        embeddings = None
-        last_exc = None
 
-        while attempt < max_attempts:
-            try:
-                embeddings = await asyncio.wait_for(
-                    tei_client.embed_batch(session, texts),
-                    timeout=TEI_TIMEOUT
-                )
-                break
-            except Exception as e:
-                last_exc = e
-                attempt += 1
-                backoff = 0.5 * (2 ** (attempt - 1))
-                logger.warning(json.dumps({
-                    "event": "tei_retry",
-                    "attempt": attempt,
-                    "error": str(e),
-                    "backoff_s": backoff
-                }))
-                await asyncio.sleep(backoff)
-
-        if embeddings is None:
-            raise RuntimeError(f"TEI failed after {max_attempts} attempts: {last_exc}")
-
-        if not isinstance(embeddings, list) or len(embeddings) != len(batch_items):
-            raise RuntimeError("TEI returned embeddings in unexpected format or length mismatch.")
-
-        embeddings_pg = []
-        for emb in embeddings:
-            emb_pg = _embedding_to_pgvector_string(emb)
-            embeddings_pg.append(emb_pg)
+#############################################
+# PROCESAR UN BATCH
+#############################################
 
-        async with pool.acquire() as conn:
-            await upsert_batch(conn, batch_items, embeddings_pg)
+async def process_batch(session: Optional[aiohttp.ClientSession], pool: asyncpg.Pool, tei_client: TEIClient,
+                        batch_items: List[Dict[str, Any]], texts: List[str],
+                        sem: Optional[asyncio.Semaphore] = None, hash_index: Optional[HashIndex] = None):
+    """Embed + upsert de un batch en un solo paso (fuera del pipeline)."""
+    start = time.time()
+
+    try:
+        embeddings = await embed_batch_items(session, pool, tei_client, batch_items)
+        await write_items(pool, batch_items, embeddings, hash_index)
 
         took = round(time.time() - start, 2)
         logger.info(json.dumps({
@@ -166,101 +515,421 @@ async def process_batch(session: aiohttp.ClientSession, pool: asyncpg.Pool, tei_
         }))
 
     finally:
-        try:
+        if sem is not None:
             sem.release()
-        except Exception:
-            pass
 
 
 #############################################
-# INFINITE INGEST LOOP (mejorado)
+# CICLO DE INGESTA EN STREAMING
 #############################################
 
-async def ingest_loop(pool: asyncpg.Pool, tei_client: TEIClient):
-    sem = asyncio.Semaphore(CONCURRENCY)
+async def run_ingest_cycle(session: Optional[aiohttp.ClientSession], pool: asyncpg.Pool, tei_client: TEIClient,
+                           hash_index: HashIndex, sources: Optional[List[Any]] = None,
+                           snapshot: Optional[VectorSnapshotWriter] = None,
+                           aggregates: Optional[GroupAggregates] = None,
+                           queue: Optional[WorkQueue] = None,
+                           resolver: Optional[IdentityResolver] = None,
+                           projector: Optional[TextProjector] = None,
+                           gate: Optional[ModelVersionGate] = None,
+                           ownership: Optional[SourceOwnership] = None) -> Dict[str, int]:
+    """
+    fuentes (generadores async) -> preparar (id/hash/texto) -> diff -> embed -> write.
+    Etapas unidas por colas acotadas: la memoria no depende del tamaño de las fuentes
+    y los primeros embeddings arrancan mientras las fuentes siguen descargando.
+    Con resolver, una etapa previa a preparar une los registros de cada persona (ver identity.py).
+    Sin resolver y con ownership, preparar descarta los ids cuyo dueño es otra fuente.
+    Con cola de trabajo, el diff encola los registros cambiados en Redis y el embed/write
+    lo hace consume_work_queue (en este worker o en el dueño del shard).
+    """
+    stats = {"records": 0, "changed": 0, "queued": 0, "errors": 0}
+    sources = get_sources() if sources is None else sources
+
+    label = sources[0].key or sources[0].name if len(sources) == 1 else "all"
+    pipe = Pipeline(f"ingest:{label}")
+    q_pages = pipe.queue("pages", PIPELINE_QUEUE_SIZE)
+    q_resolved = pipe.queue("resolved", PIPELINE_QUEUE_SIZE) if resolver is not None else q_pages
+    q_prepared = pipe.queue("prepared", PIPELINE_QUEUE_SIZE)
+    q_batches = pipe.queue("batches", PIPELINE_QUEUE_SIZE)
+    q_embedded = pipe.queue("embedded", PIPELINE_QUEUE_SIZE)
+
+    async def resolve(page, emit):
+        async with pool.acquire() as conn:
+            merged = await resolver.resolve(conn, page)
+        if merged:
+            await emit(merged)
+
+    async def prepare(page, emit):
+        items = [prepare_item(w, projector) for w in page]
+        stats["records"] += len(items)
+        if ownership is not None and items:
+            # una página viene de una sola fuente
+            items = await ownership.filter(page[0].get("source_key") or page[0].get("source"), items)
+        await emit(items)
+
+    pending: List[Dict[str, Any]] = []
+    to_queue: List[Dict[str, Any]] = []
+
+    async def enqueue():
+        batch = to_queue[:]
+        del to_queue[:]
+        try:
+            added = await queue.enqueue(batch)
+        except Exception as e:
+            # sin encolar no se puede confirmar la fuente: el próximo ciclo los vuelve a traer
+            logger.error(json.dumps({"event": "batch_error", "stage": "enqueue", "error": str(e), "records": len(batch)}))
+            stats["errors"] += 1
+            return
+        # los que ya esperaban en la cola con el mismo hash no se repiten
+        WORK_QUEUE_MESSAGES.labels("enqueued").inc(added)
+        stats["changed"] += added
+        stats["queued"] += added
+
+    async def diff(items, emit):
+        for it in items:
+            if hash_index.is_unchanged(it["id_estable"], it["hash_completo"]):
+                # ya existe y no cambió -> ignorar
+                continue
+            if queue is not None and it["id_estable"] is not None:
+                to_queue.append(it)
+                if len(to_queue) >= BATCH_SIZE:
+                    await enqueue()
+                continue
+            pending.append(it)
+            if len(pending) >= BATCH_SIZE:
+                batch = pending[:]
+                del pending[:]
+                stats["changed"] += len(batch)
+                await emit(batch)
+
+    async def flush(emit):
+        if to_queue:
+            await enqueue()
+        if pending:
+            stats["changed"] += len(pending)
+            await emit(pending[:])
+            del pending[:]
+
+    async def embed(batch, emit):
+        start = time.time()
+        try:
+            embeddings = await embed_batch_items(session, pool, tei_client, batch)
+        except Exception as e:
+            logger.error(json.dumps({"event": "batch_error", "stage": "embed", "error": str(e), "records": len(batch)}))
+            stats["errors"] += 1
+            return
+        await emit((batch, embeddings, start))
+
+    async def write(payload, emit):
+        batch, embeddings, start = payload
+        try:
+            await write_items(pool, batch, embeddings, hash_index, snapshot, aggregates, gate)
+        except Exception as e:
+            logger.error(json.dumps({"event": "batch_error", "stage": "write", "error": str(e), "records": len(batch)}))
+            stats["errors"] += 1
+            return
+        took = time.time() - start
+        BATCHES_PROCESSED.inc()
+        RECORDS_PROCESSED.inc(len(batch))
+        BATCH_PROCESS_SECONDS.observe(took)
+        logger.info(json.dumps({
+            "event": "batch_processed",
+            "records": len(batch),
+            "time_seconds": round(took, 2)
+        }))
+
+    # con resolver el dedup por dni/correo/id queda a cargo de la resolución: solo se descartan idénticos
+    dedup = Deduplicator(exact_key) if resolver is not None else None
+    pipe.source("sources", stream_sources(sources, dedup), q_pages, concurrency=SOURCE_CONCURRENCY)
+    if resolver is not None:
+        pipe.stage("resolve", resolve, q_pages, q_resolved, concurrency=1)
+    pipe.stage("prepare", prepare, q_resolved, q_prepared, concurrency=PREPARE_CONCURRENCY)
+    pipe.stage("diff", diff, q_prepared, q_batches, concurrency=1, on_done=flush)
+    pipe.stage("embed", embed, q_batches, q_embedded, concurrency=EMBED_CONCURRENCY)
+    pipe.stage("write", write, q_embedded, None, concurrency=WRITE_CONCURRENCY)
+
+    # errores no atrapados por las etapas (fuentes, resolve, prepare): páginas descartadas
+    failed = await pipe.run()
+    stats["errors"] += sum(failed.values())
+
+    skipped = stats["records"] - stats["changed"]
+    RECORDS_SKIPPED.labels(label).inc(skipped)
+    if stats["records"]:
+        SKIP_RATIO.labels(label).set(skipped / stats["records"])
 
-    async with aiohttp.ClientSession() as session:
-        logger.info(json.dumps({"event": "ingestor_started"}))
+    # Solo un ciclo sin batches perdidos avanza los watermarks de las fuentes
+    if not stats["errors"]:
+        await commit_sources(sources)
 
+    return stats
+
+
+#############################################
+# CONSUMIDOR DE LA COLA DE TRABAJO
+#############################################
+
+# Errores de infraestructura (o modelo activo distinto): el mensaje queda pendiente sin
+# contar como fallo del registro
+_TRANSIENT_ERRORS = (aiohttp.ClientError, asyncio.TimeoutError, ConnectionError, OSError,
+                     TEIOverloadError, asyncpg.PostgresConnectionError, asyncpg.InterfaceError,
+                     asyncpg.TooManyConnectionsError, ModelVersionMismatch)
+
+
+async def consume_work_queue(session: Optional[aiohttp.ClientSession], pool: asyncpg.Pool, tei_client: TEIClient,
+                             hash_index: HashIndex, queue: WorkQueue, reclaim_now: asyncio.Event,
+                             snapshot: Optional[VectorSnapshotWriter] = None,
+                             aggregates: Optional[GroupAggregates] = None,
+                             gate: Optional[ModelVersionGate] = None):
+    """
+    Embebe y escribe lo encolado en los streams propios; XACK solo tras el upsert.
+    - error de infraestructura (TEI/BD caídos): sin ack y con backoff; se reclama al
+      vencer claim_idle, así tras la caída se reprocesa solo lo pendiente
+    - error propio de un registro: bisección del batch para aislarlo (los sanos se
+      escriben) y conteo de fallos; al llegar al máximo va a dead letters
+    `reclaim_now` fuerza un reclamo inmediato (p. ej. al tomar shards nuevos).
+    """
+    sem = asyncio.Semaphore(EMBED_CONCURRENCY)
+    inflight = set()
+    backoff = 0.0
+    last_claim = 0.0
+    claim_interval = max(1.0, WORK_QUEUE_CLAIM_IDLE_S / 2)
+
+    async def process(messages: List[Message]):
+        # re-diff contra el índice local (el del productor pudo estar atrasado) y sin los
+        # reemplazados por un mensaje más nuevo del mismo id (no pisar datos frescos)
+        superseded = await queue.superseded(messages)
+        batch = [it for _, msg_id, it in messages
+                 if msg_id not in superseded and not hash_index.is_unchanged(it["id_estable"], it["hash_completo"])]
+        if batch:
+            start = time.time()
+            embeddings = await embed_batch_items(session, pool, tei_client, batch)
+            await write_items(pool, batch, embeddings, hash_index, snapshot, aggregates, gate)
+            BATCHES_PROCESSED.inc()
+            RECORDS_PROCESSED.inc(len(batch))
+            BATCH_PROCESS_SECONDS.observe(time.time() - start)
+        await queue.ack(messages)
+        WORK_QUEUE_MESSAGES.labels("acked").inc(len(messages))
+
+    async def isolate(messages: List[Message], error: Exception):
+        if len(messages) == 1:
+            dead = await queue.fail(messages, repr(error))
+            WORK_QUEUE_MESSAGES.labels("failed").inc()
+            WORK_QUEUE_MESSAGES.labels("dead").inc(dead)
+            return
+        mid = len(messages) // 2
+        for half in (messages[:mid], messages[mid:]):
+            try:
+                await process(half)
+            except _TRANSIENT_ERRORS:
+                return
+            except Exception as e:
+                await isolate(half, e)
+
+    async def handle(messages: List[Message]):
+        nonlocal backoff
+        try:
+            await process(messages)
+            backoff = 0.0
+        except _TRANSIENT_ERRORS as e:
+            backoff = min(max(backoff * 2, 1.0), 60.0)
+            WORK_QUEUE_MESSAGES.labels("failed").inc(len(messages))
+            logger.error(json.dumps({"event": "batch_error", "stage": "work_queue", "transient": True,
+                                     "error": str(e), "records": len(messages)}))
+        except Exception as e:
+            logger.error(json.dumps({"event": "batch_error", "stage": "work_queue", "transient": False,
+                                     "error": str(e), "records": len(messages)}))
+            try:
+                await isolate(messages, e)
+            except Exception as e2:
+                logger.error(json.dumps({"event": "work_queue_error", "error": str(e2)}))
+        finally:
+            sem.release()
+
+    try:
         while True:
             try:
-                data = await fetch_all_sources()
+                if backoff:
+                    await asyncio.sleep(backoff)
+                if gate is not None and not await gate.ok(pool):
+                    # otro modelo activo: lo encolado espera al redeploy
+                    await asyncio.sleep(gate.check_interval)
+                    continue
 
-                if not data:
-                    await asyncio.sleep(1)
+                messages: List[Message] = []
+                if reclaim_now.is_set() or time.monotonic() - last_claim >= claim_interval:
+                    reclaim_now.clear()
+                    last_claim = time.monotonic()
+                    messages = await queue.reclaim(BATCH_SIZE * EMBED_CONCURRENCY)
+                    WORK_QUEUE_MESSAGES.labels("reclaimed").inc(len(messages))
+                    depth = await queue.depth()
+                    WORK_QUEUE_LENGTH.set(depth["length"])
+                    WORK_QUEUE_PENDING.set(depth["pending"])
+                if not messages:
+                    messages = await queue.read(BATCH_SIZE)
+                if not messages:
+                    if not queue.owner.owned:
+                        await asyncio.sleep(1)
                     continue
 
-                # Procesar en chunks reales
-                for i in range(0, len(data), BATCH_SIZE):
-                    chunk = data[i:i + BATCH_SIZE]
-
-                    # Preparar listas y metadatos
-                    batch_items = []
-                    texts = []
-                    ids = []
-
-                    for wrapper in chunk:
-                        record = wrapper.get("raw") or {}
-
-                        id_estable = extract_identifier_field(record, "email")
-                        hcomp = compute_hash_completo(record)
-                        texto = build_texto_unificado(record) or " "
-
-                       
-
-                        batch_items.append({
-                            "id_estable": id_estable,
-                            "hash_completo": hcomp,
-                            "json_data": record,
-                            "texto_unificado": texto
-                        })
-
-                        texts.append(texto)
-                        ids.append(id_estable)
-
-                    # Consultar la BD para saber cuáles ya existen y sus hashes
-                    async with pool.acquire() as conn:
-                        if ids:
-                            rows = await conn.fetch(
-                                "SELECT id_estable, hash_completo FROM trabajadores WHERE id_estable = ANY($1)",
-                                ids
-                            )
-                        else:
-                            rows = []
-
-                    existing_map = {r["id_estable"]: r["hash_completo"] for r in rows}
-
-                    # Filtrar batch_items: si existe y hash_completo igual -> skip
-                    to_process_items = []
-                    to_process_texts = []
-
-                    for it, txt in zip(batch_items, texts):
-                        existing_hash = existing_map.get(it["id_estable"])
-                        if existing_hash is not None and existing_hash == it["hash_completo"]:
-                            # ya existe y no cambió -> ignorar
-                            continue
-                        to_process_items.append(it)
-                        to_process_texts.append(txt)
-
-                    if not to_process_items:
-                        # nada que procesar en este chunk
-                        continue
+                unreadable = [m for m in messages if m[2] is None]
+                if unreadable:
+                    await queue.dead_letter(unreadable, "mensaje ilegible o recortado del stream")
+                    WORK_QUEUE_MESSAGES.labels("dead").inc(len(unreadable))
+                messages = [m for m in messages if m[2] is not None]
 
+                for i in range(0, len(messages), BATCH_SIZE):
                     await sem.acquire()
+                    task = asyncio.create_task(handle(messages[i:i + BATCH_SIZE]))
+                    inflight.add(task)
+                    task.add_done_callback(inflight.discard)
 
-                    # Crear tarea para procesar este batch (no bloquear loop)
-                    asyncio.create_task(
-                        process_batch(session, pool, tei_client, to_process_items, to_process_texts, sem)
-                    )
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(json.dumps({"event": "work_queue_error", "error": str(e)}))
+                await asyncio.sleep(1)
+    finally:
+        # lo que estaba en vuelo queda pendiente en Redis y se reclama al reiniciar
+        for t in inflight:
+            t.cancel()
+        await asyncio.gather(*inflight, return_exceptions=True)
 
-                # fin for chunks
 
-            except Exception as e:
-                logger.error(json.dumps({
-                    "event": "loop_error",
-                    "error": str(e)
-                }))
-                await asyncio.sleep(2)
+#############################################
+# INGEST LOOP: SCHEDULER POR FUENTE
+#############################################
+
+async def ingest_loop(pool: asyncpg.Pool, tei_client: TEIClient):
+    hash_index = HashIndex(
+        refresh_interval=HASH_INDEX_REFRESH_S,
+        full_reload_interval=HASH_INDEX_FULL_RELOAD_S
+    )
+    await ensure_schema(pool, EXPECTED_EMBEDDING_DIM, chunks=CHUNKING_ENABLED, aggregates=AGGREGATES_ENABLED)
+    await hash_index.load(pool)
+
+    gate = None
+    if EMBEDDING_MODEL_VERSION:
+        await ensure_embedding_models_schema(pool)
+        gate = ModelVersionGate(EMBEDDING_MODEL_VERSION)
+        await gate.bootstrap(pool, EMBEDDING_MODEL_ID, EXPECTED_EMBEDDING_DIM)
+
+    resolver = None
+    if IDENTITY_RESOLUTION:
+        await ensure_identity_schema(pool)
+        priority = [s.strip() for s in (IDENTITY_SOURCE_PRIORITY or "").split(",") if s.strip()]
+        resolver = IdentityResolver(priority, max_keys=IDENTITY_CACHE_SIZE)
+
+    # plantillas compiladas una vez; cuentan tokens con el mismo estimador que los batches de TEI
+    projector = load_projector(TEXT_TEMPLATES_FILE, tei_client.tokens, TEXT_TOKEN_BUDGET)
+
+    snapshot = None
+    if VECTOR_SNAPSHOT_DIR:
+        # reconstrucción completa al arrancar: recoge lo que otros procesos escribieron mientras tanto
+        snapshot = VectorSnapshotWriter(VECTOR_SNAPSHOT_DIR, EXPECTED_EMBEDDING_DIM)
+        await snapshot.rebuild(pool)
+
+    aggregates = None
+    if AGGREGATES_ENABLED:
+        aggregates = GroupAggregates(parse_dimensions(AGGREGATE_DIMENSIONS) if AGGREGATE_DIMENSIONS else None)
+        # activado sobre una tabla con datos: sin la base completa los deltas no alcanzan
+        await aggregates.ensure_built(pool)
+
+    # TEIClient maneja su propia sesión HTTP (keep-alive, límite por host)
+    session = None
+
+    sources = get_sources()
+    if not sources:
+        logger.warning(json.dumps({"event": "no_sources_configured"}))
+        return
+
+    # cada fuente corre su propio ciclo: la misma persona en dos fuentes necesita un dueño fijo
+    # (con resolución de identidad la mezcla campo a campo ya une a la persona)
+    ownership = None
+    if resolver is None and len(sources) > 1:
+        ownership = SourceOwnership([s.key or s.name for s in sources], redis=get_redis(), ttl=SOURCE_OWNER_TTL_S)
+
+    background = []
+    leases = queue = redis = None
+    reclaim_now = asyncio.Event()
+
+    if WORK_QUEUE_ENABLED:
+        redis = get_redis()
+        if redis is None:
+            raise RuntimeError("WORK_QUEUE_ENABLED / SHARD_COUNT > 1 requieren REDIS_URL")
+
+        owner = SingleShard(WORKER_ID)
+        if SHARD_COUNT > 1:
+            async def on_acquire(shards):
+                # los shards recién tomados pudieron ser escritos por su dueño anterior
+                await hash_index.refresh(pool)
+                reclaim_now.set()
+
+            owner = leases = ShardLeaseManager(redis, SHARD_COUNT, WORKER_ID, lease_ttl=SHARD_LEASE_TTL_S,
+                                               on_acquire=on_acquire)
+            await leases.rebalance()
+            background.append(asyncio.create_task(leases.run()))
+
+        queue = WorkQueue(redis, owner, claim_idle_ms=int(WORK_QUEUE_CLAIM_IDLE_S * 1000),
+                          max_failures=WORK_QUEUE_MAX_FAILURES)
+        # al arrancar: retomar lo que quedó pendiente antes del reinicio
+        reclaim_now.set()
+        background.append(asyncio.create_task(
+            consume_work_queue(session, pool, tei_client, hash_index, queue, reclaim_now, snapshot, aggregates, gate)
+        ))
+
+    async def run_cycle(source) -> Dict[str, int]:
+        if gate is not None and not await gate.ok(pool):
+            raise RuntimeError(f"el modelo de embeddings activo no es {EMBEDDING_MODEL_VERSION}: redeploy pendiente")
+        start = time.perf_counter()
+        await hash_index.maybe_refresh(pool)
+        stats = await run_ingest_cycle(session, pool, tei_client, hash_index, sources=[source],
+                                       snapshot=snapshot, aggregates=aggregates, queue=queue,
+                                       resolver=resolver, projector=projector, gate=gate, ownership=ownership)
+        CYCLE_SECONDS.labels(source.key or source.name).observe(time.perf_counter() - start)
+        logger.info(json.dumps({"event": "cycle_done", "source": source.key or source.name, **stats}))
+        return stats
+
+    async def run_source(source) -> Dict[str, int]:
+        if leases is None:
+            return await run_cycle(source)
+        # una sola réplica descarga cada fuente; las demás saltean este disparo
+        async with SourceLease(redis, source.key or source.name, WORKER_ID, ttl=SOURCE_LEASE_TTL_S) as held:
+            if not held:
+                logger.info(json.dumps({"event": "source_leased_elsewhere", "source": source.key or source.name}))
+                return {"records": 0, "changed": 0, "queued": 0, "errors": 0}
+            return await run_cycle(source)
+
+    scheduler = Scheduler(
+        run_source,
+        [SourceSchedule(s, **schedule_config(s.key or s.name)) for s in sources]
+    )
+
+    runner = None
+
+    if TRIGGER_HTTP_PORT:
+        app = web.Application()
+        add_trigger_routes(app, scheduler, token=TRIGGER_TOKEN)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        await web.TCPSite(runner, "0.0.0.0", TRIGGER_HTTP_PORT).start()
+
+    if TRIGGER_PG_CHANNEL:
+        background.append(asyncio.create_task(
+            listen_pg_triggers(TRIGGER_PG_DSN or DATABASE_URL, TRIGGER_PG_CHANNEL, scheduler)
+        ))
+
+    logger.info(json.dumps({"event": "ingestor_started", "sources": list(scheduler.schedules)}))
+
+    try:
+        await scheduler.run()
+    finally:
+        for t in background:
+            t.cancel()
+        await asyncio.gather(*background, return_exceptions=True)
+        if leases is not None:
+            # liberar leases ya: los otros workers toman los shards sin esperar el TTL
+            await leases.release_all()
+        if runner is not None:
+            await runner.cleanup()
 
 
 #############################################
@@ -277,9 +946,13 @@ async def start_ingestor():
         max_size=max(2, CONCURRENCY * 2),
         statement_cache_size=0,
         max_cached_statement_lifetime=0,
-        max_cacheable_statement_size=0
+        max_cacheable_statement_size=0,
+        init=init_connection
     )
 
-    tei_client = TEIClient(TEI_URL, max_batch=TEI_MAX_BATCH)
+    tei_client = TEIClient(TEI_URL, max_batch=TEI_MAX_BATCH, timeout=TEI_TIMEOUT)
 
-    await ingest_loop(pool, tei_client)
+    try:
+        await ingest_loop(pool, tei_client)
+    finally:
+        await tei_client.close()
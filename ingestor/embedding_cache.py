@@ -0,0 +1,135 @@
+# ingestor/embedding_cache.py
+"""
+Caché de embeddings direccionada por contenido.
+ - clave = sha256(model_id + texto exacto): si el texto no cambia, el embedding tampoco
+ - nivel 1: LRU en memoria con tamaño acotado
+ - nivel 2: Redis con TTL (compartido entre reinicios y réplicas)
+ - contadores de hits/misses por nivel
+"""
+
+import hashlib
+import logging
+from collections import OrderedDict
+from typing import List, Optional, Sequence
+
+import numpy as np
+
+logger = logging.getLogger("embedding_cache")
+
+
+class EmbeddingCache:
+    def __init__(self, model_id: str, max_items: int = 50000, redis=None,
+                 ttl: int = 60 * 60 * 24 * 7, prefix: str = "emb"):
+        self.model_id = model_id
+        self.max_items = max_items
+        self.redis = redis
+        self.ttl = ttl
+        self.prefix = prefix
+
+        self._lru: "OrderedDict[str, np.ndarray]" = OrderedDict()
+
+        self.hits_memory = 0
+        self.hits_redis = 0
+        self.misses = 0
+
+    # ------------------------------------------
+    # CLAVES Y SERIALIZACIÓN
+    # ------------------------------------------
+
+    def key(self, text: str) -> str:
+        h = hashlib.sha256()
+        h.update(self.model_id.encode("utf-8"))
+        h.update(b"\x00")
+        h.update(text.encode("utf-8"))
+        return h.hexdigest()
+
+    def _redis_key(self, key: str) -> str:
+        return f"{self.prefix}:{key}"
+
+    @staticmethod
+    def _pack(emb) -> bytes:
+        return np.asarray(emb, dtype=np.float32).tobytes()
+
+    @staticmethod
+    def _unpack(raw: bytes) -> np.ndarray:
+        return np.frombuffer(raw, dtype=np.float32)
+
+    # ------------------------------------------
+    # LRU EN MEMORIA
+    # ------------------------------------------
+
+    def _lru_get(self, key: str):
+        emb = self._lru.get(key)
+        if emb is not None:
+            self._lru.move_to_end(key)
+        return emb
+
+    def _lru_put(self, key: str, emb):
+        self._lru[key] = emb
+        self._lru.move_to_end(key)
+        while len(self._lru) > self.max_items:
+            self._lru.popitem(last=False)
+
+    # ------------------------------------------
+    # API
+    # ------------------------------------------
+
+    async def get_many(self, texts: Sequence[str]) -> List[Optional[np.ndarray]]:
+        """Retorna un embedding float32 por texto, o None si no está en ningún nivel."""
+        keys = [self.key(t) for t in texts]
+        out: List[Optional[np.ndarray]] = [None] * len(texts)
+        pending = []
+
+        for i, k in enumerate(keys):
+            emb = self._lru_get(k)
+            if emb is not None:
+                out[i] = emb
+                self.hits_memory += 1
+            else:
+                pending.append(i)
+
+        if pending and self.redis is not None:
+            try:
+                raws = await self.redis.mget([self._redis_key(keys[i]) for i in pending])
+            except Exception as e:
+                logger.warning(f"[embedding_cache] redis mget falló: {e}")
+                raws = [None] * len(pending)
+
+            still_pending = []
+            for i, raw in zip(pending, raws):
+                if raw:
+                    emb = self._unpack(raw)
+                    out[i] = emb
+                    self._lru_put(keys[i], emb)
+                    self.hits_redis += 1
+                else:
+                    still_pending.append(i)
+            pending = still_pending
+
+        self.misses += len(pending)
+        return out
+
+    async def put_many(self, texts: Sequence[str], embeddings: Sequence[np.ndarray]):
+        keys = [self.key(t) for t in texts]
+
+        for k, emb in zip(keys, embeddings):
+            self._lru_put(k, emb)
+
+        if self.redis is None or not keys:
+            return
+
+        try:
+            pipe = self.redis.pipeline(transaction=False)
+            for k, emb in zip(keys, embeddings):
+                pipe.set(self._redis_key(k), self._pack(emb), ex=self.ttl)
+            await pipe.execute()
+        except Exception as e:
+            logger.warning(f"[embedding_cache] redis set falló: {e}")
+
+    def stats(self) -> dict:
+        return {
+            "hits_memory": self.hits_memory,
+            "hits_redis": self.hits_redis,
+            "misses": self.misses,
+            "size": len(self._lru),
+        }
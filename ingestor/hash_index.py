@@ -0,0 +1,168 @@
+# ingestor/hash_index.py
+"""
+Índice en memoria id_estable -> hash_completo para detección de cambios.
+ - carga inicial con scan paginado por keyset (id_estable)
+ - se actualiza en memoria tras cada upsert exitoso
+ - re-sincronización periódica contra la BD por watermark de updated_at
+   (cambios hechos por otros procesos) y recarga completa opcional (borrados)
+ - almacenamiento compacto: digests binarios (bytes) en lugar de strings hex; las claves
+   que no son hex (emails, ids de la fuente) se guardan como blake2b de 16 bytes
+En estado estable (sin cambios) el diff de un ciclo no hace ninguna consulta.
+"""
+
+import json
+import time
+import asyncio
+import logging
+import hashlib
+import datetime
+from typing import Dict, Iterable, Any, Optional
+
+import asyncpg
+
+from ingestor.monitoring.metrics import HASH_INDEX_SYNC_SECONDS
+
+logger = logging.getLogger("hash_index")
+
+LOAD_SQL = """
+SELECT id_estable, hash_completo, updated_at
+FROM trabajadores
+WHERE id_estable > $1
+ORDER BY id_estable
+LIMIT $2
+"""
+
+DELTA_SQL = """
+SELECT id_estable, hash_completo, updated_at
+FROM trabajadores
+WHERE (updated_at, id_estable) > ($1, $2)
+ORDER BY updated_at, id_estable
+LIMIT $3
+"""
+
+# updated_at = now() es la hora de INICIO de la transacción: una transacción que
+# comete tarde puede dejar filas "detrás" del watermark. Re-leemos este margen.
+WATERMARK_OVERLAP = datetime.timedelta(seconds=60)
+
+
+def _digest(value: Optional[str]) -> Optional[bytes]:
+    if value is None:
+        return None
+    try:
+        return bytes.fromhex(value)
+    except ValueError:
+        # tamaño fijo aunque el id sea un email largo: la memoria no depende del formato
+        return hashlib.blake2b(value.encode("utf-8"), digest_size=16).digest()
+
+
+class HashIndex:
+    def __init__(self, page_size: int = 5000, refresh_interval: float = 300,
+                 full_reload_interval: float = 3600):
+        self.page_size = page_size
+        self.refresh_interval = refresh_interval
+        self.full_reload_interval = full_reload_interval
+
+        self._index: Dict[bytes, bytes] = {}
+        self._watermark: Optional[datetime.datetime] = None
+        self._last_refresh = 0.0
+        self._last_full_load = 0.0
+        self._refresh_lock = asyncio.Lock()
+
+    def __len__(self):
+        return len(self._index)
+
+    # ------------------------------------------
+    # CARGA / SINCRONIZACIÓN CON LA BD
+    # ------------------------------------------
+
+    async def load(self, pool: asyncpg.Pool):
+        """Carga completa con keyset pagination (no usa OFFSET)."""
+        start = time.time()
+        index: Dict[bytes, bytes] = {}
+        watermark = None
+        last_id = ""
+
+        while True:
+            async with pool.acquire() as conn:
+                rows = await conn.fetch(LOAD_SQL, last_id, self.page_size)
+            if not rows:
+                break
+
+            for r in rows:
+                index[_digest(r["id_estable"])] = _digest(r["hash_completo"])
+                if r["updated_at"] is not None and (watermark is None or r["updated_at"] > watermark):
+                    watermark = r["updated_at"]
+
+            last_id = rows[-1]["id_estable"]
+            if len(rows) < self.page_size:
+                break
+
+        self._index = index
+        self._watermark = watermark
+        self._last_full_load = self._last_refresh = time.monotonic()
+        HASH_INDEX_SYNC_SECONDS.labels("full").observe(time.time() - start)
+
+        logger.info(json.dumps({
+            "event": "hash_index_loaded",
+            "records": len(index),
+            "time_seconds": round(time.time() - start, 2)
+        }))
+
+    async def refresh(self, pool: asyncpg.Pool):
+        """Trae solo las filas con updated_at posterior al watermark."""
+        if self._watermark is None:
+            await self.load(pool)
+            return
+
+        start = time.time()
+        changed = 0
+        cursor_ts = self._watermark - WATERMARK_OVERLAP
+        cursor_id = ""
+        watermark = self._watermark
+
+        while True:
+            async with pool.acquire() as conn:
+                rows = await conn.fetch(DELTA_SQL, cursor_ts, cursor_id, self.page_size)
+            if not rows:
+                break
+
+            for r in rows:
+                self._index[_digest(r["id_estable"])] = _digest(r["hash_completo"])
+                if r["updated_at"] > watermark:
+                    watermark = r["updated_at"]
+            changed += len(rows)
+
+            cursor_ts, cursor_id = rows[-1]["updated_at"], rows[-1]["id_estable"]
+            if len(rows) < self.page_size:
+                break
+
+        self._watermark = watermark
+        self._last_refresh = time.monotonic()
+        HASH_INDEX_SYNC_SECONDS.labels("delta").observe(time.time() - start)
+
+        logger.info(json.dumps({"event": "hash_index_refreshed", "rows": changed}))
+
+    async def maybe_refresh(self, pool: asyncpg.Pool):
+        """Llamar al inicio de cada ciclo; solo consulta la BD si venció algún intervalo."""
+        # varias fuentes pueden arrancar a la vez: una sola re-sincronización
+        async with self._refresh_lock:
+            now = time.monotonic()
+            if self.full_reload_interval and now - self._last_full_load >= self.full_reload_interval:
+                await self.load(pool)
+            elif self.refresh_interval and now - self._last_refresh >= self.refresh_interval:
+                await self.refresh(pool)
+
+    # ------------------------------------------
+    # CONSULTA / ACTUALIZACIÓN EN MEMORIA
+    # ------------------------------------------
+
+    def is_unchanged(self, id_estable: Optional[str], hash_completo: str) -> bool:
+        if id_estable is None:
+            return False
+        return self._index.get(_digest(id_estable)) == _digest(hash_completo)
+
+    def update(self, items: Iterable[Dict[str, Any]]):
+        """Registrar items ya persistidos (llamar solo tras un upsert exitoso)."""
+        for it in items:
+            if it["id_estable"] is not None:
+                self._index[_digest(it["id_estable"])] = _digest(it["hash_completo"])
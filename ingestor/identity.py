@@ -0,0 +1,332 @@
+# ingestor/identity.py
+"""
+Resolución de identidad entre fuentes: una persona = un id_estable, un texto y un embedding.
+
+ - claves normalizadas por registro: email (exacto y variante sin +tag / puntos de gmail),
+   dni (solo alfanuméricos, sin ceros a la izquierda), file_id de Drive e id local de la
+   fuente. Los CVs de Drive aportan además el primer email que aparece al inicio del texto.
+   Un registro sin ninguna clave estable se descarta (con log): un id derivado del
+   contenido cambiaría en cada edición y dejaría una fila huérfana por versión
+ - índice persistente clave -> id canónico (identidad_claves) con caché en memoria; las
+   claves nuevas se registran con ON CONFLICT DO NOTHING y se relee el ganador, así dos
+   workers que ven a la misma persona a la vez terminan con el mismo id
+ - id canónico nuevo: sha256 del email (compatible con el id_estable histórico) o de la
+   clave de mayor prioridad; ningún registro resuelto queda con id_estable=None
+ - cada fuente guarda su versión del registro (trabajador_fuentes) y el registro que se
+   embebe es la mezcla campo a campo de todas las fuentes, en orden de prioridad fijo:
+   el resultado no depende del orden en que corren las fuentes
+
+Activación sobre una tabla `trabajadores` existente (IDENTITY_RESOLUTION=false por defecto):
+los registros con email conservan su id_estable, pero los que se unen con otra fuente o no
+tienen email pasan a un id canónico nuevo y sus filas viejas quedan huérfanas. Pasos:
+ 1. IDENTITY_RESOLUTION=true en todos los workers a la vez (no mezclar ids viejos y nuevos)
+ 2. dejar correr un ciclo completo de cada fuente (llena identidad_claves/trabajador_fuentes)
+ 3. borrar las filas que ninguna fuente reclama:
+        DELETE FROM trabajadores t
+        WHERE NOT EXISTS (SELECT 1 FROM trabajador_fuentes f WHERE f.id_canonico = t.id_estable);
+        DELETE FROM trabajador_chunks c
+        WHERE NOT EXISTS (SELECT 1 FROM trabajadores t WHERE t.id_estable = c.id_estable);
+ 4. con agregados activos: python -m ingestor.aggregates --rebuild
+"""
+
+import re
+import json
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import asyncpg
+import orjson
+
+from ingestor.utils.hashing import sha256_hex
+from ingestor.utils.preprocess import canonical_json, digest_canonical
+
+logger = logging.getLogger("identity")
+
+EMAIL_FIELDS = frozenset(("email", "correo", "mail", "e_mail", "correo_electronico"))
+DNI_FIELDS = frozenset(("dni", "documento_identidad", "nro_documento", "cedula"))
+FILE_FIELDS = frozenset(("file_id",))
+LOCAL_ID_FIELDS = ("id", "uuid", "_id")
+TEXT_FIELDS = ("contenido",)  # texto libre de documentos (CVs)
+
+_FIELD_KIND = {
+    **{f: "email" for f in EMAIL_FIELDS},
+    **{f: "dni" for f in DNI_FIELDS},
+    **{f: "file" for f in FILE_FIELDS},
+}
+
+_EMAIL_RE = re.compile(r"[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Za-z]{2,}")
+_TEXT_EMAIL_WINDOW = 2000  # el email del titular suele estar en el encabezado del CV
+_GMAIL_DOMAINS = ("gmail.com", "googlemail.com")
+
+_EMPTY = (None, "", " ", "null", [], {})
+
+LOOKUP_SQL = "SELECT clave, id_canonico FROM identidad_claves WHERE clave = ANY($1)"
+
+REGISTER_SQL = """
+INSERT INTO identidad_claves (clave, id_canonico)
+SELECT * FROM unnest($1::text[], $2::text[])
+ON CONFLICT (clave) DO NOTHING
+"""
+
+UPSERT_PARTS_SQL = """
+INSERT INTO trabajador_fuentes (id_canonico, fuente, hash_fuente, json_data, updated_at)
+SELECT i, f, h, j::jsonb, now()
+FROM unnest($1::text[], $2::text[], $3::text[], $4::text[]) AS t(i, f, h, j)
+ON CONFLICT (id_canonico, fuente) DO UPDATE
+SET hash_fuente = EXCLUDED.hash_fuente,
+    json_data = EXCLUDED.json_data,
+    updated_at = now()
+WHERE trabajador_fuentes.hash_fuente IS DISTINCT FROM EXCLUDED.hash_fuente
+"""
+
+# versiones de las otras fuentes (las de la página ya están en memoria)
+LOAD_PARTS_SQL = """
+SELECT id_canonico, fuente, json_data
+FROM trabajador_fuentes
+WHERE id_canonico = ANY($1) AND fuente <> ALL($2)
+"""
+
+
+#############################################
+# CLAVES NORMALIZADAS
+#############################################
+
+def email_keys(value: Any) -> List[str]:
+    email = str(value).strip().lower()
+    if "@" not in email:
+        return []
+    local, _, domain = email.rpartition("@")
+    keys = [f"email:{email}"]
+    base = local.split("+", 1)[0]
+    if domain in _GMAIL_DOMAINS:
+        base, domain = base.replace(".", ""), "gmail.com"
+    variant = f"email:{base}@{domain}"
+    if variant != keys[0]:
+        keys.append(variant)
+    return keys
+
+
+def dni_key(value: Any) -> Optional[str]:
+    dni = re.sub(r"[^0-9a-z]", "", str(value).lower()).lstrip("0")
+    return f"dni:{dni}" if dni else None
+
+
+def identity_keys(record: Any, source: str) -> List[str]:
+    """Claves de identidad del registro, de mayor a menor prioridad (sin repetidos; [] = sin identidad)."""
+    found: Dict[str, Any] = {}
+
+    def walk(obj):
+        # primer valor por tipo de clave, en profundidad (como el preprocesamiento)
+        if isinstance(obj, dict):
+            for k, v in obj.items():
+                if isinstance(v, (dict, list)):
+                    walk(v)
+                    continue
+                kind = _FIELD_KIND.get(k.lower() if isinstance(k, str) else str(k).lower())
+                if kind is not None and kind not in found and v not in _EMPTY:
+                    found[kind] = v
+        elif isinstance(obj, list):
+            for item in obj:
+                if isinstance(item, (dict, list)):
+                    walk(item)
+
+    walk(record)
+
+    keys: List[str] = []
+    if "email" in found:
+        keys.extend(email_keys(found["email"]))
+    if "dni" in found:
+        k = dni_key(found["dni"])
+        if k:
+            keys.append(k)
+    if "file" in found:
+        keys.append(f"file:{str(found['file']).strip()}")
+
+    if isinstance(record, dict):
+        if "email" not in found:
+            for field in TEXT_FIELDS:
+                text = record.get(field)
+                if isinstance(text, str):
+                    m = _EMAIL_RE.search(text[:_TEXT_EMAIL_WINDOW])
+                    if m:
+                        keys.extend(email_keys(m.group(0)))
+                        break
+        for field in LOCAL_ID_FIELDS:
+            if record.get(field) not in _EMPTY:
+                keys.append(f"src:{source}:{record[field]}")
+                break
+
+    return list(dict.fromkeys(keys))
+
+
+def canonical_id_for(key: str) -> str:
+    """Id canónico para una persona nueva a partir de su clave principal."""
+    if key.startswith("email:"):
+        # mismo id_estable que el preprocesamiento histórico: sha256(email.strip().lower())
+        return sha256_hex(key[len("email:"):])
+    return sha256_hex(key)
+
+
+#############################################
+# MEZCLA CAMPO A CAMPO
+#############################################
+
+def merge_records(records: Sequence[Any]) -> Any:
+    """
+    Mezcla determinística (records en orden de prioridad): por campo gana el primer valor
+    no vacío; dicts se mezclan recursivamente y listas se unen sin repetidos.
+    """
+    values = [r for r in records if r not in _EMPTY]
+    if not values:
+        return records[0] if records else None
+    if all(isinstance(v, dict) for v in values):
+        keys = list(dict.fromkeys(k for v in values for k in v))
+        return {k: merge_records([v[k] for v in values if k in v]) for k in keys}
+    if all(isinstance(v, list) for v in values):
+        out, seen = [], set()
+        for v in values:
+            for item in v:
+                c = canonical_json(item)
+                if c not in seen:
+                    seen.add(c)
+                    out.append(item)
+        return out
+    return values[0]
+
+
+#############################################
+# RESOLVER
+#############################################
+
+class IdentityResolver:
+    def __init__(self, source_priority: Optional[Sequence[str]] = None, max_keys: int = 200_000):
+        # fuentes no listadas van después, en orden alfabético
+        self.source_priority = list(source_priority or [])
+        self.max_keys = max_keys
+        # LRU clave -> id canónico (la fuente de verdad es identidad_claves)
+        self._keys: "OrderedDict[str, str]" = OrderedDict()
+        self._lock = asyncio.Lock()
+
+    def __len__(self):
+        return len(self._keys)
+
+    def _rank(self, source: str) -> Tuple[int, str]:
+        try:
+            return self.source_priority.index(source), source
+        except ValueError:
+            return len(self.source_priority), source
+
+    def _cache_put(self, key: str, canonical: str):
+        self._keys[key] = canonical
+        self._keys.move_to_end(key)
+        while len(self._keys) > self.max_keys:
+            self._keys.popitem(last=False)
+
+    async def _lookup(self, conn: asyncpg.Connection, keys: List[str], found: Dict[str, str]):
+        """Completa `found` con los ids conocidos de `keys` (caché y, lo que falte, la BD)."""
+        missing = []
+        for k in keys:
+            canonical = self._keys.get(k)
+            if canonical is None:
+                missing.append(k)
+            else:
+                self._keys.move_to_end(k)
+                found[k] = canonical
+        if missing:
+            for r in await conn.fetch(LOOKUP_SQL, missing):
+                found[r["clave"]] = r["id_canonico"]
+                self._cache_put(r["clave"], r["id_canonico"])
+
+    async def resolve(self, conn: asyncpg.Connection, wrappers: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Página de registros de una fuente -> registros mezclados, uno por persona, con
+        `id_estable` ya resuelto. Guarda la versión de esta fuente de cada persona.
+        """
+        if not wrappers:
+            return []
+
+        entries = []
+        dropped: Dict[str, int] = {}
+        for w in wrappers:
+            source = w.get("source_key") or w.get("source") or "unknown"
+            raw = w.get("raw") or {}
+            keys = identity_keys(raw, source)
+            if not keys:
+                dropped[source] = dropped.get(source, 0) + 1
+                continue
+            entries.append((source, raw, keys))
+
+        if dropped:
+            logger.warning(json.dumps({"event": "identity_unresolved", "records": dropped}))
+        if not entries:
+            return []
+
+        async with self._lock:
+            # ids de la página en un dict local: la LRU puede desalojar claves a mitad de página
+            known_ids: Dict[str, str] = {}
+            await self._lookup(conn, list({k for _, _, keys in entries for k in keys}), known_ids)
+
+            # asignar ids (en orden: dos registros de la misma persona en la página se unen)
+            new_keys: Dict[str, str] = {}
+            assigned = []
+            for source, raw, keys in entries:
+                known = [known_ids.get(k) or new_keys.get(k) for k in keys]
+                ids = list(dict.fromkeys(i for i in known if i))
+                canonical = ids[0] if ids else canonical_id_for(keys[0])
+                if len(ids) > 1:
+                    logger.warning(json.dumps({"event": "identity_conflict", "keys": keys[:4], "ids": ids,
+                                               "chosen": canonical}))
+                for k, i in zip(keys, known):
+                    if i is None:
+                        new_keys[k] = canonical
+                assigned.append(canonical)
+
+            if new_keys:
+                await conn.execute(REGISTER_SQL, list(new_keys), list(new_keys.values()))
+                # otro worker pudo registrar la misma clave antes: manda lo que quedó en la tabla
+                await self._lookup(conn, list(new_keys), known_ids)
+                for idx, (_, _, keys) in enumerate(entries):
+                    winner = known_ids.get(keys[0])
+                    if winner is not None:
+                        assigned[idx] = winner
+
+            # versión de cada fuente por persona (si la fuente repite a la persona, se mezclan)
+            by_part: Dict[Tuple[str, str], List[Any]] = {}
+            for (source, raw, _), canonical in zip(entries, assigned):
+                by_part.setdefault((canonical, source), []).append(raw)
+            parts = {
+                key: merge_records(sorted(raws, key=canonical_json)) if len(raws) > 1 else raws[0]
+                for key, raws in by_part.items()
+            }
+            payloads = {key: canonical_json(rec) for key, rec in parts.items()}
+            await conn.execute(
+                UPSERT_PARTS_SQL,
+                [k[0] for k in parts], [k[1] for k in parts],
+                [digest_canonical(p) for p in payloads.values()],
+                [p.decode("utf-8") for p in payloads.values()],
+            )
+
+            ids = list(dict.fromkeys(assigned))
+            rows = await conn.fetch(LOAD_PARTS_SQL, ids, list({k[1] for k in parts}))
+
+        stored: Dict[str, List[Tuple[str, Any]]] = {}
+        for (canonical, source), rec in parts.items():
+            stored.setdefault(canonical, []).append((source, rec))
+        for r in rows:
+            data = r["json_data"]
+            stored.setdefault(r["id_canonico"], []).append(
+                (r["fuente"], orjson.loads(data) if isinstance(data, (str, bytes)) else data)
+            )
+
+        out = []
+        for canonical in ids:
+            versions = sorted(stored.get(canonical, []), key=lambda sv: self._rank(sv[0]))
+            merged = versions[0][1] if len(versions) == 1 else merge_records([rec for _, rec in versions])
+            out.append({
+                "raw": merged,
+                "id_estable": canonical,
+                "source": ",".join(s for s, _ in versions),
+            })
+        return out
@@ -0,0 +1,425 @@
+# ingestor/jobs/reembed.py
+"""
+Migración online de modelo de embeddings (re-embedding de toda la base) sin cortar la ingesta.
+
+ 1. backfill: recorre `trabajadores` por keyset (id_estable) y re-embebe texto_unificado con
+    el modelo nuevo en una columna sombra `embedding_<versión>` (+ md5 del texto usado) y
+    sus chunks en `trabajador_chunks_<versión>`. El checkpoint (último id) se guarda en
+    embedding_models en la misma transacción que cada página: se puede cortar y retomar
+ 2. catch-up: la ingesta siguió escribiendo con el modelo activo; se re-embeben las filas
+    nuevas o cuyo texto cambió (md5 distinto) hasta que quedan pocas
+ 3. índice ANN sobre la columna sombra (CONCURRENTLY, sin bloquear)
+ 4. swap atómico: en una transacción que bloquea escrituras (no lecturas) se embeben las
+    últimas filas pendientes y se renombran columna, tabla de chunks e índice; la versión
+    nueva queda activa. Lo anterior queda como embedding_prev / trabajador_chunks_prev
+    hasta la próxima migración (rollback manual posible)
+
+Throttling: el job usa como mucho `tei_share` de la capacidad de TEI (requests en vuelo
+y ciclo de trabajo: tras cada página duerme en proporción al tiempo que ocupó TEI).
+
+Los ingestors deben correr con EMBEDDING_MODEL_VERSION: tras el swap, el que quedó con el
+modelo viejo deja de escribir (ver model_registry.py) hasta desplegarlo con el nuevo
+(TEI_URL, EMBEDDING_MODEL_VERSION, EXPECTED_EMBEDDING_DIM). Los agregados por grupo se
+recalculan con el modelo nuevo; el catálogo de cursos hay que re-sincronizarlo.
+
+Uso: python -m ingestor.jobs.reembed --version e5-large-v1 --model-id intfloat/e5-large \\
+         --dim 1024 --tei-url http://tei-large:80 [--tei-share 0.5]
+"""
+
+import os
+import re
+import json
+import math
+import time
+import asyncio
+import logging
+import argparse
+from typing import Any, Dict, List, Optional
+
+import asyncpg
+from dotenv import load_dotenv
+
+from ingestor.core import init_connection
+from ingestor.tei_client import TEIClient
+from ingestor.chunking import CHUNK_COLUMNS, chunk_hash, chunk_text, mean_pool
+from ingestor.aggregates import GroupAggregates, parse_dimensions
+from ingestor.monitoring.search import ensure_ann_index, index_is_valid
+from ingestor.schema import CHUNKS_DDL, ensure_embedding_models_schema
+from ingestor.utils.pgvector_codec import to_float32_vector
+
+logger = logging.getLogger("reembed")
+
+PREV_COLUMN = "embedding_prev"
+PREV_CHUNKS_TABLE = "trabajador_chunks_prev"
+
+STAGING_TABLE = "reembed_staging"
+STAGING_COLUMNS = ("id_estable", "texto_md5", "embedding")
+
+CREATE_STAGING_SQL = f"""
+CREATE TEMP TABLE {STAGING_TABLE} (
+    id_estable text,
+    texto_md5 text,
+    embedding vector
+) ON COMMIT DROP;
+"""
+
+START_SQL = """
+INSERT INTO embedding_models (version, model_id, dim, status)
+VALUES ($1, $2, $3, 'backfilling')
+ON CONFLICT (version) DO NOTHING
+"""
+
+STATE_SQL = "SELECT status, checkpoint, rows_done, dim FROM embedding_models WHERE version = $1"
+
+CHECKPOINT_SQL = """
+UPDATE embedding_models SET checkpoint = $2, rows_done = rows_done + $3 WHERE version = $1
+"""
+
+STATUS_SQL = "UPDATE embedding_models SET status = $2, checkpoint = NULL WHERE version = $1"
+
+# Antes del LOCK TABLE: espera a las escrituras en curso (FOR SHARE en model_registry) y
+# mismo orden de locks que ellas (fila activa, después tablas), sin deadlock
+LOCK_ACTIVE_SQL = "SELECT version FROM embedding_models WHERE status = 'active' FOR UPDATE"
+
+RETIRE_ACTIVE_SQL = "UPDATE embedding_models SET status = 'retired' WHERE status = 'active'"
+
+ACTIVATE_SQL = """
+UPDATE embedding_models SET status = 'active', activated_at = now(), checkpoint = NULL WHERE version = $1
+"""
+
+
+def version_slug(version: str) -> str:
+    slug = re.sub(r"[^a-z0-9]+", "_", version.lower()).strip("_")
+    if not slug:
+        raise ValueError(f"versión de modelo inválida: {version}")
+    return slug
+
+
+class _DutyCycle:
+    """Limita la fracción de tiempo que el job ocupa TEI: tras `busy` s de trabajo duerme busy*(1-share)/share."""
+
+    def __init__(self, share: float):
+        self.share = min(max(share, 0.01), 1.0)
+
+    async def pause(self, busy: float):
+        if self.share < 1.0:
+            await asyncio.sleep(busy * (1 - self.share) / self.share)
+
+
+class ReembedJob:
+    def __init__(self, pool: asyncpg.Pool, tei_client: TEIClient, version: str, dim: int,
+                 model_id: Optional[str] = None, page_size: int = 256, tei_share: float = 0.5,
+                 chunk_max_tokens: int = 480, chunk_overlap_tokens: int = 64,
+                 swap_max_stale: int = 500, index_kind: Optional[str] = None):
+        self.pool = pool
+        self.tei_client = tei_client
+        self.version = version
+        self.dim = dim
+        self.model_id = model_id
+        self.page_size = page_size
+        self.throttle = _DutyCycle(tei_share)
+        self.chunk_max_tokens = chunk_max_tokens
+        self.chunk_overlap_tokens = chunk_overlap_tokens
+        self.swap_max_stale = swap_max_stale
+        self.index_kind = index_kind
+
+        slug = version_slug(version)
+        self.column = f"embedding_{slug}"
+        self.md5_column = f"embedding_{slug}_md5"
+        self.chunks_table = f"trabajador_chunks_{slug}"
+
+        self._backfill_sql = f"""
+SELECT id_estable, texto_unificado, md5(texto_unificado) AS texto_md5
+FROM trabajadores
+WHERE id_estable > $1
+ORDER BY id_estable
+LIMIT $2
+"""
+        self._stale_sql = f"""
+SELECT id_estable, texto_unificado, md5(texto_unificado) AS texto_md5
+FROM trabajadores
+WHERE id_estable > $1
+  AND ({self.column} IS NULL OR {self.md5_column} IS DISTINCT FROM md5(texto_unificado))
+ORDER BY id_estable
+LIMIT $2
+"""
+        self._apply_sql = f"""
+UPDATE trabajadores t
+SET {self.column} = s.embedding, {self.md5_column} = s.texto_md5
+FROM {STAGING_TABLE} s
+WHERE t.id_estable = s.id_estable
+"""
+
+    # ------------------------------------------
+    # PREPARACIÓN
+    # ------------------------------------------
+
+    async def _prepare(self) -> Dict[str, Any]:
+        await ensure_embedding_models_schema(self.pool)
+        async with self.pool.acquire() as conn:
+            await conn.execute(START_SQL, self.version, self.model_id, self.dim)
+            state = dict(await conn.fetchrow(STATE_SQL, self.version))
+            if state["dim"] != self.dim:
+                raise ValueError(f"la versión {self.version} ya existe con dim={state['dim']}")
+            if state["status"] in ("active", "retired"):
+                return state
+            # ADD COLUMN sin default: solo catálogo, no reescribe la tabla
+            await conn.execute(f"""
+ALTER TABLE trabajadores ADD COLUMN IF NOT EXISTS {self.column} vector({int(self.dim)});
+ALTER TABLE trabajadores ADD COLUMN IF NOT EXISTS {self.md5_column} text;
+""")
+            await conn.execute(CHUNKS_DDL.format(table=self.chunks_table, dim=int(self.dim)))
+        return state
+
+    # ------------------------------------------
+    # EMBEDDING (modelo nuevo, mismo chunking que la ingesta)
+    # ------------------------------------------
+
+    async def _embed_rows(self, rows) -> tuple:
+        passages = [
+            chunk_text(r["texto_unificado"] or " ", self.tei_client.tokens,
+                       self.chunk_max_tokens, self.chunk_overlap_tokens)
+            for r in rows
+        ]
+        flat = [p for ps in passages for p in ps]
+
+        start = time.perf_counter()
+        vectors = await self.tei_client.embed_batch(None, flat)
+        busy = time.perf_counter() - start
+        if len(vectors) != len(flat):
+            raise RuntimeError("TEI devolvió una cantidad de embeddings distinta a la solicitada")
+
+        records, chunk_records = [], []
+        pos = 0
+        for r, ps in zip(rows, passages):
+            vecs = [to_float32_vector(v, self.dim) for v in vectors[pos:pos + len(ps)]]
+            pos += len(ps)
+            emb = vecs[0] if len(vecs) == 1 else to_float32_vector(mean_pool(vecs), self.dim)
+            records.append((r["id_estable"], r["texto_md5"], emb))
+            if len(ps) > 1:
+                chunk_records.extend(
+                    (r["id_estable"], n, chunk_hash(p), v) for n, (p, v) in enumerate(zip(ps, vecs))
+                )
+        return records, chunk_records, busy
+
+    async def _write(self, conn: asyncpg.Connection, records: List[tuple], chunk_records: List[tuple]):
+        """Dentro de una transacción: COPY a staging + UPDATE de la columna sombra + chunks."""
+        await conn.execute(CREATE_STAGING_SQL)
+        await conn.copy_records_to_table(STAGING_TABLE, records=records, columns=STAGING_COLUMNS)
+        await conn.execute(self._apply_sql)
+        await conn.execute(f"DELETE FROM {self.chunks_table} WHERE id_estable = ANY($1)", [r[0] for r in records])
+        if chunk_records:
+            await conn.copy_records_to_table(self.chunks_table, records=chunk_records, columns=CHUNK_COLUMNS)
+
+    # ------------------------------------------
+    # FASES
+    # ------------------------------------------
+
+    async def _pass(self, sql: str, checkpoint: Optional[str], save_checkpoint: bool) -> int:
+        """Recorre por keyset desde `checkpoint` re-embebiendo lo que devuelve `sql`."""
+        last_id = checkpoint or ""
+        done = 0
+        while True:
+            async with self.pool.acquire() as conn:
+                rows = await conn.fetch(sql, last_id, self.page_size)
+            if not rows:
+                break
+
+            records, chunk_records, busy = await self._embed_rows(rows)
+            last_id = rows[-1]["id_estable"]
+            async with self.pool.acquire() as conn:
+                async with conn.transaction():
+                    await self._write(conn, records, chunk_records)
+                    if save_checkpoint:
+                        await conn.execute(CHECKPOINT_SQL, self.version, last_id, len(records))
+            done += len(records)
+
+            if done % (self.page_size * 20) < self.page_size:
+                logger.info(json.dumps({"event": "reembed_progress", "version": self.version,
+                                        "rows": done, "last_id": last_id}))
+            await self.throttle.pause(busy)
+            if len(rows) < self.page_size:
+                break
+        return done
+
+    async def backfill(self, checkpoint: Optional[str]) -> int:
+        return await self._pass(self._backfill_sql, checkpoint, save_checkpoint=True)
+
+    async def catch_up(self, max_passes: int = 10) -> int:
+        """Pasadas sobre filas nuevas/cambiadas hasta que una pasada toque <= swap_max_stale filas."""
+        total = 0
+        for _ in range(max_passes):
+            n = await self._pass(self._stale_sql, None, save_checkpoint=False)
+            total += n
+            logger.info(json.dumps({"event": "reembed_catch_up", "version": self.version, "rows": n}))
+            if n <= self.swap_max_stale:
+                break
+        return total
+
+    async def _current_index_kind(self) -> str:
+        async with self.pool.acquire() as conn:
+            names = {r["indexname"] for r in await conn.fetch(
+                "SELECT indexname FROM pg_indexes WHERE tablename = 'trabajadores'"
+            )}
+        for kind in ("hnsw", "ivfflat"):
+            if f"trabajadores_embedding_{kind}" in names:
+                return kind
+        return "hnsw"
+
+    async def swap(self, kind: str) -> int:
+        """
+        Transacción única: toma la fila del modelo activo (las escrituras de la ingesta la
+        validan en su transacción) y bloquea escrituras en trabajadores (las lecturas siguen), embebe
+        las filas que cambiaron desde el último catch-up y renombra todo. Si quedan más de
+        swap_max_stale filas pendientes aborta (la ingesta va más rápido que el catch-up).
+        """
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                await conn.execute(LOCK_ACTIVE_SQL)
+                await conn.execute("LOCK TABLE trabajadores, trabajador_chunks IN SHARE ROW EXCLUSIVE MODE")
+
+                stale = await conn.fetch(self._stale_sql, "", self.swap_max_stale + 1)
+                if len(stale) > self.swap_max_stale:
+                    raise RuntimeError(f"{len(stale)} filas pendientes al hacer el swap (máximo {self.swap_max_stale})")
+                if stale:
+                    records, chunk_records, _ = await self._embed_rows(stale)
+                    await self._write(conn, records, chunk_records)
+
+                new_index = f"trabajadores_{self.column}_{kind}"
+                if not await index_is_valid(conn, new_index):
+                    # INVALID (build interrumpido) o inexistente: no se promueve; run() lo reconstruye
+                    raise RuntimeError(f"el índice {new_index} no existe o quedó INVALID")
+
+                old_index = f"trabajadores_embedding_{kind}"
+                await conn.execute(f"""
+ALTER TABLE trabajadores DROP COLUMN IF EXISTS {PREV_COLUMN};
+DROP TABLE IF EXISTS {PREV_CHUNKS_TABLE};
+DROP INDEX IF EXISTS trabajadores_{PREV_COLUMN}_{kind};
+ALTER TABLE trabajadores RENAME COLUMN embedding TO {PREV_COLUMN};
+ALTER TABLE trabajadores RENAME COLUMN {self.column} TO embedding;
+ALTER TABLE trabajadores DROP COLUMN {self.md5_column};
+ALTER INDEX IF EXISTS {old_index} RENAME TO trabajadores_{PREV_COLUMN}_{kind};
+ALTER INDEX {new_index} RENAME TO {old_index};
+ALTER TABLE trabajador_chunks RENAME TO {PREV_CHUNKS_TABLE};
+ALTER TABLE {self.chunks_table} RENAME TO trabajador_chunks;
+""")
+                if await conn.fetchval("SELECT to_regclass('grupo_agregados') IS NOT NULL"):
+                    # las sumas del modelo anterior no sirven (otra dimensión): se recalculan tras el swap
+                    await conn.execute(f"""
+TRUNCATE grupo_agregados;
+ALTER TABLE grupo_agregados ALTER COLUMN sum_vec TYPE vector({int(self.dim)}),
+                            ALTER COLUMN sumsq_vec TYPE vector({int(self.dim)});
+""")
+                await conn.execute(RETIRE_ACTIVE_SQL)
+                await conn.execute(ACTIVATE_SQL, self.version)
+        return len(stale)
+
+    async def run(self) -> Dict[str, Any]:
+        start = time.time()
+        state = await self._prepare()
+        stats: Dict[str, Any] = {"version": self.version, "backfilled": 0, "caught_up": 0, "swap_rows": 0}
+
+        if state["status"] in ("active", "retired"):
+            logger.info(json.dumps({"event": "reembed_nothing_to_do", "version": self.version, "status": state["status"]}))
+            return stats
+
+        if state["status"] == "backfilling":
+            if state["checkpoint"]:
+                logger.info(json.dumps({"event": "reembed_resumed", "version": self.version,
+                                        "checkpoint": state["checkpoint"], "rows_done": state["rows_done"]}))
+            stats["backfilled"] = await self.backfill(state["checkpoint"])
+            async with self.pool.acquire() as conn:
+                await conn.execute(STATUS_SQL, self.version, "catching_up")
+
+        stats["caught_up"] = await self.catch_up()
+
+        # índice del mismo tipo que el actual, construido antes del swap: el swap solo lo renombra
+        kind = self.index_kind or await self._current_index_kind()
+        await ensure_ann_index(self.pool, kind=kind, column=self.column, drop_others=False)
+
+        for attempt in range(5):
+            try:
+                stats["swap_rows"] = await self.swap(kind)
+                break
+            except RuntimeError as e:
+                logger.warning(json.dumps({"event": "reembed_swap_retry", "attempt": attempt + 1, "error": str(e)}))
+                stats["caught_up"] += await self.catch_up(max_passes=1)
+                await ensure_ann_index(self.pool, kind=kind, column=self.column, drop_others=False)
+        else:
+            raise RuntimeError("no se pudo hacer el swap: la ingesta cambia filas más rápido que el catch-up")
+
+        # índice del modelo anterior: fuera de la transacción y sin bloquear
+        async with self.pool.acquire() as conn:
+            await conn.execute(f"DROP INDEX CONCURRENTLY IF EXISTS trabajadores_{PREV_COLUMN}_{kind}")
+            has_aggregates = await conn.fetchval("SELECT to_regclass('grupo_agregados') IS NOT NULL")
+            has_catalog = await conn.fetchval("SELECT to_regclass('catalogo_cursos') IS NOT NULL")
+        if has_aggregates:
+            spec = os.getenv("AGGREGATE_DIMENSIONS")
+            await GroupAggregates(parse_dimensions(spec) if spec else None).rebuild(self.pool)
+        if has_catalog:
+            # el catálogo se embebe desde su JSON de origen, que este job no conoce
+            logger.warning(json.dumps({"event": "reembed_catalog_stale",
+                                       "hint": "re-sincronizar con python -m ingestor.aggregates --catalog <archivo>"}))
+
+        stats["time_seconds"] = round(time.time() - start, 2)
+        logger.info(json.dumps({"event": "reembed_done", **stats}))
+        return stats
+
+
+async def main():
+    load_dotenv()
+    logging.basicConfig(
+        level=logging.INFO,
+        format='{"timestamp":"%(asctime)s","level":"%(levelname)s","message":%(message)s}'
+    )
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--version", required=True, help="etiqueta de la versión nueva (p. ej. e5-large-v1)")
+    parser.add_argument("--model-id", default=os.getenv("REEMBED_MODEL_ID"))
+    parser.add_argument("--dim", type=int, required=True)
+    parser.add_argument("--tei-url", default=os.getenv("REEMBED_TEI_URL"), required=not os.getenv("REEMBED_TEI_URL"))
+    parser.add_argument("--tei-share", type=float, default=float(os.getenv("REEMBED_TEI_SHARE", "0.5")),
+                        help="fracción de la capacidad de TEI que puede usar el job (0-1]")
+    parser.add_argument("--tei-max-in-flight", type=int, default=int(os.getenv("TEI_MAX_IN_FLIGHT", "4")),
+                        help="capacidad de TEI en requests concurrentes")
+    parser.add_argument("--tei-max-batch", type=int, default=int(os.getenv("TEI_MAX_BATCH", "32")))
+    parser.add_argument("--tei-max-batch-tokens", type=int, default=int(os.getenv("TEI_MAX_BATCH_TOKENS", "16384")))
+    parser.add_argument("--tei-max-input-tokens", type=int, default=int(os.getenv("TEI_MAX_INPUT_TOKENS", "512")))
+    parser.add_argument("--tokenizer-file", default=os.getenv("REEMBED_TOKENIZER_FILE"))
+    parser.add_argument("--page-size", type=int, default=256)
+    parser.add_argument("--chunk-max-tokens", type=int, default=int(os.getenv("CHUNK_MAX_TOKENS", "480")))
+    parser.add_argument("--chunk-overlap-tokens", type=int, default=int(os.getenv("CHUNK_OVERLAP_TOKENS", "64")))
+    parser.add_argument("--swap-max-stale", type=int, default=500)
+    parser.add_argument("--index-kind", choices=("hnsw", "ivfflat"), default=None)
+    args = parser.parse_args()
+
+    pool = await asyncpg.create_pool(
+        os.environ["DATABASE_URL"],
+        min_size=1,
+        max_size=2,
+        statement_cache_size=0,
+        max_cached_statement_lifetime=0,
+        max_cacheable_statement_size=0,
+        init=init_connection
+    )
+    tei_client = TEIClient(
+        base_url=args.tei_url,
+        max_batch=args.tei_max_batch,
+        max_batch_tokens=args.tei_max_batch_tokens,
+        max_input_tokens=args.tei_max_input_tokens,
+        tokenizer_file=args.tokenizer_file,
+        max_in_flight=max(1, math.floor(args.tei_max_in_flight * args.tei_share))
+    )
+    try:
+        job = ReembedJob(pool, tei_client, args.version, args.dim, model_id=args.model_id,
+                         page_size=args.page_size, tei_share=args.tei_share,
+                         chunk_max_tokens=args.chunk_max_tokens, chunk_overlap_tokens=args.chunk_overlap_tokens,
+                         swap_max_stale=args.swap_max_stale, index_kind=args.index_kind)
+        await job.run()
+    finally:
+        await tei_client.close()
+        await pool.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
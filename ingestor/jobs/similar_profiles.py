@@ -0,0 +1,382 @@
+# ingestor/jobs/similar_profiles.py
+"""
+Job batch: top-k de perfiles similares (coseno) para toda la base -> trabajadores_similares.
+
+ - lee los embeddings de `trabajadores` por keyset pagination a una matriz float32
+   normalizada en un archivo temporal; los workers la mapean con mmap (sin pickle
+   de la matriz ni copias por proceso)
+ - cada tarea toma un bloque de filas consulta y recorre la matriz en bloques de
+   columnas: memoria O(bloque_q x bloque_c), nunca la matriz N x N
+ - top-k incremental por bloque con argpartition
+ - paralelo entre cores con un ProcessPoolExecutor (BLAS en un hilo por worker)
+ - escritura bulk: modo completo = COPY a una tabla nueva + swap de nombres en una
+   transacción; modo incremental = DELETE + COPY solo de las filas recalculadas
+
+Incremental: recalcula las filas con updated_at > watermark y además las filas cuyo
+top-k puede verse afectado: las que tenían como vecino a una fila cambiada y las que
+ahora tienen una fila cambiada con score mayor a su k-ésimo vecino actual.
+
+Uso: python -m ingestor.jobs.similar_profiles [--incremental] [--k 20] [--workers 4]
+"""
+
+import os
+import json
+import time
+import asyncio
+import logging
+import argparse
+import datetime
+import tempfile
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+import asyncpg
+import numpy as np
+from dotenv import load_dotenv
+
+from ingestor.core import init_connection
+from ingestor.schema import ensure_similares_schema
+
+logger = logging.getLogger("similar_profiles")
+
+JOB_NAME = "similar_profiles"
+TABLE = "trabajadores_similares"
+COLUMNS = ("id_estable", "rank", "similar_id", "score")
+
+# mismo margen que HashIndex: updated_at = inicio de la transacción
+WATERMARK_OVERLAP = datetime.timedelta(seconds=60)
+
+LOAD_SQL = """
+SELECT id_estable, embedding, updated_at
+FROM trabajadores
+WHERE id_estable > $1 AND embedding IS NOT NULL
+ORDER BY id_estable
+LIMIT $2
+"""
+
+
+#############################################
+# CÓDIGO DEL WORKER (corre en procesos hijos)
+#############################################
+
+_MATRIX: Optional[np.ndarray] = None
+
+
+def _init_worker(path: str, rows: int, dim: int):
+    global _MATRIX
+    _MATRIX = np.memmap(path, dtype=np.float32, mode="r", shape=(rows, dim))
+
+
+def _topk_block(query_rows: np.ndarray, k: int, block_cols: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Top-k (sin la propia fila) de cada fila consulta contra toda la matriz."""
+    m = _MATRIX
+    q = np.asarray(m[query_rows])
+    nq = len(query_rows)
+
+    best_idx = np.empty((nq, 0), dtype=np.int64)
+    best_score = np.empty((nq, 0), dtype=np.float32)
+
+    for start in range(0, m.shape[0], block_cols):
+        block = np.asarray(m[start:start + block_cols])
+        scores = q @ block.T  # (nq, bloque)
+
+        # excluir la propia fila si cae en este bloque
+        local = query_rows - start
+        inside = (local >= 0) & (local < block.shape[0])
+        scores[np.nonzero(inside)[0], local[inside]] = -np.inf
+
+        if scores.shape[1] > k:
+            part = np.argpartition(scores, -k, axis=1)[:, -k:]
+        else:
+            part = np.broadcast_to(np.arange(scores.shape[1]), scores.shape)
+        cand_idx = np.concatenate([best_idx, part + start], axis=1)
+        cand_score = np.concatenate([best_score, np.take_along_axis(scores, part, axis=1)], axis=1)
+
+        if cand_idx.shape[1] > k:
+            keep = np.argpartition(cand_score, -k, axis=1)[:, -k:]
+            cand_idx = np.take_along_axis(cand_idx, keep, axis=1)
+            cand_score = np.take_along_axis(cand_score, keep, axis=1)
+        best_idx, best_score = cand_idx, cand_score
+
+    order = np.argsort(-best_score, axis=1)
+    return query_rows, np.take_along_axis(best_idx, order, axis=1), np.take_along_axis(best_score, order, axis=1)
+
+
+def _max_against(cols: np.ndarray, row_start: int, row_end: int) -> np.ndarray:
+    """Para las filas [row_start, row_end): score máximo contra las filas `cols`."""
+    m = _MATRIX
+    block = np.asarray(m[row_start:row_end])
+    scores = block @ np.asarray(m[cols]).T
+    # una fila no compite contra sí misma
+    own = (cols >= row_start) & (cols < row_end)
+    scores[cols[own] - row_start, np.nonzero(own)[0]] = -np.inf
+    return scores.max(axis=1)
+
+
+#############################################
+# JOB
+#############################################
+
+class SimilarProfilesJob:
+    def __init__(self, pool: asyncpg.Pool, k: int = 20, workers: Optional[int] = None,
+                 block_rows: int = 512, block_cols: int = 8192, page_size: int = 5000,
+                 tmp_dir: Optional[str] = None):
+        self.pool = pool
+        self.k = k
+        self.workers = workers or os.cpu_count() or 1
+        self.block_rows = block_rows
+        self.block_cols = block_cols
+        self.page_size = page_size
+        self.tmp_dir = tmp_dir
+
+        self.ids: List[str] = []
+        self.updated_at: List[datetime.datetime] = []
+        self.rows: Dict[str, int] = {}
+        self.dim = 0
+        self._path: Optional[str] = None
+
+    # ------------------------------------------
+    # CARGA
+    # ------------------------------------------
+
+    async def load(self):
+        """Keyset scan de trabajadores -> archivo float32 normalizado (no se mantiene en RAM)."""
+        start = time.time()
+        fd, self._path = tempfile.mkstemp(prefix="similares-", suffix=".f32", dir=self.tmp_dir)
+        last_id = ""
+
+        with os.fdopen(fd, "wb") as f:
+            while True:
+                async with self.pool.acquire() as conn:
+                    page = await conn.fetch(LOAD_SQL, last_id, self.page_size)
+                if not page:
+                    break
+
+                matrix = np.stack([np.asarray(r["embedding"], dtype=np.float32) for r in page])
+                norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+                norms[norms == 0] = 1.0
+                f.write((matrix / norms).astype(np.float32, copy=False).tobytes())
+
+                self.dim = matrix.shape[1]
+                for r in page:
+                    self.rows[r["id_estable"]] = len(self.ids)
+                    self.ids.append(r["id_estable"])
+                    self.updated_at.append(r["updated_at"])
+                last_id = page[-1]["id_estable"]
+
+        logger.info(json.dumps({
+            "event": "similar_profiles_loaded",
+            "rows": len(self.ids),
+            "dim": self.dim,
+            "time_seconds": round(time.time() - start, 2)
+        }))
+
+    def _executor(self) -> ProcessPoolExecutor:
+        # un hilo de BLAS por worker: el paralelismo lo da el pool de procesos
+        for var in ("OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS"):
+            os.environ.setdefault(var, "1")
+        return ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(self._path, len(self.ids), self.dim),
+        )
+
+    async def _map(self, executor: ProcessPoolExecutor, fn, tasks: List[tuple]) -> list:
+        loop = asyncio.get_running_loop()
+        return await asyncio.gather(*(loop.run_in_executor(executor, fn, *t) for t in tasks))
+
+    # ------------------------------------------
+    # CÓMPUTO
+    # ------------------------------------------
+
+    async def _compute(self, executor: ProcessPoolExecutor, query_rows: np.ndarray) -> List[tuple]:
+        tasks = [
+            (query_rows[i:i + self.block_rows], self.k, self.block_cols)
+            for i in range(0, len(query_rows), self.block_rows)
+        ]
+        return await self._map(executor, _topk_block, tasks)
+
+    def _records(self, results: List[tuple]):
+        for rows, idx, scores in results:
+            for r, neigh, sc in zip(rows, idx, scores):
+                id_estable = self.ids[r]
+                for rank, (j, s) in enumerate(zip(neigh, sc), start=1):
+                    if np.isfinite(s):
+                        yield (id_estable, rank, self.ids[j], float(s))
+
+    async def _affected_rows(self, executor: ProcessPoolExecutor, changed: np.ndarray) -> np.ndarray:
+        """Filas cambiadas + filas cuyo top-k guardado puede quedar desactualizado."""
+        changed_ids = [self.ids[r] for r in changed]
+
+        async with self.pool.acquire() as conn:
+            # tenían como vecino a una fila cambiada (su score ya no es válido)
+            stale = await conn.fetch(
+                f"SELECT DISTINCT id_estable FROM {TABLE} WHERE similar_id = ANY($1::text[])",
+                changed_ids
+            )
+            # score del k-ésimo vecino actual (o sin lista completa)
+            kth = await conn.fetch(
+                f"SELECT id_estable, min(score) AS kth, count(*) AS n FROM {TABLE} GROUP BY id_estable"
+            )
+
+        affected = set(changed.tolist())
+        affected.update(self.rows[r["id_estable"]] for r in stale if r["id_estable"] in self.rows)
+
+        threshold = np.full(len(self.ids), -np.inf, dtype=np.float32)  # sin lista -> recalcular
+        for r in kth:
+            row = self.rows.get(r["id_estable"])
+            if row is not None and r["n"] >= min(self.k, len(self.ids) - 1):
+                threshold[row] = r["kth"]
+
+        # alguna fila cambiada entra en su top-k: max(sim(i, cambiadas)) > k-ésimo score de i
+        tasks = [
+            (changed, start, min(start + self.block_cols, len(self.ids)))
+            for start in range(0, len(self.ids), self.block_cols)
+        ]
+        for (_, start, end), best in zip(tasks, await self._map(executor, _max_against, tasks)):
+            hits = np.nonzero(best > threshold[start:end])[0]
+            affected.update((hits + start).tolist())
+
+        return np.array(sorted(affected), dtype=np.int64)
+
+    # ------------------------------------------
+    # ESCRITURA
+    # ------------------------------------------
+
+    async def _write_full(self, results: List[tuple]):
+        new_table = f"{TABLE}_new"
+        async with self.pool.acquire() as conn:
+            await conn.execute(f"DROP TABLE IF EXISTS {new_table}")
+            await conn.execute(f"CREATE TABLE {new_table} (LIKE {TABLE} INCLUDING DEFAULTS)")
+            await conn.copy_records_to_table(new_table, records=self._records(results), columns=COLUMNS)
+            await conn.execute(f"ALTER TABLE {new_table} ADD PRIMARY KEY (id_estable, rank)")
+            await conn.execute(f"CREATE INDEX ON {new_table} (similar_id)")
+
+            # swap atómico: los lectores ven la tabla vieja o la nueva, nunca una a medio llenar
+            async with conn.transaction():
+                await conn.execute(f"DROP TABLE {TABLE}")
+                await conn.execute(f"ALTER TABLE {new_table} RENAME TO {TABLE}")
+                await conn.execute(
+                    f"ALTER INDEX {new_table}_pkey RENAME TO {TABLE}_pkey"
+                )
+                await conn.execute(
+                    f"ALTER INDEX {new_table}_similar_id_idx RENAME TO {TABLE}_similar_id"
+                )
+
+    async def _write_incremental(self, results: List[tuple]):
+        ids = [self.ids[r] for rows, _, _ in results for r in rows]
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                await conn.execute(f"DELETE FROM {TABLE} WHERE id_estable = ANY($1::text[])", ids)
+                # filas borradas de trabajadores
+                await conn.execute(
+                    f"DELETE FROM {TABLE} s WHERE NOT EXISTS "
+                    f"(SELECT 1 FROM trabajadores t WHERE t.id_estable = s.id_estable)"
+                )
+                await conn.copy_records_to_table(TABLE, records=self._records(results), columns=COLUMNS)
+
+    async def _get_watermark(self) -> Optional[datetime.datetime]:
+        async with self.pool.acquire() as conn:
+            return await conn.fetchval("SELECT watermark FROM batch_job_state WHERE job = $1", JOB_NAME)
+
+    async def _set_watermark(self, watermark: Optional[datetime.datetime]):
+        if watermark is None:
+            return
+        async with self.pool.acquire() as conn:
+            await conn.execute(
+                "INSERT INTO batch_job_state (job, watermark, updated_at) VALUES ($1, $2, now()) "
+                "ON CONFLICT (job) DO UPDATE SET watermark = EXCLUDED.watermark, updated_at = now()",
+                JOB_NAME, watermark
+            )
+
+    # ------------------------------------------
+    # EJECUCIÓN
+    # ------------------------------------------
+
+    async def run(self, incremental: bool = False) -> Dict[str, int]:
+        start = time.time()
+        await ensure_similares_schema(self.pool)
+
+        watermark = await self._get_watermark() if incremental else None
+        if incremental and watermark is None:
+            logger.info(json.dumps({"event": "similar_profiles_no_watermark", "mode": "full"}))
+            incremental = False
+
+        await self.load()
+        try:
+            if len(self.ids) < 2:
+                return {"rows": len(self.ids), "computed": 0}
+
+            new_watermark = max(self.updated_at)
+            executor = self._executor()
+            try:
+                if incremental:
+                    since = watermark - WATERMARK_OVERLAP
+                    changed = np.array(
+                        [i for i, ts in enumerate(self.updated_at) if ts > since], dtype=np.int64
+                    )
+                    if len(changed) == 0:
+                        await self._set_watermark(new_watermark)
+                        return {"rows": len(self.ids), "changed": 0, "computed": 0}
+                    query_rows = await self._affected_rows(executor, changed)
+                    results = await self._compute(executor, query_rows)
+                    await self._write_incremental(results)
+                    stats = {"rows": len(self.ids), "changed": len(changed), "computed": len(query_rows)}
+                else:
+                    query_rows = np.arange(len(self.ids), dtype=np.int64)
+                    results = await self._compute(executor, query_rows)
+                    await self._write_full(results)
+                    stats = {"rows": len(self.ids), "computed": len(query_rows)}
+            finally:
+                executor.shutdown(wait=True)
+
+            await self._set_watermark(new_watermark)
+        finally:
+            os.remove(self._path)
+
+        logger.info(json.dumps({
+            "event": "similar_profiles_done",
+            "mode": "incremental" if incremental else "full",
+            "k": self.k,
+            **stats,
+            "time_seconds": round(time.time() - start, 2)
+        }))
+        return stats
+
+
+async def main():
+    load_dotenv()
+    logging.basicConfig(
+        level=logging.INFO,
+        format='{"timestamp":"%(asctime)s","level":"%(levelname)s","message":%(message)s}'
+    )
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--incremental", action="store_true")
+    parser.add_argument("--k", type=int, default=int(os.getenv("SIMILAR_K", "20")))
+    parser.add_argument("--workers", type=int, default=int(os.getenv("SIMILAR_WORKERS", "0")) or None)
+    parser.add_argument("--block-rows", type=int, default=512)
+    parser.add_argument("--block-cols", type=int, default=8192)
+    args = parser.parse_args()
+
+    pool = await asyncpg.create_pool(
+        os.environ["DATABASE_URL"],
+        min_size=1,
+        max_size=2,
+        statement_cache_size=0,
+        max_cached_statement_lifetime=0,
+        max_cacheable_statement_size=0,
+        init=init_connection
+    )
+    try:
+        job = SimilarProfilesJob(pool, k=args.k, workers=args.workers,
+                                 block_rows=args.block_rows, block_cols=args.block_cols)
+        await job.run(incremental=args.incremental)
+    finally:
+        await pool.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
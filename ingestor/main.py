@@ -1,10 +1,17 @@
 import asyncio
 import asyncpg
+from aiohttp import web
 import logging
 import os
 from dotenv import load_dotenv
-from ingestor.core import configure_core, ingest_loop
+from ingestor.core import configure_core, ingest_loop, init_connection
 from ingestor.tei_client import TEIClient
+from ingestor.embedding_cache import EmbeddingCache
+from ingestor.utils.redis_client import get_redis, close_redis
+from ingestor.sources.http_session import close_http_session
+from ingestor.sources.merge_sources import close_sources
+from ingestor.monitoring.healt import create_app as create_health_app
+from ingestor.monitoring.metrics import monitor_event_loop
 
 load_dotenv()
 
@@ -23,6 +30,48 @@ async def main():
     CONCURRENCY = int(os.getenv("CONCURRENCY", "6"))
     TEI_MAX_BATCH = int(os.getenv("TEI_MAX_BATCH", "32"))
     TEI_TIMEOUT = int(os.getenv("TEI_TIMEOUT", "60"))
+    UPSERT_MODE = os.getenv("UPSERT_MODE", "copy")
+    HASH_INDEX_REFRESH_S = float(os.getenv("HASH_INDEX_REFRESH_S", "300"))
+    HASH_INDEX_FULL_RELOAD_S = float(os.getenv("HASH_INDEX_FULL_RELOAD_S", "3600"))
+    PIPELINE_QUEUE_SIZE = int(os.getenv("PIPELINE_QUEUE_SIZE", "4"))
+    SOURCE_CONCURRENCY = int(os.getenv("SOURCE_CONCURRENCY", "4"))
+    PREPARE_CONCURRENCY = int(os.getenv("PREPARE_CONCURRENCY", "1"))
+    EMBED_CONCURRENCY = int(os.getenv("EMBED_CONCURRENCY", str(CONCURRENCY)))
+    WRITE_CONCURRENCY = int(os.getenv("WRITE_CONCURRENCY", "2"))
+    TEI_MAX_BATCH_TOKENS = int(os.getenv("TEI_MAX_BATCH_TOKENS", "16384"))
+    TEI_MAX_INPUT_TOKENS = int(os.getenv("TEI_MAX_INPUT_TOKENS", "512"))
+    TEI_TARGET_LATENCY = float(os.getenv("TEI_TARGET_LATENCY", "1.0"))
+    TEI_TOKENIZER_FILE = os.getenv("TEI_TOKENIZER_FILE")
+    TEI_MAX_IN_FLIGHT = int(os.getenv("TEI_MAX_IN_FLIGHT", "4"))
+    CHUNKING_ENABLED = os.getenv("CHUNKING_ENABLED", "true").lower() in ("1", "true", "yes")
+    CHUNK_MAX_TOKENS = int(os.getenv("CHUNK_MAX_TOKENS", "480"))
+    CHUNK_OVERLAP_TOKENS = int(os.getenv("CHUNK_OVERLAP_TOKENS", "64"))
+    TEXT_TEMPLATES_FILE = os.getenv("TEXT_TEMPLATES_FILE") or None
+    TEXT_TOKEN_BUDGET = int(os.getenv("TEXT_TOKEN_BUDGET", str(CHUNK_MAX_TOKENS)))  # cabe en un solo pasaje
+    TRIGGER_HTTP_PORT = int(os.getenv("TRIGGER_HTTP_PORT", "0"))
+    TRIGGER_TOKEN = os.getenv("TRIGGER_TOKEN") or None
+    TRIGGER_PG_CHANNEL = os.getenv("TRIGGER_PG_CHANNEL") or None
+    TRIGGER_PG_DSN = os.getenv("TRIGGER_PG_DSN") or None
+    VECTOR_SNAPSHOT_DIR = os.getenv("VECTOR_SNAPSHOT_DIR") or None
+    AGGREGATES_ENABLED = os.getenv("AGGREGATES_ENABLED", "false").lower() in ("1", "true", "yes")
+    AGGREGATE_DIMENSIONS = os.getenv("AGGREGATE_DIMENSIONS") or None
+    TEI_MODEL_ID = os.getenv("TEI_MODEL_ID", "intfloat/e5-small")
+    EMBED_CACHE_SIZE = int(os.getenv("EMBED_CACHE_SIZE", "50000"))
+    EMBED_CACHE_TTL = int(os.getenv("EMBED_CACHE_TTL", str(60 * 60 * 24 * 7)))
+    INGEST_HEALTH_PORT = int(os.getenv("INGEST_HEALTH_PORT", "9001"))  # 0 = sin /health ni /metrics
+    # activarla cambia id_estable de parte de los registros: ver la migración en ingestor/identity.py
+    IDENTITY_RESOLUTION = os.getenv("IDENTITY_RESOLUTION", "false").lower() in ("1", "true", "yes")
+    IDENTITY_SOURCE_PRIORITY = os.getenv("IDENTITY_SOURCE_PRIORITY", "api1,api2,drive")
+    IDENTITY_CACHE_SIZE = int(os.getenv("IDENTITY_CACHE_SIZE", "200000"))
+    EMBEDDING_MODEL_VERSION = os.getenv("EMBEDDING_MODEL_VERSION") or None
+    WORK_QUEUE_ENABLED = os.getenv("WORK_QUEUE_ENABLED", "false").lower() in ("1", "true", "yes")
+    WORK_QUEUE_CLAIM_IDLE_S = float(os.getenv("WORK_QUEUE_CLAIM_IDLE_S", "60"))
+    WORK_QUEUE_MAX_FAILURES = int(os.getenv("WORK_QUEUE_MAX_FAILURES", "3"))
+    SHARD_COUNT = int(os.getenv("SHARD_COUNT", "0"))  # >1 = multi-worker coordinado por Redis
+    WORKER_ID = os.getenv("WORKER_ID") or None
+    SHARD_LEASE_TTL_S = float(os.getenv("SHARD_LEASE_TTL_S", "30"))
+    SOURCE_LEASE_TTL_S = float(os.getenv("SOURCE_LEASE_TTL_S", "120"))
+    SOURCE_OWNER_TTL_S = float(os.getenv("SOURCE_OWNER_TTL_S", "86400"))
 
     if not DATABASE_URL:
         raise RuntimeError("DATABASE_URL no configurada")
@@ -36,25 +85,87 @@ async def main():
         concurrency=CONCURRENCY,
         tei_max_batch=TEI_MAX_BATCH,
         tei_timeout=TEI_TIMEOUT,
+        upsert_mode=UPSERT_MODE,
+        hash_index_refresh_s=HASH_INDEX_REFRESH_S,
+        hash_index_full_reload_s=HASH_INDEX_FULL_RELOAD_S,
+        pipeline_queue_size=PIPELINE_QUEUE_SIZE,
+        source_concurrency=SOURCE_CONCURRENCY,
+        prepare_concurrency=PREPARE_CONCURRENCY,
+        embed_concurrency=EMBED_CONCURRENCY,
+        write_concurrency=WRITE_CONCURRENCY,
+        chunking_enabled=CHUNKING_ENABLED,
+        chunk_max_tokens=CHUNK_MAX_TOKENS,
+        chunk_overlap_tokens=CHUNK_OVERLAP_TOKENS,
+        trigger_http_port=TRIGGER_HTTP_PORT,
+        trigger_token=TRIGGER_TOKEN,
+        trigger_pg_channel=TRIGGER_PG_CHANNEL,
+        trigger_pg_dsn=TRIGGER_PG_DSN,
+        vector_snapshot_dir=VECTOR_SNAPSHOT_DIR,
+        aggregates_enabled=AGGREGATES_ENABLED,
+        aggregate_dimensions=AGGREGATE_DIMENSIONS,
+        identity_resolution=IDENTITY_RESOLUTION,
+        identity_source_priority=IDENTITY_SOURCE_PRIORITY,
+        identity_cache_size=IDENTITY_CACHE_SIZE,
+        embedding_model_version=EMBEDDING_MODEL_VERSION,
+        embedding_model_id=TEI_MODEL_ID,
+        text_templates_file=TEXT_TEMPLATES_FILE,
+        text_token_budget=TEXT_TOKEN_BUDGET,
+        work_queue_enabled=WORK_QUEUE_ENABLED,
+        work_queue_claim_idle_s=WORK_QUEUE_CLAIM_IDLE_S,
+        work_queue_max_failures=WORK_QUEUE_MAX_FAILURES,
+        shard_count=SHARD_COUNT,
+        worker_id=WORKER_ID,
+        shard_lease_ttl_s=SHARD_LEASE_TTL_S,
+        source_lease_ttl_s=SOURCE_LEASE_TTL_S,
+        source_owner_ttl_s=SOURCE_OWNER_TTL_S,
     )
 
     pool = await asyncpg.create_pool(
     DATABASE_URL,
     statement_cache_size=0,
     max_cached_statement_lifetime=0,
-    max_cacheable_statement_size=0
+    max_cacheable_statement_size=0,
+    init=init_connection
 )
 
+    embedding_cache = EmbeddingCache(
+        model_id=TEI_MODEL_ID,
+        max_items=EMBED_CACHE_SIZE,
+        redis=get_redis(),
+        ttl=EMBED_CACHE_TTL,
+    )
+
     tei_client = TEIClient(
         base_url=TEI_URL,
         max_batch=TEI_MAX_BATCH,
-        timeout=TEI_TIMEOUT
+        timeout=TEI_TIMEOUT,
+        cache=embedding_cache,
+        max_batch_tokens=TEI_MAX_BATCH_TOKENS,
+        target_latency=TEI_TARGET_LATENCY,
+        tokenizer_file=TEI_TOKENIZER_FILE,
+        max_input_tokens=TEI_MAX_INPUT_TOKENS,
+        max_in_flight=TEI_MAX_IN_FLIGHT
     )
 
+    # /health + /metrics (target de prometheus.yml) y medición del lag del event loop
+    health_runner = None
+    if INGEST_HEALTH_PORT:
+        health_runner = web.AppRunner(create_health_app())
+        await health_runner.setup()
+        await web.TCPSite(health_runner, "0.0.0.0", INGEST_HEALTH_PORT).start()
+    loop_monitor = asyncio.create_task(monitor_event_loop())
+
     try:
         await ingest_loop(pool, tei_client)  # type: ignore
     finally:
+        loop_monitor.cancel()
+        if health_runner is not None:
+            await health_runner.cleanup()
         await pool.close()  # type: ignore
+        await tei_client.close()
+        await close_sources()
+        await close_http_session()
+        await close_redis()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,99 @@
+# ingestor/model_registry.py
+"""
+Versión del modelo de embeddings activa para `trabajadores.embedding` (tabla embedding_models).
+
+Durante una migración (ingestor/jobs/reembed.py) la ingesta sigue escribiendo con el
+modelo activo; al hacer el swap el job marca la versión nueva como activa. Un ingestor
+configurado con otra versión deja de escribir (no mezcla vectores de dos modelos en la
+misma columna) hasta que se despliega con el modelo nuevo: con la cola de trabajo lo
+encolado espera, sin ella las fuentes no se confirman y el ciclo siguiente lo vuelve a traer.
+
+`ok()` se consulta cada check_interval y solo sirve para dejar de leer/traer trabajo: cada
+escritura vuelve a validar la versión dentro de su transacción (`check_write`, FOR SHARE
+sobre la fila activa). El swap toma esa fila FOR UPDATE antes de renombrar columnas, así
+espera a las escrituras en curso y las posteriores ven la versión nueva y abortan.
+"""
+
+import json
+import time
+import logging
+from typing import Any, Dict, Optional
+
+import asyncpg
+
+logger = logging.getLogger("model_registry")
+
+ACTIVE_SQL = "SELECT version, model_id, dim FROM embedding_models WHERE status = 'active'"
+
+# Primer arranque con versión configurada: queda registrada como activa
+BOOTSTRAP_SQL = """
+INSERT INTO embedding_models (version, model_id, dim, status, activated_at)
+SELECT $1, $2, $3, 'active', now()
+WHERE NOT EXISTS (SELECT 1 FROM embedding_models WHERE status = 'active')
+ON CONFLICT (version) DO NOTHING
+"""
+
+# Dentro de la transacción de escritura: bloquea el swap hasta el commit
+ACTIVE_FOR_WRITE_SQL = "SELECT version FROM embedding_models WHERE status = 'active' FOR SHARE"
+
+
+class ModelVersionMismatch(RuntimeError):
+    """La versión activa cambió: el batch no se escribe (queda para el redeploy)."""
+
+
+async def active_model(conn: asyncpg.Connection) -> Optional[Dict[str, Any]]:
+    row = await conn.fetchrow(ACTIVE_SQL)
+    return dict(row) if row else None
+
+
+class ModelVersionGate:
+    def __init__(self, version: str, check_interval: float = 30):
+        self.version = version
+        self.check_interval = check_interval
+        self._ok = True
+        self._checked_at = 0.0
+
+    async def bootstrap(self, pool: asyncpg.Pool, model_id: Optional[str], dim: int):
+        async with pool.acquire() as conn:
+            await conn.execute(BOOTSTRAP_SQL, self.version, model_id, dim)
+        self._checked_at = 0.0
+
+    async def ok(self, pool: asyncpg.Pool) -> bool:
+        """True si la versión configurada es la activa (consulta la BD cada check_interval)."""
+        now = time.monotonic()
+        if now - self._checked_at < self.check_interval:
+            return self._ok
+        self._checked_at = now
+
+        async with pool.acquire() as conn:
+            active = await active_model(conn)
+        self._ok = active is None or active["version"] == self.version
+        if not self._ok:
+            logger.warning(json.dumps({
+                "event": "embedding_model_mismatch",
+                "configured": self.version,
+                "active": active["version"],
+                "active_model_id": active["model_id"],
+                "active_dim": active["dim"]
+            }))
+        return self._ok
+
+    async def check_write(self, conn: asyncpg.Connection):
+        """
+        Valida la versión activa dentro de la transacción de escritura (antes del upsert).
+        Si un swap confirmó mientras esperábamos el lock, la fila releída ya no es 'active':
+        se consulta de nuevo para ver la versión nueva.
+        """
+        row = await conn.fetchrow(ACTIVE_FOR_WRITE_SQL)
+        if row is None:
+            row = await conn.fetchrow(ACTIVE_FOR_WRITE_SQL)
+        if row is not None and row["version"] != self.version:
+            self._ok = False
+            self._checked_at = time.monotonic()
+            logger.warning(json.dumps({
+                "event": "embedding_model_mismatch",
+                "configured": self.version,
+                "active": row["version"],
+                "stage": "write"
+            }))
+            raise ModelVersionMismatch(f"modelo activo {row['version']}, configurado {self.version}")
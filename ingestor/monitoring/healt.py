@@ -1,24 +1,33 @@
-# ingestor/src/health.py
+# ingestor/monitoring/healt.py
 from aiohttp import web
-import asyncio
-import os
 import json
+import time
+
+from ingestor.monitoring.metrics import CONTENT_TYPE_LATEST, metrics_endpoint
+
+STARTED_AT = time.time()
+
 
 async def health_handler(request):
-    return web.Response(text=json.dumps({"status":"ok"}), content_type="application/json")
+    return web.Response(
+        text=json.dumps({"status": "ok", "uptime_seconds": round(time.time() - STARTED_AT, 1)}),
+        content_type="application/json"
+    )
+
+
+async def metrics_handler(request):
+    # CONTENT_TYPE_LATEST incluye "; charset=...": aiohttp no lo acepta en content_type
+    return web.Response(body=metrics_endpoint(), headers={"Content-Type": CONTENT_TYPE_LATEST})
+
+
+def add_health_routes(app: web.Application):
+    app.router.add_get("/health", health_handler)
+    app.router.add_get("/metrics", metrics_handler)
+
 
 def create_app():
     app = web.Application()
-    app.router.add_get("/health", health_handler)
-    # optionally add /metrics endpoint by importing metrics
-    try:
-        from ingestor.metrics import metrics_endpoint
-        async def metrics_handler(request):
-            from prometheus_client import generate_latest, CONTENT_TYPE_LATEST
-            return web.Response(body=generate_latest(), content_type=CONTENT_TYPE_LATEST)
-        app.router.add_get("/metrics", metrics_handler)
-    except Exception:
-        pass
+    add_health_routes(app)
     return app
 
 # to run: web.run_app(create_app(), host="0.0.0.0", port=9001)
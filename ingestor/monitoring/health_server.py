@@ -1,6 +1,7 @@
-# ingestor/src/health_server.py
+# ingestor/monitoring/health_server.py
+# Servidor standalone; ingestor.main ya levanta /health y /metrics en INGEST_HEALTH_PORT.
 from aiohttp import web
-from ingestor.health import create_app
+from ingestor.monitoring.healt import create_app
 
 if __name__ == "__main__":
     web.run_app(create_app(), host="0.0.0.0", port=int(__import__("os").environ.get("INGEST_HEALTH_PORT", "9001")))
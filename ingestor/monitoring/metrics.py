@@ -1,12 +1,82 @@
-# ingestor/src/metrics.py
+# ingestor/monitoring/metrics.py
+"""
+Métricas Prometheus del ingestor.
+Permiten ver cuál es el cuello de botella (fuentes, TEI o Postgres):
+ - histogramas por etapa del pipeline, por fuente, por sub-batch de TEI y por upsert
+ - gauges de profundidad de colas, ocupación de workers/semáforos y ratio de registros sin cambios
+ - lag del event loop
+"""
+
+import asyncio
+
 from prometheus_client import Counter, Histogram, Gauge, generate_latest, CONTENT_TYPE_LATEST
-from prometheus_client import Summary
+
+# buckets pensados para operaciones de ms a decenas de segundos
+_SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
 
 BATCHES_PROCESSED = Counter("ingestor_batches_processed_total", "Total batches processed")
 RECORDS_PROCESSED = Counter("ingestor_records_processed_total", "Total records processed")
-BATCH_PROCESS_SECONDS = Histogram("ingestor_batch_process_seconds", "Seconds per batch")
-TEI_CALLS = Counter("ingestor_tei_calls_total", "Total TEI calls")
+BATCH_PROCESS_SECONDS = Histogram("ingestor_batch_process_seconds", "Seconds per batch",
+                                  buckets=_SECONDS_BUCKETS)
+TEI_CALLS = Counter("ingestor_tei_calls_total", "Total TEI calls", ["outcome"])
+
+# --- pipeline ---
+STAGE_SECONDS = Histogram("ingestor_stage_seconds", "Seconds per item in each pipeline stage",
+                          ["stage"], buckets=_SECONDS_BUCKETS)
+STAGE_ERRORS = Counter("ingestor_stage_errors_total", "Unhandled errors per pipeline stage", ["stage"])
+STAGE_BUSY = Gauge("ingestor_stage_busy_workers", "Workers currently processing an item", ["pipeline", "stage"])
+QUEUE_DEPTH = Gauge("ingestor_queue_depth", "Items waiting in each pipeline queue", ["pipeline", "queue"])
+
+# --- fuentes ---
+SOURCE_FETCH_SECONDS = Histogram("ingestor_source_fetch_seconds", "Seconds to fetch one page per source",
+                                 ["source"], buckets=_SECONDS_BUCKETS)
+SOURCE_RECORDS = Counter("ingestor_source_records_total", "Records fetched per source", ["source"])
+SOURCE_ERRORS = Counter("ingestor_source_errors_total", "Fetch errors/timeouts per source", ["source"])
+
+# --- diff / cambios ---
+HASH_INDEX_SYNC_SECONDS = Histogram("ingestor_hash_index_sync_seconds", "Seconds to sync the hash index with the DB",
+                                    ["mode"], buckets=_SECONDS_BUCKETS)
+RECORDS_SKIPPED = Counter("ingestor_records_skipped_total", "Records skipped because hash_completo did not change",
+                          ["source"])
+SKIP_RATIO = Gauge("ingestor_skip_ratio", "Share of unchanged records in the last cycle per source", ["source"])
+CYCLE_SECONDS = Histogram("ingestor_cycle_seconds", "Seconds per ingest cycle per source", ["source"],
+                          buckets=_SECONDS_BUCKETS)
+
+# --- TEI ---
+TEI_REQUEST_SECONDS = Histogram("ingestor_tei_request_seconds", "Latency of each TEI sub-batch request",
+                                buckets=_SECONDS_BUCKETS)
+TEI_SUBBATCH_TEXTS = Histogram("ingestor_tei_subbatch_texts", "Texts per TEI sub-batch",
+                               buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256))
+TEI_IN_FLIGHT = Gauge("ingestor_tei_in_flight", "TEI requests in flight (semaphore occupancy)")
+TEI_TOKEN_BUDGET = Gauge("ingestor_tei_token_budget", "Current adaptive token budget per TEI request")
+EMBED_CACHE_LOOKUPS = Counter("ingestor_embed_cache_lookups_total", "Embedding cache lookups", ["result"])
+
+# --- Postgres ---
+UPSERT_SECONDS = Histogram("ingestor_upsert_seconds", "Seconds per batch upsert", ["mode"],
+                           buckets=_SECONDS_BUCKETS)
+
+# --- cola de trabajo (Redis Streams) ---
+WORK_QUEUE_MESSAGES = Counter("ingestor_work_queue_messages_total", "Work queue messages by outcome",
+                              ["outcome"])  # enqueued | acked | reclaimed | failed | dead
+WORK_QUEUE_PENDING = Gauge("ingestor_work_queue_pending", "Delivered but unacknowledged messages in owned streams")
+WORK_QUEUE_LENGTH = Gauge("ingestor_work_queue_length", "Messages stored in owned streams")
+
+# --- event loop ---
+EVENT_LOOP_LAG = Gauge("ingestor_event_loop_lag_seconds", "Last measured event loop lag")
+EVENT_LOOP_LAG_HIST = Histogram("ingestor_event_loop_lag_hist_seconds", "Event loop lag",
+                                buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 5))
+
+
+async def monitor_event_loop(interval: float = 0.5):
+    """Mide cuánto tarda el loop en despertar un sleep: CPU-bound o llamadas bloqueantes lo delatan."""
+    loop = asyncio.get_running_loop()
+    while True:
+        start = loop.time()
+        await asyncio.sleep(interval)
+        lag = max(0.0, loop.time() - start - interval)
+        EVENT_LOOP_LAG.set(lag)
+        EVENT_LOOP_LAG_HIST.observe(lag)
+
 
 def metrics_endpoint():
-    from prometheus_client import generate_latest
     return generate_latest()
@@ -0,0 +1,249 @@
+# ingestor/monitoring/search.py
+"""
+Búsqueda semántica de trabajadores:
+  consulta en lenguaje natural -> embedding (TEIClient, con LRU de consultas)
+  -> KNN en pgvector (distancia coseno) con filtros JSONB opcionales -> perfiles rankeados.
+Incluye la gestión de índices ANN (HNSW / IVFFlat) sobre trabajadores.embedding
+y el ajuste por request de hnsw.ef_search / ivfflat.probes.
+"""
+
+import re
+import json
+import time
+import logging
+from typing import Any, Dict, List, Optional
+
+import asyncpg
+from aiohttp import web
+
+from ingestor.tei_client import TEIClient
+from ingestor.utils.pgvector_codec import to_float32_vector
+
+logger = logging.getLogger("search")
+
+_IDENT_RE = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+
+MAX_K = 200
+
+# hnsw.iterative_scan / ivfflat.iterative_scan existen desde pgvector 0.8
+ITERATIVE_SCAN_VERSION = (0, 8)
+
+INDEX_VALID_SQL = """
+SELECT i.indisvalid
+FROM pg_index i
+JOIN pg_class c ON c.oid = i.indexrelid
+WHERE c.relname = $1
+"""
+
+
+def _ident(name: str) -> str:
+    if not _IDENT_RE.match(name):
+        raise ValueError(f"identificador SQL inválido: {name}")
+    return name
+
+
+def _version_tuple(version: str):
+    return tuple(int(p) for p in re.findall(r"\d+", version)[:3])
+
+
+#############################################
+# ÍNDICES ANN
+#############################################
+
+async def index_is_valid(conn: asyncpg.Connection, name: str) -> Optional[bool]:
+    """None si el índice no existe; False si quedó INVALID (CREATE CONCURRENTLY fallido)."""
+    return await conn.fetchval(INDEX_VALID_SQL, name)
+
+
+async def ensure_ann_index(pool: asyncpg.Pool, kind: str = "hnsw", table: str = "trabajadores",
+                           m: int = 16, ef_construction: int = 64, lists: Optional[int] = None,
+                           drop_others: bool = True, column: str = "embedding") -> str:
+    """
+    Crea (si no existe) el índice ANN de `table.column` para distancia coseno.
+    CONCURRENTLY: no bloquea la ingesta mientras se construye. Un índice INVALID (build
+    concurrente interrumpido) no sirve para consultas y IF NOT EXISTS lo daría por bueno:
+    se borra y se reconstruye.
+    """
+    table = _ident(table)
+    column = _ident(column)
+    if kind not in ("hnsw", "ivfflat"):
+        raise ValueError(f"tipo de índice inválido: {kind}")
+
+    name = f"{table}_{column}_{kind}"
+    other = f"{table}_{column}_{'ivfflat' if kind == 'hnsw' else 'hnsw'}"
+
+    async with pool.acquire() as conn:
+        if kind == "hnsw":
+            options = f"m = {int(m)}, ef_construction = {int(ef_construction)}"
+        else:
+            if lists is None:
+                # recomendación de pgvector: filas/1000 (hasta 1M filas), sqrt(filas) por encima
+                rows = await conn.fetchval(f"SELECT count(*) FROM {table}")
+                lists = max(10, rows // 1000 if rows <= 1_000_000 else int(rows ** 0.5))
+            options = f"lists = {int(lists)}"
+
+        start = time.time()
+        if await index_is_valid(conn, name) is False:
+            logger.warning(json.dumps({"event": "ann_index_invalid", "index": name}))
+            await conn.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
+        await conn.execute(
+            f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON {table} "
+            f"USING {kind} ({column} vector_cosine_ops) WITH ({options})"
+        )
+        if drop_others:
+            await conn.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {other}")
+
+    logger.info(json.dumps({
+        "event": "ann_index_ready",
+        "index": name,
+        "options": options,
+        "time_seconds": round(time.time() - start, 2)
+    }))
+    return name
+
+
+#############################################
+# SERVICIO DE BÚSQUEDA
+#############################################
+
+class SearchService:
+    def __init__(self, pool: asyncpg.Pool, tei_client: TEIClient, table: str = "trabajadores",
+                 default_k: int = 10, default_ef_search: Optional[int] = None,
+                 default_probes: Optional[int] = None, query_prefix: str = "",
+                 expected_dim: Optional[int] = None):
+        self.pool = pool
+        self.tei_client = tei_client
+        self.table = _ident(table)
+        self.default_k = default_k
+        self.default_ef_search = default_ef_search
+        self.default_probes = default_probes
+        self.query_prefix = query_prefix
+        self.expected_dim = expected_dim
+        self.iterative_scan: Optional[bool] = None  # se resuelve en start()
+
+        self._knn_sql = f"""
+SELECT id_estable, json_data, 1 - (embedding <=> $1) AS score
+FROM {self.table}
+WHERE embedding IS NOT NULL
+  AND ($3::jsonb IS NULL OR json_data @> $3::jsonb)
+ORDER BY embedding <=> $1
+LIMIT $2
+"""
+
+    async def start(self):
+        """Una vez al arrancar: versión de pgvector (iterative_scan solo desde 0.8)."""
+        async with self.pool.acquire() as conn:
+            version = await conn.fetchval("SELECT extversion FROM pg_extension WHERE extname = 'vector'")
+        self.iterative_scan = version is not None and _version_tuple(version) >= ITERATIVE_SCAN_VERSION
+        logger.info(json.dumps({"event": "search_started", "pgvector": version,
+                                "iterative_scan": self.iterative_scan}))
+
+    async def embed_query(self, query: str):
+        # TEIClient con EmbeddingCache sin Redis = LRU de consultas en memoria
+        embeddings = await self.tei_client.embed_batch(None, [self.query_prefix + query])
+        return to_float32_vector(embeddings[0], self.expected_dim)
+
+    async def knn(self, vector, k: int, filters: Optional[Dict[str, Any]] = None,
+                  ef_search: Optional[int] = None, probes: Optional[int] = None) -> List[Dict[str, Any]]:
+        ef_search = ef_search or self.default_ef_search
+        probes = probes or self.default_probes
+        if self.iterative_scan is None:
+            await self.start()
+
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                # set_config(..., true) == SET LOCAL: solo vale para esta transacción
+                if ef_search:
+                    await conn.execute("SELECT set_config('hnsw.ef_search', $1, true)", str(int(ef_search)))
+                if probes:
+                    await conn.execute("SELECT set_config('ivfflat.probes', $1, true)", str(int(probes)))
+                if filters and self.iterative_scan:
+                    # pgvector >= 0.8: seguir escaneando el índice si el filtro descarta candidatos
+                    await conn.execute("SELECT set_config('hnsw.iterative_scan', 'relaxed_order', true)")
+                    await conn.execute("SELECT set_config('ivfflat.iterative_scan', 'relaxed_order', true)")
+
+                rows = await conn.fetch(self._knn_sql, vector, k, json.dumps(filters) if filters else None)
+
+        return [
+            {
+                "id_estable": r["id_estable"],
+                "score": round(float(r["score"]), 6),
+                "json_data": json.loads(r["json_data"]) if isinstance(r["json_data"], str) else r["json_data"],
+            }
+            for r in rows
+        ]
+
+    async def search(self, query: str, k: Optional[int] = None, filters: Optional[Dict[str, Any]] = None,
+                     ef_search: Optional[int] = None, probes: Optional[int] = None) -> Dict[str, Any]:
+        k = max(1, min(int(k or self.default_k), MAX_K))
+
+        start = time.perf_counter()
+        vector = await self.embed_query(query)
+        t_embed = time.perf_counter()
+        results = await self.knn(vector, k, filters, ef_search, probes)
+        t_knn = time.perf_counter()
+
+        return {
+            "query": query,
+            "k": k,
+            "results": results,
+            "timings_ms": {
+                "embed": round((t_embed - start) * 1000, 2),
+                "knn": round((t_knn - t_embed) * 1000, 2),
+                "total": round((t_knn - start) * 1000, 2),
+            },
+        }
+
+
+#############################################
+# API HTTP
+#############################################
+
+def _int_or_none(value) -> Optional[int]:
+    return int(value) if value not in (None, "") else None
+
+
+def add_search_routes(app: web.Application, service: SearchService):
+    async def search_handler(request: web.Request):
+        try:
+            if request.method == "POST":
+                body = await request.json()
+            else:
+                body = dict(request.query)
+                body["query"] = body.pop("q", body.get("query"))
+                if body.get("filters"):
+                    body["filters"] = json.loads(body["filters"])
+        except ValueError:
+            return web.json_response({"error": "JSON inválido"}, status=400)
+        if not isinstance(body, dict):
+            return web.json_response({"error": "el cuerpo debe ser un objeto JSON"}, status=400)
+
+        query = (body.get("query") or "").strip()
+        if not query:
+            return web.json_response({"error": "query requerido"}, status=400)
+
+        filters = body.get("filters")
+        if filters is not None and not isinstance(filters, dict):
+            return web.json_response({"error": "filters debe ser un objeto JSON"}, status=400)
+
+        try:
+            result = await service.search(
+                query,
+                k=_int_or_none(body.get("k")),
+                filters=filters,
+                ef_search=_int_or_none(body.get("ef_search")),
+                probes=_int_or_none(body.get("probes")),
+            )
+        except ValueError as e:
+            return web.json_response({"error": str(e)}, status=400)
+
+        return web.json_response(result)
+
+    app.router.add_get("/search", search_handler)
+    app.router.add_post("/search", search_handler)
+
+
+def create_search_app(service: SearchService) -> web.Application:
+    app = web.Application()
+    add_search_routes(app, service)
+    return app
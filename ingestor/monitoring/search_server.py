@@ -0,0 +1,76 @@
+# ingestor/monitoring/search_server.py
+import os
+import logging
+
+import asyncpg
+from aiohttp import web
+from dotenv import load_dotenv
+
+from ingestor.core import init_connection
+from ingestor.tei_client import TEIClient
+from ingestor.embedding_cache import EmbeddingCache
+from ingestor.monitoring.search import SearchService, create_search_app, ensure_ann_index
+
+load_dotenv()
+
+
+async def build_app() -> web.Application:
+    database_url = os.environ["DATABASE_URL"]
+    index_kind = os.getenv("SEARCH_INDEX_KIND", "hnsw")  # hnsw | ivfflat | none
+
+    pool = await asyncpg.create_pool(
+        database_url,
+        min_size=1,
+        max_size=int(os.getenv("SEARCH_POOL_SIZE", "10")),
+        statement_cache_size=0,
+        max_cached_statement_lifetime=0,
+        max_cacheable_statement_size=0,
+        init=init_connection
+    )
+
+    if index_kind != "none":
+        await ensure_ann_index(
+            pool,
+            kind=index_kind,
+            m=int(os.getenv("SEARCH_HNSW_M", "16")),
+            ef_construction=int(os.getenv("SEARCH_HNSW_EF_CONSTRUCTION", "64")),
+            lists=int(os.getenv("SEARCH_IVFFLAT_LISTS", "0")) or None,
+        )
+
+    tei_client = TEIClient(
+        base_url=os.environ["TEI_URL"],
+        timeout=int(os.getenv("TEI_TIMEOUT", "60")),
+        # LRU de embeddings de consultas (solo memoria)
+        cache=EmbeddingCache(
+            model_id=os.getenv("TEI_MODEL_ID", "intfloat/e5-small"),
+            max_items=int(os.getenv("SEARCH_QUERY_CACHE_SIZE", "10000")),
+        ),
+    )
+
+    service = SearchService(
+        pool,
+        tei_client,
+        default_k=int(os.getenv("SEARCH_DEFAULT_K", "10")),
+        default_ef_search=int(os.getenv("SEARCH_EF_SEARCH", "0")) or None,
+        default_probes=int(os.getenv("SEARCH_PROBES", "0")) or None,
+        query_prefix=os.getenv("SEARCH_QUERY_PREFIX", ""),
+        expected_dim=int(os.getenv("EXPECTED_EMBEDDING_DIM", "384")),
+    )
+    await service.start()
+
+    app = create_search_app(service)
+
+    async def on_cleanup(app):
+        await tei_client.close()
+        await pool.close()
+
+    app.on_cleanup.append(on_cleanup)
+    return app
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO,
+        format='{"timestamp":"%(asctime)s","level":"%(levelname)s","message":%(message)s}'
+    )
+    web.run_app(build_app(), host="0.0.0.0", port=int(os.environ.get("SEARCH_PORT", "9002")))
@@ -0,0 +1,150 @@
+# ingestor/pipeline.py
+"""
+Pipeline asíncrono por etapas conectadas con colas acotadas.
+ - cada etapa tiene su propia concurrencia (N workers leyendo la misma cola)
+ - las colas tienen maxsize: si una etapa se atrasa, `emit` bloquea a la anterior
+   y la presión se propaga hasta las fuentes (backpressure)
+ - fin de datos con un centinela que cada etapa reenvía al terminar
+ - métricas: tiempo por item y workers ocupados por etapa, profundidad de colas
+ - un error en una etapa descarta ese item (el resto sigue); run() devuelve los errores
+   por etapa para que el llamador no confirme fuentes con datos perdidos
+"""
+
+import asyncio
+import json
+import logging
+import time
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional
+
+from ingestor.monitoring.metrics import QUEUE_DEPTH, STAGE_BUSY, STAGE_ERRORS, STAGE_SECONDS
+
+logger = logging.getLogger("pipeline")
+
+# Centinela de fin de stream
+_DONE = object()
+
+Emit = Callable[[Any], Awaitable[None]]
+
+
+class Pipeline:
+    def __init__(self, name: str = "ingest", sample_interval: float = 1.0):
+        self.name = name
+        self.sample_interval = sample_interval
+        self.queues: dict = {}
+        self._runners: List[Awaitable[None]] = []
+        self.errors: Dict[str, int] = {}
+
+    def queue(self, name: str, maxsize: int) -> asyncio.Queue:
+        q = asyncio.Queue(maxsize=maxsize)
+        self.queues[name] = q
+        return q
+
+    # ------------------------------------------
+    # DEFINICIÓN DE ETAPAS
+    # ------------------------------------------
+
+    def source(self, name: str, producers: List[Callable[[], AsyncIterator[Any]]],
+               outbox: asyncio.Queue, concurrency: int = 4):
+        """Etapa inicial: consume generadores async y emite cada elemento producido."""
+        self._runners.append(self._run_source(name, producers, outbox, concurrency))
+
+    def stage(self, name: str, fn: Callable[[Any, Emit], Awaitable[None]],
+              inbox: asyncio.Queue, outbox: Optional[asyncio.Queue] = None,
+              concurrency: int = 1, on_done: Optional[Callable[[Emit], Awaitable[None]]] = None):
+        """
+        fn(item, emit): procesa un item y llama `await emit(x)` por cada salida.
+        on_done(emit): se ejecuta una vez cuando la entrada terminó (p.ej. flush de buffers).
+        """
+        self._runners.append(self._run_stage(name, fn, inbox, outbox, concurrency, on_done))
+
+    async def run(self) -> Dict[str, int]:
+        """Corre todas las etapas hasta el fin de datos; devuelve {etapa: errores} (vacío si no hubo)."""
+        tasks = [asyncio.create_task(r) for r in self._runners]
+        sampler = asyncio.create_task(self._sample_queues())
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            # Si una etapa muere o nos cancelan, no dejar workers colgados en colas llenas
+            for t in tasks:
+                if not t.done():
+                    t.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            sampler.cancel()
+            for name in self.queues:
+                QUEUE_DEPTH.labels(self.name, name).set(0)
+        return dict(self.errors)
+
+    def _failed(self, name: str, error: Exception):
+        self.errors[name] = self.errors.get(name, 0) + 1
+        STAGE_ERRORS.labels(name).inc()
+        logger.error(json.dumps({"event": "stage_error", "stage": name, "error": str(error)}))
+
+    async def _sample_queues(self):
+        while True:
+            for name, q in self.queues.items():
+                QUEUE_DEPTH.labels(self.name, name).set(q.qsize())
+            await asyncio.sleep(self.sample_interval)
+
+    # ------------------------------------------
+    # RUNNERS
+    # ------------------------------------------
+
+    @staticmethod
+    def _emitter(outbox: Optional[asyncio.Queue]) -> Emit:
+        async def emit(item):
+            if outbox is not None:
+                await outbox.put(item)
+        return emit
+
+    async def _run_source(self, name, producers, outbox, concurrency):
+        emit = self._emitter(outbox)
+        sem = asyncio.Semaphore(max(1, concurrency))
+
+        async def drain(producer):
+            async with sem:
+                try:
+                    async for item in producer():
+                        await emit(item)
+                except Exception as e:
+                    self._failed(name, e)
+
+        await asyncio.gather(*(drain(p) for p in producers))
+        await outbox.put(_DONE)
+
+    async def _run_stage(self, name, fn, inbox, outbox, concurrency, on_done):
+        emit = self._emitter(outbox)
+        busy = STAGE_BUSY.labels(self.name, name)
+        seconds = STAGE_SECONDS.labels(name)
+
+        async def worker():
+            waited = [0.0]
+
+            async def timed_emit(x):
+                t = time.perf_counter()
+                await emit(x)
+                waited[0] += time.perf_counter() - t
+
+            while True:
+                item = await inbox.get()
+                if item is _DONE:
+                    # devolver el centinela para que lo vean los demás workers
+                    await inbox.put(_DONE)
+                    return
+                busy.inc()
+                start = time.perf_counter()
+                try:
+                    await fn(item, timed_emit)
+                except Exception as e:
+                    self._failed(name, e)
+                finally:
+                    # sin la espera en `emit`: eso es backpressure de la etapa siguiente
+                    seconds.observe(time.perf_counter() - start - waited[0])
+                    waited[0] = 0.0
+                    busy.dec()
+
+        await asyncio.gather(*(worker() for _ in range(max(1, concurrency))))
+
+        if on_done is not None:
+            await on_done(emit)
+        if outbox is not None:
+            await outbox.put(_DONE)
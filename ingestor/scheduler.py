@@ -0,0 +1,143 @@
+# ingestor/scheduler.py
+"""
+Scheduler por fuente para el ingestor.
+ - cada fuente corre en su propio loop con intervalo + jitter configurables
+ - backoff adaptativo: si una fuente sigue sin cambios, su intervalo crece
+   (hasta max_interval); el primer cambio lo devuelve al intervalo base
+ - disparos inmediatos por fuente: webhook HTTP (POST /trigger/{fuente})
+   y Postgres LISTEN/NOTIFY (payload = clave de la fuente, o "*" para todas)
+"""
+
+import asyncio
+import json
+import logging
+import random
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+import asyncpg
+from aiohttp import web
+
+logger = logging.getLogger("scheduler")
+
+ALL_SOURCES = "*"
+
+
+class SourceSchedule:
+    def __init__(self, source: Any, interval: float = 60, jitter: float = 0.1,
+                 max_interval: float = 900, idle_backoff: float = 2.0):
+        self.source = source
+        self.key: str = getattr(source, "key", None) or source.name
+        self.interval = interval
+        self.jitter = jitter
+        self.max_interval = max(interval, max_interval)
+        self.idle_backoff = idle_backoff
+
+        self.current_interval = interval
+        self.idle_streak = 0
+        self.runs = 0
+        self.trigger_event = asyncio.Event()
+
+    def on_result(self, stats: Optional[Dict[str, int]]):
+        self.runs += 1
+        if stats is None:
+            # error: reintentar al ritmo actual, sin castigar ni premiar
+            return
+        if stats.get("changed", 0) == 0:
+            self.idle_streak += 1
+            self.current_interval = min(self.max_interval, self.current_interval * self.idle_backoff)
+        else:
+            self.idle_streak = 0
+            self.current_interval = self.interval
+
+    def next_delay(self) -> float:
+        spread = self.current_interval * self.jitter
+        return max(0.0, self.current_interval + random.uniform(-spread, spread))
+
+
+class Scheduler:
+    def __init__(self, run_source: Callable[[Any], Awaitable[Dict[str, int]]],
+                 schedules: List[SourceSchedule]):
+        self.run_source = run_source
+        self.schedules: Dict[str, SourceSchedule] = {s.key: s for s in schedules}
+
+    def trigger(self, key: str) -> bool:
+        """Pide una corrida inmediata de una fuente (o de todas con "*")."""
+        targets = list(self.schedules.values()) if key == ALL_SOURCES else [self.schedules.get(key)]
+        if not targets or targets[0] is None:
+            return False
+        for sched in targets:
+            sched.trigger_event.set()
+        logger.info(json.dumps({"event": "source_triggered", "source": key}))
+        return True
+
+    async def _wait_turn(self, sched: SourceSchedule):
+        if sched.runs == 0:
+            return  # primera corrida inmediata
+        try:
+            await asyncio.wait_for(sched.trigger_event.wait(), timeout=sched.next_delay())
+        except asyncio.TimeoutError:
+            pass
+
+    async def _source_loop(self, sched: SourceSchedule):
+        while True:
+            await self._wait_turn(sched)
+            sched.trigger_event.clear()
+
+            try:
+                stats = await self.run_source(sched.source)
+            except Exception as e:
+                logger.error(json.dumps({"event": "source_run_error", "source": sched.key, "error": str(e)}))
+                stats = None
+
+            sched.on_result(stats)
+            logger.info(json.dumps({
+                "event": "source_scheduled",
+                "source": sched.key,
+                "idle_streak": sched.idle_streak,
+                "next_interval_s": round(sched.current_interval, 1)
+            }))
+
+    async def run(self):
+        await asyncio.gather(*(self._source_loop(s) for s in self.schedules.values()))
+
+
+#############################################
+# DISPARADORES
+#############################################
+
+def add_trigger_routes(app: web.Application, scheduler: Scheduler, token: Optional[str] = None):
+    async def trigger_handler(request: web.Request):
+        if token and request.headers.get("X-Trigger-Token") != token:
+            return web.json_response({"error": "unauthorized"}, status=401)
+        key = request.match_info["source"]
+        if not scheduler.trigger(key):
+            return web.json_response({"error": "unknown source", "sources": list(scheduler.schedules)}, status=404)
+        return web.json_response({"status": "triggered", "source": key}, status=202)
+
+    app.router.add_post("/trigger/{source}", trigger_handler)
+
+
+async def listen_pg_triggers(dsn: str, channel: str, scheduler: Scheduler, reconnect_s: float = 5):
+    """
+    LISTEN en una conexión dedicada (directa a Postgres: LISTEN no funciona a través
+    de pgbouncer en modo transaction). Reconecta si la conexión se pierde.
+    """
+    def on_notify(conn, pid, chan, payload):
+        scheduler.trigger((payload or ALL_SOURCES).strip())
+
+    while True:
+        conn = None
+        try:
+            conn = await asyncpg.connect(dsn)
+            await conn.add_listener(channel, on_notify)
+            logger.info(json.dumps({"event": "pg_listen_started", "channel": channel}))
+            while not conn.is_closed():
+                await asyncio.sleep(reconnect_s)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning(json.dumps({"event": "pg_listen_error", "error": str(e)}))
+        finally:
+            if conn is not None and not conn.is_closed():
+                await conn.close()
+        await asyncio.sleep(reconnect_s)
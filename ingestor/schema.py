@@ -0,0 +1,112 @@
+# ingestor/schema.py
+"""
+DDL de las tablas auxiliares que mantiene el ingestor (idempotente: IF NOT EXISTS).
+La tabla `trabajadores` se asume creada (es la tabla principal del servicio).
+"""
+
+import asyncpg
+
+CHUNKS_DDL = """
+CREATE TABLE IF NOT EXISTS {table} (
+    id_estable text NOT NULL,
+    chunk_no integer NOT NULL,
+    chunk_hash text NOT NULL,
+    embedding vector({dim}) NOT NULL,
+    updated_at timestamptz NOT NULL DEFAULT now(),
+    PRIMARY KEY (id_estable, chunk_no)
+);
+"""
+
+AGGREGATES_DDL = """
+CREATE TABLE IF NOT EXISTS grupo_agregados (
+    dimension text NOT NULL,
+    grupo text NOT NULL,
+    n bigint NOT NULL,
+    sum_vec vector({dim}) NOT NULL,
+    sumsq_vec vector({dim}) NOT NULL,
+    updated_at timestamptz NOT NULL DEFAULT now(),
+    PRIMARY KEY (dimension, grupo)
+);
+CREATE TABLE IF NOT EXISTS catalogo_cursos (
+    curso_id text PRIMARY KEY,
+    nombre text NOT NULL,
+    tipo text NOT NULL DEFAULT 'curso',
+    json_data jsonb NOT NULL DEFAULT '{{}}'::jsonb,
+    embedding vector({dim}) NOT NULL,
+    updated_at timestamptz NOT NULL DEFAULT now()
+);
+"""
+
+
+async def ensure_schema(pool: asyncpg.Pool, embedding_dim: int, chunks: bool = True, aggregates: bool = False):
+    async with pool.acquire() as conn:
+        if chunks:
+            await conn.execute(CHUNKS_DDL.format(table="trabajador_chunks", dim=int(embedding_dim)))
+        if aggregates:
+            await conn.execute(AGGREGATES_DDL.format(dim=int(embedding_dim)))
+
+
+SIMILARES_DDL = """
+CREATE TABLE IF NOT EXISTS trabajadores_similares (
+    id_estable text NOT NULL,
+    rank smallint NOT NULL,
+    similar_id text NOT NULL,
+    score real NOT NULL,
+    computed_at timestamptz NOT NULL DEFAULT now(),
+    PRIMARY KEY (id_estable, rank)
+);
+CREATE INDEX IF NOT EXISTS trabajadores_similares_similar_id ON trabajadores_similares (similar_id);
+CREATE TABLE IF NOT EXISTS batch_job_state (
+    job text PRIMARY KEY,
+    watermark timestamptz,
+    updated_at timestamptz NOT NULL DEFAULT now()
+);
+"""
+
+
+async def ensure_similares_schema(pool: asyncpg.Pool):
+    async with pool.acquire() as conn:
+        await conn.execute(SIMILARES_DDL)
+
+
+EMBEDDING_MODELS_DDL = """
+CREATE TABLE IF NOT EXISTS embedding_models (
+    version text PRIMARY KEY,
+    model_id text,
+    dim integer NOT NULL,
+    status text NOT NULL,
+    checkpoint text,
+    rows_done bigint NOT NULL DEFAULT 0,
+    started_at timestamptz NOT NULL DEFAULT now(),
+    activated_at timestamptz
+);
+CREATE UNIQUE INDEX IF NOT EXISTS embedding_models_one_active ON embedding_models ((true)) WHERE status = 'active';
+"""
+
+
+async def ensure_embedding_models_schema(pool: asyncpg.Pool):
+    async with pool.acquire() as conn:
+        await conn.execute(EMBEDDING_MODELS_DDL)
+
+
+IDENTITY_DDL = """
+CREATE TABLE IF NOT EXISTS identidad_claves (
+    clave text PRIMARY KEY,
+    id_canonico text NOT NULL,
+    created_at timestamptz NOT NULL DEFAULT now()
+);
+CREATE INDEX IF NOT EXISTS identidad_claves_id_canonico ON identidad_claves (id_canonico);
+CREATE TABLE IF NOT EXISTS trabajador_fuentes (
+    id_canonico text NOT NULL,
+    fuente text NOT NULL,
+    hash_fuente text NOT NULL,
+    json_data jsonb NOT NULL,
+    updated_at timestamptz NOT NULL DEFAULT now(),
+    PRIMARY KEY (id_canonico, fuente)
+);
+"""
+
+
+async def ensure_identity_schema(pool: asyncpg.Pool):
+    async with pool.acquire() as conn:
+        await conn.execute(IDENTITY_DDL)
@@ -0,0 +1,193 @@
+# ingestor/sharding.py
+"""
+Modo multi-worker: varias réplicas del ingestor repartiéndose el trabajo vía Redis.
+
+ - cada registro pertenece a uno de N shards: hash(id_estable) % N
+ - ShardLeaseManager: cada worker toma leases de shards en Redis (SET NX PX) y los
+   renueva con heartbeats; con W workers vivos cada uno apunta a ceil(N/W) shards.
+   Si un worker muere sus leases expiran y los demás los toman (rebalanceo automático);
+   si entra uno nuevo, los que tienen de más liberan shards
+ - SourceLease: una sola réplica por vez corre cada fuente, así cada página se
+   descarga una vez
+ - el worker que descargó encola los registros cambiados en el stream del shard
+   (ingestor/work_queue.py); cada worker consume solo los streams de sus shards
+"""
+
+import os
+import math
+import json
+import time
+import socket
+import asyncio
+import hashlib
+import logging
+from typing import Awaitable, Callable, Optional, Set
+
+logger = logging.getLogger("sharding")
+
+DEFAULT_PREFIX = "ingestor"
+
+# Renovar/liberar solo si el lease sigue siendo nuestro (evita pisar al nuevo dueño)
+_RENEW_LUA = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('pexpire', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+_RELEASE_LUA = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+
+def default_worker_id() -> str:
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+def shard_of(id_estable: str, num_shards: int) -> int:
+    digest = hashlib.blake2b(id_estable.encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "big") % num_shards
+
+
+#############################################
+# LEASES DE SHARDS
+#############################################
+
+class ShardLeaseManager:
+    def __init__(self, redis, num_shards: int, worker_id: Optional[str] = None,
+                 lease_ttl: float = 30, prefix: str = DEFAULT_PREFIX,
+                 on_acquire: Optional[Callable[[Set[int]], Awaitable[None]]] = None):
+        self.redis = redis
+        self.num_shards = num_shards
+        self.worker_id = worker_id or default_worker_id()
+        self.lease_ttl = lease_ttl
+        self.heartbeat_interval = lease_ttl / 3
+        self.prefix = prefix
+        self.on_acquire = on_acquire
+
+        self.owned: Set[int] = set()
+        self._renew = redis.register_script(_RENEW_LUA)
+        self._release = redis.register_script(_RELEASE_LUA)
+        # punto de partida distinto por worker: menos choques al tomar shards libres
+        self._offset = shard_of(self.worker_id, num_shards)
+
+    @property
+    def _members_key(self) -> str:
+        return f"{self.prefix}:workers"
+
+    def _lease_key(self, shard: int) -> str:
+        return f"{self.prefix}:shard:{shard}:lease"
+
+    def owns(self, id_estable: Optional[str]) -> bool:
+        return id_estable is not None and shard_of(id_estable, self.num_shards) in self.owned
+
+    async def _live_workers(self) -> int:
+        now = time.time()
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.zadd(self._members_key, {self.worker_id: now})
+        pipe.zremrangebyscore(self._members_key, 0, now - self.lease_ttl)
+        pipe.zcard(self._members_key)
+        _, _, live = await pipe.execute()
+        return max(1, int(live))
+
+    async def rebalance(self):
+        ttl_ms = int(self.lease_ttl * 1000)
+        target = math.ceil(self.num_shards / await self._live_workers())
+
+        # 1) renovar lo propio; lo que no se pudo renovar ya no es nuestro
+        for shard in sorted(self.owned):
+            if not await self._renew(keys=[self._lease_key(shard)], args=[self.worker_id, ttl_ms]):
+                self.owned.discard(shard)
+                logger.warning(json.dumps({"event": "shard_lease_lost", "shard": shard}))
+
+        # 2) con más de la cuota (entró otro worker): liberar el excedente
+        released = []
+        while len(self.owned) > target:
+            shard = max(self.owned)
+            await self._release(keys=[self._lease_key(shard)], args=[self.worker_id])
+            self.owned.discard(shard)
+            released.append(shard)
+
+        # 3) con menos de la cuota: tomar shards libres (o de workers muertos, ya expirados)
+        acquired: Set[int] = set()
+        for i in range(self.num_shards):
+            if len(self.owned) >= target:
+                break
+            shard = (self._offset + i) % self.num_shards
+            if shard in self.owned:
+                continue
+            if await self.redis.set(self._lease_key(shard), self.worker_id, nx=True, px=ttl_ms):
+                self.owned.add(shard)
+                acquired.add(shard)
+
+        if acquired or released:
+            logger.info(json.dumps({
+                "event": "shards_rebalanced",
+                "worker": self.worker_id,
+                "acquired": sorted(acquired),
+                "released": released,
+                "owned": sorted(self.owned),
+                "target": target
+            }))
+        if acquired and self.on_acquire is not None:
+            await self.on_acquire(acquired)
+
+    async def run(self):
+        while True:
+            try:
+                await self.rebalance()
+            except Exception as e:
+                logger.error(json.dumps({"event": "shard_heartbeat_error", "error": str(e)}))
+            await asyncio.sleep(self.heartbeat_interval)
+
+    async def release_all(self):
+        for shard in list(self.owned):
+            try:
+                await self._release(keys=[self._lease_key(shard)], args=[self.worker_id])
+            except Exception:
+                pass
+        self.owned.clear()
+        try:
+            await self.redis.zrem(self._members_key, self.worker_id)
+        except Exception:
+            pass
+
+
+#############################################
+# LEASE POR FUENTE
+#############################################
+
+class SourceLease:
+    """`async with SourceLease(...) as held:` — held=False si otra réplica está corriendo la fuente."""
+
+    def __init__(self, redis, source_key: str, worker_id: str, ttl: float = 60, prefix: str = DEFAULT_PREFIX):
+        self.redis = redis
+        self.key = f"{prefix}:source:{source_key}:lease"
+        self.worker_id = worker_id
+        self.ttl = ttl
+        self.held = False
+        self._renewer: Optional[asyncio.Task] = None
+        self._renew = redis.register_script(_RENEW_LUA)
+        self._release = redis.register_script(_RELEASE_LUA)
+
+    async def _keepalive(self):
+        while True:
+            await asyncio.sleep(self.ttl / 3)
+            await self._renew(keys=[self.key], args=[self.worker_id, int(self.ttl * 1000)])
+
+    async def __aenter__(self) -> bool:
+        self.held = bool(await self.redis.set(self.key, self.worker_id, nx=True, px=int(self.ttl * 1000)))
+        if self.held:
+            self._renewer = asyncio.create_task(self._keepalive())
+        return self.held
+
+    async def __aexit__(self, *exc):
+        if self._renewer is not None:
+            self._renewer.cancel()
+            await asyncio.gather(self._renewer, return_exceptions=True)
+        if self.held:
+            await self._release(keys=[self.key], args=[self.worker_id])
+        return False
@@ -1,7 +1,10 @@
 # ingestor/src/sources/base_source.py
 from abc import ABC, abstractmethod
+from typing import Any, AsyncIterator, Dict, List, Optional
 
 class BaseSource(ABC):
+    # Clave corta de la fuente (api1, api2, drive): scheduler, triggers, config por fuente
+    key: Optional[str] = None
 
     @abstractmethod
     async def fetch(self):
@@ -9,3 +12,22 @@ class BaseSource(ABC):
            {"raw": {...datos del trabajador...}, "source": "identificador_origen"}
         """
         pass
+
+    async def iter_pages(self) -> AsyncIterator[List[Dict[str, Any]]]:
+        """Entrega los registros por páginas a medida que llegan.
+           Por defecto una sola página con el resultado de fetch();
+           las fuentes paginadas lo sobreescriben para hacer streaming.
+        """
+        yield await self.fetch()
+
+    async def commit(self):
+        """Se llama al terminar un ciclo sin errores (p.ej. confirmar watermarks)."""
+        pass
+
+    async def close(self):
+        """Liberar recursos propios (pools, clientes) al apagar el ingestor."""
+        pass
+
+    @property
+    def name(self) -> str:
+        return str(getattr(self, "url", getattr(self, "folder_id", "unknown")))
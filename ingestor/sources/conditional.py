@@ -0,0 +1,108 @@
+# ingestor/sources/conditional.py
+"""
+Validadores HTTP por página de una fuente (ETag / Last-Modified / digest del body) en Redis.
+Cada página se identifica por sus params y su Range (page_key): se envía If-None-Match /
+If-Modified-Since y, si el servidor responde 304 o el body es idéntico al del último
+ciclo, la página se salta sin parsear ni re-procesar sus filas. Con la página se guarda
+cuántas filas tenía, su última clave (keyset) y el máximo de incremental_column, así el
+recorrido sigue a la página siguiente sin el body.
+Los validadores nuevos quedan pendientes hasta confirm() (solo tras un recorrido completo
+y exitoso): si el ciclo falla, el siguiente vuelve a descargar. Las páginas que ya no
+aparecen se descartan al confirmar.
+"""
+
+import json
+import hashlib
+import logging
+from typing import Dict, Optional
+
+logger = logging.getLogger("conditional")
+
+
+class ConditionalCache:
+    def __init__(self, key: str, redis=None):
+        self.key = f"source:{key}:http_cache"
+        self.redis = redis
+        self._stored: Dict[str, Dict[str, str]] = {}
+        self._pending: Optional[Dict[str, Dict[str, str]]] = None
+
+    @staticmethod
+    def digest(body: bytes) -> str:
+        return hashlib.sha256(body).hexdigest()
+
+    @staticmethod
+    def page_key(params: Dict[str, str], range_header: Optional[str] = None) -> str:
+        raw = json.dumps([sorted(params.items()), range_header], ensure_ascii=False)
+        return hashlib.sha1(raw.encode("utf-8")).hexdigest()[:16]
+
+    async def load(self):
+        self._stored = {}
+        if self.redis is None:
+            return
+        try:
+            data = await self.redis.hgetall(self.key)
+        except Exception as e:
+            logger.warning(f"[conditional] no se pudo leer {self.key}: {e}")
+            return
+        for k, v in (data or {}).items():
+            k = k.decode() if isinstance(k, bytes) else k
+            page, sep, field = k.partition("|")
+            if sep:  # campos sin página (formato anterior): se ignoran y se reemplazan al confirmar
+                self._stored.setdefault(page, {})[field] = v.decode() if isinstance(v, bytes) else v
+
+    def request_headers(self, page: str) -> Dict[str, str]:
+        stored = self._stored.get(page, {})
+        headers = {}
+        if stored.get("etag"):
+            headers["If-None-Match"] = stored["etag"]
+        if stored.get("last_modified"):
+            headers["If-Modified-Since"] = stored["last_modified"]
+        return headers
+
+    def same_body(self, page: str, body: bytes) -> bool:
+        stored = self._stored.get(page, {})
+        return bool(stored.get("digest")) and stored["digest"] == self.digest(body)
+
+    def begin(self):
+        """Inicio de un recorrido: lo pendiente se arma página a página."""
+        self._pending = {}
+
+    def remember(self, page: str, headers, body: bytes, rows: int,
+                 last: Optional[str] = None, max_value: Optional[str] = None):
+        """Guardar (pendiente) los validadores de una página descargada."""
+        entry = {"digest": self.digest(body), "rows": str(rows)}
+        if headers.get("ETag"):
+            entry["etag"] = headers["ETag"]
+        if headers.get("Last-Modified"):
+            entry["last_modified"] = headers["Last-Modified"]
+        if last is not None:
+            entry["last"] = last
+        if max_value is not None:
+            entry["max"] = max_value
+        if self._pending is not None:
+            self._pending[page] = entry
+
+    def keep(self, page: str) -> Optional[Dict[str, str]]:
+        """Página sin cambios: conserva lo guardado y lo devuelve (None si no había nada)."""
+        stored = self._stored.get(page)
+        if stored is not None and self._pending is not None:
+            self._pending[page] = stored
+        return stored
+
+    def forget(self):
+        self._pending = None
+
+    async def confirm(self):
+        if self._pending is None or self.redis is None:
+            return
+        mapping = {f"{page}|{field}": value for page, entry in self._pending.items() for field, value in entry.items()}
+        try:
+            pipe = self.redis.pipeline(transaction=True)
+            pipe.delete(self.key)
+            if mapping:
+                pipe.hset(self.key, mapping=mapping)
+            await pipe.execute()
+        except Exception as e:
+            logger.warning(f"[conditional] no se pudo guardar {self.key}: {e}")
+            return
+        self._stored, self._pending = self._pending, None
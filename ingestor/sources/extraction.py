@@ -0,0 +1,201 @@
+# ingestor/sources/extraction.py
+"""
+Motor de extracción de texto (PDF / DOCX / texto plano) en un pool de procesos.
+ - PyPDF2 y python-docx son CPU-bound en Python puro: fuera del proceso del event loop
+ - los workers leen el archivo desde disco (path), no reciben `bytes` por pickle
+ - límites por archivo: timeout, páginas, caracteres, bytes y memoria del worker
+ - a lo sumo `workers` extracciones en vuelo: el timeout mide solo el trabajo del archivo,
+   no la espera en la cola del executor
+ - un worker colgado o caído se reemplaza reiniciando el pool (una sola vez por pool caído)
+ - caché del texto extraído por md5 del archivo en Redis (comprimido): el llamador la
+   consulta con cached_text() antes de descargar; extract() solo la llena
+"""
+
+import os
+import zlib
+import asyncio
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Optional
+
+import docx
+import PyPDF2
+
+logger = logging.getLogger("extraction")
+
+PDF_MIME = "application/pdf"
+DOCX_MIME = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+
+
+class ExtractionError(Exception):
+    pass
+
+
+#############################################
+# CÓDIGO DEL WORKER (corre en procesos hijos)
+#############################################
+
+def _init_worker(memory_limit_mb: int):
+    if not memory_limit_mb:
+        return
+    try:
+        import resource  # no existe en Windows
+        limit = memory_limit_mb * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+    except (ImportError, ValueError, OSError):
+        pass
+
+
+def extract_text(path: str, mime_type: str, max_pages: int, max_chars: int) -> str:
+    if mime_type == PDF_MIME:
+        reader = PyPDF2.PdfReader(path)
+        parts = []
+        total = 0
+        for i, page in enumerate(reader.pages):
+            if i >= max_pages or total >= max_chars:
+                break
+            page_text = page.extract_text()
+            if page_text:
+                parts.append(page_text)
+                total += len(page_text)
+        return "\n".join(parts)[:max_chars]
+
+    if mime_type == DOCX_MIME:
+        doc = docx.Document(path)
+        parts = []
+        total = 0
+        for p in doc.paragraphs:
+            if total >= max_chars:
+                break
+            parts.append(p.text)
+            total += len(p.text) + 1
+        return "\n".join(parts)[:max_chars]
+
+    # texto plano: no leer más de lo que se va a usar (utf-8: hasta 4 bytes por carácter)
+    try:
+        with open(path, "rb") as fh:
+            return fh.read(max_chars * 4).decode("utf-8", errors="ignore")[:max_chars]
+    except Exception:
+        return ""
+
+
+#############################################
+# MOTOR (lado asyncio)
+#############################################
+
+class ExtractionEngine:
+    def __init__(self, workers: Optional[int] = None, timeout: float = 60, max_pages: int = 200,
+                 max_chars: int = 200_000, max_bytes: int = 50 * 1024 * 1024,
+                 memory_limit_mb: int = 1024, redis=None, cache_ttl: int = 60 * 60 * 24 * 30):
+        self.workers = workers or os.cpu_count() or 2
+        self.timeout = timeout
+        self.max_pages = max_pages
+        self.max_chars = max_chars
+        self.max_bytes = max_bytes
+        self.memory_limit_mb = memory_limit_mb
+        self.redis = redis
+        self.cache_ttl = cache_ttl
+
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._slots = asyncio.Semaphore(self.workers)
+
+    # ------------------------------------------
+    # POOL
+    # ------------------------------------------
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers,
+                # spawn: no heredar hilos/loop del proceso principal
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+                initargs=(self.memory_limit_mb,),
+            )
+        return self._pool
+
+    def _restart_pool(self, failed: ProcessPoolExecutor):
+        # solo el primero que ve caer este pool lo reinicia; los hermanos que murieron con él
+        # no deben tirar abajo el pool nuevo
+        if self._pool is not failed:
+            return
+        pool, self._pool = self._pool, None
+        # terminar workers colgados: shutdown() solo no los detiene
+        for proc in list(getattr(pool, "_processes", {}).values()):
+            try:
+                proc.terminate()
+            except Exception:
+                pass
+        pool.shutdown(wait=False, cancel_futures=True)
+        logger.warning("[extraction] pool de procesos reiniciado")
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    # ------------------------------------------
+    # CACHÉ POR MD5
+    # ------------------------------------------
+
+    @staticmethod
+    def _cache_key(md5: str) -> str:
+        return f"drive:text:{md5}"
+
+    async def cached_text(self, md5: Optional[str]) -> Optional[str]:
+        if not md5 or self.redis is None:
+            return None
+        try:
+            raw = await self.redis.get(self._cache_key(md5))
+        except Exception as e:
+            logger.warning(f"[extraction] redis get falló: {e}")
+            return None
+        return zlib.decompress(raw).decode("utf-8") if raw else None
+
+    async def _cache_set(self, md5: Optional[str], text: str):
+        if not md5 or self.redis is None:
+            return
+        try:
+            await self.redis.set(self._cache_key(md5), zlib.compress(text.encode("utf-8")), ex=self.cache_ttl)
+        except Exception as e:
+            logger.warning(f"[extraction] redis set falló: {e}")
+
+    # ------------------------------------------
+    # API
+    # ------------------------------------------
+
+    async def _run(self, path: str, mime_type: str, retry: bool = True) -> str:
+        loop = asyncio.get_running_loop()
+        async with self._slots:
+            pool = self._get_pool()
+            future = loop.run_in_executor(pool, extract_text, path, mime_type, self.max_pages, self.max_chars)
+            try:
+                return await asyncio.wait_for(future, timeout=self.timeout)
+            except asyncio.TimeoutError:
+                self._restart_pool(pool)
+                raise ExtractionError(f"timeout de {self.timeout}s extrayendo {path}")
+            except BrokenProcessPool:
+                if self._pool is pool:
+                    # un worker murió (p.ej. superó el límite de memoria)
+                    self._restart_pool(pool)
+                    raise ExtractionError(f"worker de extracción murió procesando {path}")
+                if not retry:
+                    raise ExtractionError(f"worker de extracción murió procesando {path}")
+            except asyncio.CancelledError:
+                # cancel_futures del reinicio también cancela lo que no llegó a correr
+                if self._pool is pool or asyncio.current_task().cancelling() or not retry:
+                    raise
+        # el pool cayó por otro archivo (timeout o worker muerto): reintentar en el pool nuevo
+        return await self._run(path, mime_type, retry=False)
+
+    async def extract(self, path: str, mime_type: str, md5: Optional[str] = None) -> str:
+        """Extrae y guarda en la caché por md5 (sin consultarla: eso ya pasó antes de descargar)."""
+        size = os.path.getsize(path)
+        if size > self.max_bytes:
+            raise ExtractionError(f"archivo de {size} bytes supera el límite de {self.max_bytes}")
+
+        text = await self._run(path, mime_type)
+        await self._cache_set(md5, text)
+        return text
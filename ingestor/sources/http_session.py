@@ -0,0 +1,22 @@
+# ingestor/sources/http_session.py
+import aiohttp
+from typing import Optional
+
+# Sesión HTTP compartida por todas las fuentes (keep-alive entre ciclos)
+_session: Optional[aiohttp.ClientSession] = None
+
+
+def get_http_session() -> aiohttp.ClientSession:
+    global _session
+    if _session is None or _session.closed:
+        _session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=20, keepalive_timeout=60, ttl_dns_cache=300)
+        )
+    return _session
+
+
+async def close_http_session():
+    global _session
+    if _session is not None and not _session.closed:
+        await _session.close()
+    _session = None
@@ -1,27 +1,28 @@
 # ingestor/src/sources/impl/drive_source.py
-import io
 import os
 import asyncio
 import logging
-from typing import List, Dict, Any
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, AsyncIterator, Dict, List, Optional
 from googleapiclient.discovery import build
 from googleapiclient.http import MediaIoBaseDownload
 from google.oauth2.service_account import Credentials
-import docx
-import PyPDF2
-import aiofiles
-import hashlib
-import json
 
 from ingestor.sources.base_source import BaseSource
-
-# 🔥 NUEVO REDIS COMPATIBLE
-from redis import asyncio as redis_async
+from ingestor.sources.extraction import ExtractionEngine
+from ingestor.utils.redis_client import get_redis
 
 logger = logging.getLogger("drive_source")
 
 SCOPES = ['https://www.googleapis.com/auth/drive.readonly']
 
+FOLDER_MIME = "application/vnd.google-apps.folder"
+LIST_FIELDS = "nextPageToken, files(id, name, mimeType, md5Checksum, size, modifiedTime)"
+MD5_TTL = 60 * 60 * 24 * 7
+DOWNLOAD_CHUNK_SIZE = 4 * 1024 * 1024
+
 
 def sha256_bytes(b: bytes) -> str:
     import hashlib
@@ -29,111 +30,214 @@ def sha256_bytes(b: bytes) -> str:
 
 
 class DriveSource(BaseSource):
-    def __init__(self, folder_id: str, service_account_file: str = None, page_size: int = 100):
+    """
+    Fuente Google Drive:
+     - listado paginado (y recursivo en subcarpetas) fuera del event loop
+     - caché de md5 en Redis consultada en bloque (MGET) por página de listado
+     - descargas concurrentes acotadas, en streaming a archivos temporales
+     - servicio de Drive (uno por hilo: httplib2 no es thread-safe) y Redis reutilizados entre ciclos
+     - extracción de texto en un pool de procesos (ExtractionEngine) con caché por md5:
+       si el texto ya está en caché ni siquiera se descarga el archivo
+     - el md5 se confirma en Redis recién en commit(), al terminar un ciclo sin errores
+    """
+
+    def __init__(self, folder_id: str, service_account_file: str = None, page_size: int = 100,
+                 download_concurrency: int = 8, recursive: bool = True, tmp_dir: Optional[str] = None,
+                 extractor: Optional[ExtractionEngine] = None):
         self.folder_id = folder_id
         self.service_account_file = service_account_file or os.getenv("SERVICE_ACCOUNT_FILE")
         self.page_size = page_size
-
-        # la URL redis://localhost:6379 típica
-        self.redis_url = os.getenv("REDIS_URL", None)
+        self.download_concurrency = download_concurrency
+        self.recursive = recursive
+        self.tmp_dir = tmp_dir
+        self.extractor = extractor or ExtractionEngine()
+
+        self._creds = None
+        self._local = threading.local()
+        # hilos para I/O bloqueante de la API (listado + descargas)
+        self._executor = ThreadPoolExecutor(max_workers=download_concurrency + 1,
+                                            thread_name_prefix="drive")
+        self._pending_md5: Dict[str, str] = {}
+
+    # ------------------------------------------
+    # CLIENTES (bloqueantes, corren en self._executor)
+    # ------------------------------------------
 
     def _build_service(self):
-        creds = Credentials.from_service_account_file(self.service_account_file, scopes=SCOPES)
-        service = build('drive', 'v3', credentials=creds, cache_discovery=False)
+        if self._creds is None:
+            self._creds = Credentials.from_service_account_file(self.service_account_file, scopes=SCOPES)
+        service = build('drive', 'v3', credentials=self._creds, cache_discovery=False)
+        return service
+
+    def _service(self):
+        service = getattr(self._local, "service", None)
+        if service is None:
+            service = self._build_service()
+            self._local.service = service
         return service
 
-    def _download_file(self, service, file_id: str) -> bytes:
-        request = service.files().get_media(fileId=file_id)
-        fh = io.BytesIO()
-        downloader = MediaIoBaseDownload(fh, request)
-        done = False
-        while not done:
-            status, done = downloader.next_chunk()
-        fh.seek(0)
-        return fh.read()
-
-    def _extract_text_from_bytes(self, content_bytes: bytes, mime_type: str) -> str:
-        if mime_type == "application/pdf":
-            reader = PyPDF2.PdfReader(io.BytesIO(content_bytes))
-            text = []
-            for p in reader.pages:
-                page_text = p.extract_text()
-                if page_text:
-                    text.append(page_text)
-            return "\n".join(text[:1000])  # limita texto muy grande
-
-        elif mime_type == "application/vnd.openxmlformats-officedocument.wordprocessingml.document":
-            fh = io.BytesIO(content_bytes)
-            doc = docx.Document(fh)
-            return "\n".join([p.text for p in doc.paragraphs])
-
-        else:
+    def _list_page(self, folder_id: str, page_token: Optional[str]) -> Dict[str, Any]:
+        query = f"'{folder_id}' in parents and trashed = false"
+        return self._service().files().list(
+            q=query,
+            fields=LIST_FIELDS,
+            pageSize=self.page_size,
+            pageToken=page_token
+        ).execute()
+
+    def _download_file(self, file_id: str, path: str):
+        request = self._service().files().get_media(fileId=file_id)
+        with open(path, "wb") as fh:
+            downloader = MediaIoBaseDownload(fh, request, chunksize=DOWNLOAD_CHUNK_SIZE)
+            done = False
+            while not done:
+                status, done = downloader.next_chunk()
+
+    def _download_to_temp(self, f: Dict[str, Any]) -> str:
+        fd, path = tempfile.mkstemp(prefix="drive_", dir=self.tmp_dir)
+        os.close(fd)
+        try:
+            self._download_file(f["id"], path)
+        except Exception:
+            os.remove(path)
+            raise
+        return path
+
+    # ------------------------------------------
+    # HELPERS ASYNC
+    # ------------------------------------------
+
+    @staticmethod
+    def _file_md5(f: Dict[str, Any]) -> str:
+        return f.get("md5Checksum") or f.get("modifiedTime") or str(f.get("size", "0"))
+
+    @staticmethod
+    def _cache_key(file_id: str) -> str:
+        return f"drive:file:{file_id}:md5"
+
+    async def _filter_unchanged(self, files: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        redis = get_redis(decode_responses=True)
+        if redis is None or not files:
+            return files
+
+        try:
+            olds = await redis.mget([self._cache_key(f["id"]) for f in files])
+        except Exception as e:
+            logger.warning(f"[drive] redis mget falló, se procesan todos: {e}")
+            return files
+
+        changed = []
+        for f, old in zip(files, olds):
+            if old == self._file_md5(f):
+                logger.info(f"[drive] skip unchanged {f.get('name')}")
+                continue
+            changed.append(f)
+        return changed
+
+    async def _extract(self, f: Dict[str, Any]) -> str:
+        content_md5 = f.get("md5Checksum")  # solo el md5 real identifica el contenido
+
+        text = await self.extractor.cached_text(content_md5)
+        if text is not None:
+            return text
+
+        size = int(f.get("size") or 0)
+        if size > self.extractor.max_bytes:
+            raise ValueError(f"{size} bytes supera DRIVE max_bytes={self.extractor.max_bytes}")
+
+        loop = asyncio.get_running_loop()
+        path = await loop.run_in_executor(self._executor, self._download_to_temp, f)
+        try:
+            return await self.extractor.extract(path, f.get("mimeType", ""), content_md5)
+        finally:
             try:
-                return content_bytes.decode("utf-8", errors="ignore")
-            except Exception:
-                return ""
+                os.remove(path)
+            except OSError:
+                pass
+
+    async def _process_file(self, f: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        try:
+            text = await self._extract(f)
+        except Exception as e:
+            # un archivo roto no tumba la fuente completa
+            logger.warning(f"[drive] error procesando {f.get('name')} ({f['id']}): {e}")
+            return None
+
+        self._pending_md5[f["id"]] = self._file_md5(f)
+
+        return {
+            "raw": {
+                "documento": f.get("name"),
+                "contenido": text,
+                "mime_type": f.get("mimeType", ""),
+                "file_id": f["id"]
+            },
+            "source": "google_drive"
+        }
+
+    # ------------------------------------------
+    # API DE FUENTE
+    # ------------------------------------------
+
+    async def iter_pages(self) -> AsyncIterator[List[Dict[str, Any]]]:
+        """Una página por página de listado: se lista la siguiente mientras se descarga la actual."""
+        loop = asyncio.get_running_loop()
+        self._pending_md5 = {}
+
+        folders = [self.folder_id]
+        seen_folders = {self.folder_id}
+
+        while folders:
+            folder_id = folders.pop()
+            next_listing = loop.run_in_executor(self._executor, self._list_page, folder_id, None)
+
+            while next_listing is not None:
+                resp = await next_listing
+                page_token = resp.get("nextPageToken")
+                next_listing = (
+                    loop.run_in_executor(self._executor, self._list_page, folder_id, page_token)
+                    if page_token else None
+                )
+
+                files = []
+                for f in resp.get("files", []):
+                    if f.get("mimeType") == FOLDER_MIME:
+                        if self.recursive and f["id"] not in seen_folders:
+                            seen_folders.add(f["id"])
+                            folders.append(f["id"])
+                        continue
+                    files.append(f)
+
+                changed = await self._filter_unchanged(files)
+                if not changed:
+                    continue
+
+                results = await asyncio.gather(*(self._process_file(f) for f in changed))
+                page = [r for r in results if r is not None]
+                if page:
+                    yield page
 
     async def fetch(self) -> List[Dict[str, Any]]:
         """Lista archivos de Google Drive y extrae texto. Usa Redis como caché de md5."""
-        loop = asyncio.get_event_loop()
-        service = await loop.run_in_executor(None, self._build_service)
-
-        # list files
-        query = f"'{self.folder_id}' in parents and trashed = false"
-        files = []
-        page_token = None
-        while True:
-            resp = service.files().list(
-                q=query,
-                fields="nextPageToken, files(id, name, mimeType, md5Checksum, size, modifiedTime)",
-                pageSize=self.page_size,
-                pageToken=page_token
-            ).execute()
-
-            files.extend(resp.get("files", []))
-            page_token = resp.get("nextPageToken")
-
-            if not page_token:
-                break
-
-        # connect Redis
-        redis = None
-        if self.redis_url:
-            redis = redis_async.from_url(self.redis_url, decode_responses=True)
-
         results = []
-
-        for f in files:
-            file_id = f["id"]
-            name = f.get("name")
-            mime_type = f.get("mimeType", "")
-            md5 = f.get("md5Checksum") or f.get("modifiedTime") or str(f.get("size", "0"))
-
-            cache_key = f"drive:file:{file_id}:md5"
-
-            # check redis
-            if redis:
-                old = await redis.get(cache_key)
-                if old == md5:
-                    logger.info(f"[drive] skip unchanged {name}")
-                    continue
-
-            # download
-            content_bytes = await loop.run_in_executor(None, self._download_file, service, file_id)
-            text = await loop.run_in_executor(None, self._extract_text_from_bytes, content_bytes, mime_type)
-
-            # store md5
-            if redis:
-                await redis.set(cache_key, md5, ex=60 * 60 * 24 * 7)
-
-            results.append({
-                "raw": {
-                    "documento": name,
-                    "contenido": text,
-                    "mime_type": mime_type,
-                    "file_id": file_id
-                },
-                "source": "google_drive"
-            })
-
+        async for page in self.iter_pages():
+            results.extend(page)
         return results
+
+    async def commit(self):
+        redis = get_redis(decode_responses=True)
+        if redis is None or not self._pending_md5:
+            return
+        try:
+            pipe = redis.pipeline(transaction=False)
+            for file_id, md5 in self._pending_md5.items():
+                pipe.set(self._cache_key(file_id), md5, ex=MD5_TTL)
+            await pipe.execute()
+        except Exception as e:
+            logger.warning(f"[drive] no se pudo guardar md5 en redis: {e}")
+            return
+        self._pending_md5 = {}
+
+    async def close(self):
+        self.extractor.shutdown()
+        self._executor.shutdown(wait=False, cancel_futures=True)
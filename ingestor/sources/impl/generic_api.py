@@ -1,56 +1,254 @@
 import aiohttp
 import logging
-from typing import List, Dict, Any
+import datetime
+import orjson
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
 from ingestor.sources.base_source import BaseSource
+from ingestor.sources.conditional import ConditionalCache
+from ingestor.sources.http_session import get_http_session
 
 logger = logging.getLogger("generic_api")
 
 
+def _watermark_sort_key(value: Any) -> Tuple[int, Any]:
+    """
+    Clave de orden del valor de incremental_column: números y fechas por valor (no como
+    texto: "9" > "10", "...+00:00" vs "...Z"); el resto como texto. Sirve igual para los
+    valores de las filas y para el watermark guardado (string) en Redis.
+    """
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return 0, float(value)
+    text = str(value)
+    try:
+        return 0, float(text)
+    except ValueError:
+        pass
+    try:
+        ts = datetime.datetime.fromisoformat(text.replace("Z", "+00:00"))
+    except ValueError:
+        return 2, text
+    if ts.tzinfo is None:
+        ts = ts.replace(tzinfo=datetime.timezone.utc)
+    return 1, ts.timestamp()
+
+
 class GenericAPISource(BaseSource):
     """
-    Versión corregida:
-    - NO agrega page, per_page, ni ningún parámetro adicional.
-    - Usa la URL EXACTA definida en el .env.
-    - Hace una sola llamada (Supabase entrega todo en una sola respuesta).
+    Fuente HTTP genérica (Supabase / PostgREST u otra API JSON).
+    - Usa la URL EXACTA definida en el .env; no agrega page/per_page.
+    - pagination="range": pagina con el header `Range` (PostgREST) y `order` estable
+      (incremental_column y keyset_column como desempate).
+    - pagination="keyset": agrega `order=<col>.asc` y `<col>=gt.<último>` (PostgREST).
+    - pagination="none": una sola llamada (comportamiento original).
+    - incremental_column: si se define, solo trae filas con `<col> >= watermark`.
+      El watermark vive en Redis y se confirma con commit() al terminar un ciclo exitoso.
+    - Requests condicionales (If-None-Match / If-Modified-Since) y digest del body por
+      página (ver conditional.py): las páginas sin cambios no se re-procesan; si no cambió
+      ninguna se cuenta el ciclo en not_modified_count.
+    - Sesión HTTP compartida y de larga vida.
     """
 
-    def __init__(self, url, headers=None, params=None, timeout=20):
+    def __init__(self, url, headers=None, params=None, timeout=20, pagination: str = "none",
+                 page_size: int = 1000, keyset_column: str = "id",
+                 incremental_column: Optional[str] = None, redis=None):
+        if pagination not in ("none", "range", "keyset"):
+            raise ValueError(f"pagination inválida: {pagination}")
+
         self.url = url
         self.headers = headers or {}
         self.params = params or {}
         self.timeout = timeout
+        self.pagination = pagination
+        self.page_size = page_size
+        self.keyset_column = keyset_column
+        self.incremental_column = incremental_column
+        self.redis = redis
 
-    async def fetch(self) -> List[Dict[str, Any]]:
-        logger.info(f"[generic_api] usando headers: {self.headers}")
+        self._pending_watermark: Optional[str] = None
+        self.conditional = ConditionalCache(url, redis=redis)
+        self.not_modified_count = 0
+
+    # ------------------------------------------
+    # WATERMARK
+    # ------------------------------------------
 
-        async with aiohttp.ClientSession() as session:
-            try:
-                async with session.get(
-                    self.url,
-                    headers=self.headers,
-                    params=self.params,  # se respetan los params si existen, NO se agregan nuevos
-                    timeout=self.timeout,
-                ) as resp:
+    @property
+    def _watermark_key(self) -> str:
+        return f"source:{self.url}:watermark"
 
-                    resp.raise_for_status()
-                    data = await resp.json()
+    async def _load_watermark(self) -> Optional[str]:
+        if not self.incremental_column or self.redis is None:
+            return None
+        try:
+            wm = await self.redis.get(self._watermark_key)
+        except Exception as e:
+            logger.warning(f"[generic_api] no se pudo leer watermark de {self.url}: {e}")
+            return None
+        return wm.decode() if isinstance(wm, bytes) else wm
 
-            except Exception as e:
-                logger.warning(f"[generic_api] error fetching from {self.url}: {e}")
-                return []
+    async def commit(self):
+        """Persistir watermark y validadores del último ciclo completo (solo si el ciclo terminó bien)."""
+        await self.conditional.confirm()
 
-        # Normalización
+        if self._pending_watermark is None or self.redis is None:
+            return
+        try:
+            await self.redis.set(self._watermark_key, self._pending_watermark)
+        except Exception as e:
+            logger.warning(f"[generic_api] no se pudo guardar watermark de {self.url}: {e}")
+            return
+        self._pending_watermark = None
+
+    # ------------------------------------------
+    # FETCH
+    # ------------------------------------------
+
+    @staticmethod
+    def _normalize(data) -> List[Any]:
         if isinstance(data, list):
-            return [{"raw": r, "source": self.url} for r in data]
+            return data
 
         if isinstance(data, dict):
-            items = (
+            return (
                 data.get("items")
                 or data.get("data")
                 or data.get("results")
                 or data.get("records")
                 or []
             )
-            return [{"raw": r, "source": self.url} for r in items]
 
         return []
+
+    async def _get(self, params: Dict[str, str], headers: Dict[str, str]):
+        """Retorna (status, headers, body)."""
+        session = get_http_session()
+        async with session.get(
+            self.url,
+            headers=headers,
+            params=params,
+            timeout=aiohttp.ClientTimeout(total=self.timeout),
+        ) as resp:
+            if resp.status in (304, 416):
+                # 304: no modificado / 416: Range fuera de rango, no hay más filas
+                return resp.status, resp.headers, b""
+            resp.raise_for_status()
+            return resp.status, resp.headers, await resp.read()
+
+    def _skip_not_modified(self, reason: str):
+        self.not_modified_count += 1
+        logger.info(
+            f"[generic_api] {self.url} sin cambios en ninguna página ({reason}) "
+            f"(not_modified={self.not_modified_count})"
+        )
+
+    async def iter_pages(self) -> AsyncIterator[List[Dict[str, Any]]]:
+        self._pending_watermark = None
+        self.conditional.begin()
+        await self.conditional.load()
+
+        params = dict(self.params)  # se respetan los params si existen
+        watermark = await self._load_watermark()
+        if watermark is not None:
+            params[self.incremental_column] = f"gte.{watermark}"
+
+        max_seen = watermark
+        max_key = _watermark_sort_key(watermark) if watermark is not None else None
+        offset = 0
+        last_key = None
+        pages = unchanged = 0
+
+        while True:
+            page_params = dict(params)
+            page_headers = dict(self.headers)
+
+            if self.pagination == "range":
+                page_headers["Range-Unit"] = "items"
+                page_headers["Range"] = f"{offset}-{offset + self.page_size - 1}"
+                # orden total y estable entre páginas: sin él los offsets saltean o repiten filas
+                order = [o for o in page_params.get("order", "").split(",") if o]
+                if not order and self.incremental_column:
+                    order.append(f"{self.incremental_column}.asc")
+                if not any(o.split(".")[0] == self.keyset_column for o in order):
+                    order.append(f"{self.keyset_column}.asc")
+                page_params["order"] = ",".join(order)
+
+            elif self.pagination == "keyset":
+                page_params["order"] = f"{self.keyset_column}.asc"
+                page_params["limit"] = str(self.page_size)
+                if last_key is not None:
+                    page_params[self.keyset_column] = f"gt.{last_key}"
+
+            page_id = self.conditional.page_key(page_params, page_headers.get("Range"))
+            page_headers.update(self.conditional.request_headers(page_id))
+
+            status, resp_headers, body = await self._get(page_params, page_headers)
+            pages += 1
+
+            cached = None
+            if status == 304 or (body and self.conditional.same_body(page_id, body)):
+                cached = self.conditional.keep(page_id)
+                if cached is None:
+                    raise RuntimeError(f"304 sin validadores guardados para una página de {self.url}")
+
+            if cached is not None:
+                # página sin cambios: lo guardado alcanza para seguir a la siguiente
+                unchanged += 1
+                count = int(cached.get("rows", 0))
+                page_max = cached.get("max")
+                next_key = cached.get("last")
+            else:
+                rows = self._normalize(orjson.loads(body)) if body else []
+                count = len(rows)
+                page_max = None
+                if self.incremental_column:
+                    page_max_key = None
+                    for r in rows:
+                        v = r.get(self.incremental_column) if isinstance(r, dict) else None
+                        if v is None:
+                            continue
+                        key = _watermark_sort_key(v)
+                        if page_max_key is None or key > page_max_key:
+                            page_max_key, page_max = key, v
+                next_key = rows[-1].get(self.keyset_column) if rows and isinstance(rows[-1], dict) else None
+                if body:
+                    self.conditional.remember(
+                        page_id, resp_headers, body, count,
+                        last=str(next_key) if next_key is not None else None,
+                        max_value=str(page_max) if page_max is not None else None
+                    )
+                if rows:
+                    yield [{"raw": r, "source": self.url} for r in rows]
+
+            if page_max is not None:
+                key = _watermark_sort_key(page_max)
+                if max_key is None or key > max_key:
+                    max_key, max_seen = key, page_max
+
+            if self.pagination == "none" or count < self.page_size:
+                break
+
+            offset += count
+            if self.pagination == "keyset":
+                last_key = next_key
+                if last_key is None:
+                    raise RuntimeError(f"keyset_column '{self.keyset_column}' ausente en {self.url}")
+
+        if pages and unchanged == pages:
+            self._skip_not_modified("304/digest")
+
+        # Solo un recorrido completo deja un watermark pendiente de confirmar
+        if self.incremental_column and max_seen is not None:
+            self._pending_watermark = str(max_seen)
+
+    async def fetch(self) -> List[Dict[str, Any]]:
+        logger.info(f"[generic_api] usando headers: {self.headers}")
+
+        results: List[Dict[str, Any]] = []
+        try:
+            async for page in self.iter_pages():
+                results.extend(page)
+        except Exception as e:
+            logger.warning(f"[generic_api] error fetching from {self.url}: {e}")
+            return []
+
+        return results
@@ -1,14 +1,19 @@
 # ingestor/src/sources/merge_sources.py
 import os
-import json
+import time
 import asyncio
 import logging
-from typing import List, Dict, Any
+from typing import AsyncIterator, Callable, List, Dict, Any, Optional, Set
 from aiolimiter import AsyncLimiter
 from dotenv import load_dotenv
 
 from ingestor.sources.impl.drive_source import DriveSource
 from ingestor.sources.impl.generic_api import GenericAPISource
+from ingestor.sources.extraction import ExtractionEngine
+from ingestor.utils.redis_client import get_redis
+from ingestor.sharding import DEFAULT_PREFIX
+from ingestor.utils.preprocess import canonical_json
+from ingestor.monitoring.metrics import SOURCE_ERRORS, SOURCE_FETCH_SECONDS, SOURCE_RECORDS
 
 logger = logging.getLogger("merge_sources")
 
@@ -27,6 +32,39 @@ limiter = AsyncLimiter(max_rate=GLOBAL_RATE, time_period=1)
 FETCH_TIMEOUT = int(os.getenv("SOURCE_FETCH_TIMEOUT", "20"))
 MAX_RETRIES = int(os.getenv("SOURCE_MAX_RETRIES", "3"))
 
+# Paginación / modo incremental de las APIs (PostgREST)
+API_PAGINATION = os.getenv("API_PAGINATION", "range")  # range | keyset | none
+API_PAGE_SIZE = int(os.getenv("API_PAGE_SIZE", "1000"))
+API_KEYSET_COLUMN = os.getenv("API_KEYSET_COLUMN", "id")
+API_INCREMENTAL_COLUMN = os.getenv("API_INCREMENTAL_COLUMN") or None  # p.ej. updated_at
+
+# Google Drive
+DRIVE_DOWNLOAD_CONCURRENCY = int(os.getenv("DRIVE_DOWNLOAD_CONCURRENCY", "8"))
+DRIVE_RECURSIVE = os.getenv("DRIVE_RECURSIVE", "true").lower() in ("1", "true", "yes")
+
+# Extracción de documentos (pool de procesos)
+EXTRACT_WORKERS = int(os.getenv("EXTRACT_WORKERS", "0")) or None  # None = os.cpu_count()
+EXTRACT_TIMEOUT = float(os.getenv("EXTRACT_TIMEOUT", "60"))
+EXTRACT_MAX_PAGES = int(os.getenv("EXTRACT_MAX_PAGES", "200"))
+EXTRACT_MAX_CHARS = int(os.getenv("EXTRACT_MAX_CHARS", "200000"))
+EXTRACT_MAX_BYTES = int(os.getenv("EXTRACT_MAX_BYTES", str(50 * 1024 * 1024)))
+EXTRACT_MEMORY_MB = int(os.getenv("EXTRACT_MEMORY_MB", "1024"))
+
+# Scheduler: valores por defecto, sobreescribibles por fuente con SCHEDULE_<CLAVE>_<PARAM>
+# (p.ej. SCHEDULE_DRIVE_INTERVAL_S=600)
+SCHEDULE_DEFAULTS = {
+    "interval": float(os.getenv("SCHEDULE_INTERVAL_S", "60")),
+    "jitter": float(os.getenv("SCHEDULE_JITTER", "0.1")),
+    "max_interval": float(os.getenv("SCHEDULE_MAX_INTERVAL_S", "900")),
+    "idle_backoff": float(os.getenv("SCHEDULE_IDLE_BACKOFF", "2.0")),
+}
+_SCHEDULE_ENV = {
+    "interval": "INTERVAL_S",
+    "jitter": "JITTER",
+    "max_interval": "MAX_INTERVAL_S",
+    "idle_backoff": "IDLE_BACKOFF",
+}
+
 # ===============================================
 # API KEY — Leída desde .env
 # ===============================================
@@ -44,6 +82,99 @@ else:
 
 logger.info(f"[merge_sources] usando headers: {SUPABASE_HEADERS}")
 
+# ===============================================
+# CONSTRUCCIÓN DE FUENTES
+# ===============================================
+def _api_source(url: str) -> GenericAPISource:
+    return GenericAPISource(
+        url,
+        headers=SUPABASE_HEADERS,
+        pagination=API_PAGINATION,
+        page_size=API_PAGE_SIZE,
+        keyset_column=API_KEYSET_COLUMN,
+        incremental_column=API_INCREMENTAL_COLUMN,
+        redis=get_redis(decode_responses=True),
+    )
+
+
+def build_sources() -> List[Any]:
+    api1_url = os.getenv("API1_URL")
+    api2_url = os.getenv("API2_URL")
+    drive_folder = os.getenv("DRIVE_FOLDER_ID")
+
+    sources = []
+
+    # Fuentes Supabase
+    if api1_url:
+        src = _api_source(api1_url)
+        src.key = "api1"
+        sources.append(src)
+
+    if api2_url:
+        src = _api_source(api2_url)
+        src.key = "api2"
+        sources.append(src)
+
+    # Google Drive
+    if drive_folder:
+        src = DriveSource(
+            drive_folder,
+            download_concurrency=DRIVE_DOWNLOAD_CONCURRENCY,
+            recursive=DRIVE_RECURSIVE,
+            extractor=ExtractionEngine(
+                workers=EXTRACT_WORKERS,
+                timeout=EXTRACT_TIMEOUT,
+                max_pages=EXTRACT_MAX_PAGES,
+                max_chars=EXTRACT_MAX_CHARS,
+                max_bytes=EXTRACT_MAX_BYTES,
+                memory_limit_mb=EXTRACT_MEMORY_MB,
+                redis=get_redis(),
+            ),
+        )
+        src.key = "drive"
+        sources.append(src)
+
+    return sources
+
+
+def schedule_config(key: str) -> Dict[str, float]:
+    """kwargs de SourceSchedule para una fuente (defaults + overrides por env)."""
+    cfg = dict(SCHEDULE_DEFAULTS)
+    for param, suffix in _SCHEDULE_ENV.items():
+        value = os.getenv(f"SCHEDULE_{key.upper()}_{suffix}")
+        if value:
+            cfg[param] = float(value)
+    return cfg
+
+
+# Las fuentes viven entre ciclos (sesiones, watermarks pendientes, clientes)
+_sources: Optional[List[Any]] = None
+
+
+def get_sources() -> List[Any]:
+    global _sources
+    if _sources is None:
+        _sources = build_sources()
+    return _sources
+
+
+async def close_sources():
+    global _sources
+    for s in _sources or []:
+        try:
+            await s.close()
+        except Exception as e:
+            logger.warning(f"[WARN] cierre de fuente {s.name} falló: {e}")
+    _sources = None
+
+
+async def commit_sources(sources: List[Any]):
+    for s in sources:
+        try:
+            await s.commit()
+        except Exception as e:
+            logger.warning(f"[WARN] commit de fuente {s.name} falló: {e}")
+
 # ===============================================
 # SAFE FETCH (con timeout + retries)
 # ===============================================
@@ -73,31 +204,195 @@ async def _safe_fetch(source):
 
     return []
 
+
+def _wrap(src, r) -> Dict[str, Any]:
+    if not (isinstance(r, dict) and "raw" in r):
+        r = {"raw": r, "source": src.name}
+    # clave estable de la fuente (api1/api2/drive): la usa la resolución de identidad
+    r.setdefault("source_key", src.key or src.name)
+    return r
+
+
+async def _safe_iter_pages(source) -> AsyncIterator[List[Dict[str, Any]]]:
+    """
+    Igual que _safe_fetch pero página a página: timeout por página y
+    reintentos solo mientras no se haya entregado ninguna página
+    (reintentar a mitad de stream duplicaría registros). Un corte a mitad de stream
+    o agotar los reintentos se propaga: el ciclo no debe confirmar la fuente.
+    """
+    label = source.key or source.name
+    fetch_seconds = SOURCE_FETCH_SECONDS.labels(label)
+    records = SOURCE_RECORDS.labels(label)
+
+    error: Optional[BaseException] = None
+    for attempt in range(1, MAX_RETRIES + 1):
+        yielded = False
+        pages = source.iter_pages()
+        try:
+            while True:
+                async with limiter:
+                    start = time.perf_counter()
+                    try:
+                        page = await asyncio.wait_for(pages.__anext__(), timeout=FETCH_TIMEOUT)
+                    except StopAsyncIteration:
+                        return
+                    fetch_seconds.observe(time.perf_counter() - start)
+                yielded = True
+                records.inc(len(page or []))
+                yield [_wrap(source, r) for r in (page or [])]
+
+        except asyncio.TimeoutError as e:
+            SOURCE_ERRORS.labels(label).inc()
+            logger.warning(f"[WARN] timeout fetching {source.name}, attempt={attempt}")
+            error = e
+
+        except Exception as e:
+            SOURCE_ERRORS.labels(label).inc()
+            logger.warning(f"[WARN] error fetching from {source.name}: {e} attempt={attempt}")
+            error = e
+
+        finally:
+            await pages.aclose()
+
+        if yielded:
+            raise RuntimeError(f"{source.name}: stream cortado a mitad de camino") from error
+
+        await asyncio.sleep(0.5 * attempt)
+
+    raise RuntimeError(f"{source.name}: sin datos tras {MAX_RETRIES} intentos") from error
+
 # ===============================================
-# FUNCIÓN PRINCIPAL
+# DEDUPLICACIÓN
 # ===============================================
-async def fetch_all_sources() -> List[Dict[str, Any]]:
+def dedup_key(raw: Dict[str, Any]) -> str:
+    return str(
+        raw.get("dni")
+        or raw.get("correo")
+        or raw.get("id")
+        or raw.get("documento")
+        or canonical_json(raw).decode("utf-8")
+    )
+
+
+def exact_key(raw: Dict[str, Any]) -> str:
+    """Solo registros idénticos (con resolución de identidad, la persona la decide IdentityResolver)."""
+    return canonical_json(raw).decode("utf-8")
+
+
+class Deduplicator:
+    """Dedup incremental para streaming: solo guarda las claves vistas en el ciclo."""
+
+    def __init__(self, key_fn: Callable[[Dict[str, Any]], str] = dedup_key):
+        self.key_fn = key_fn
+        self.seen: Set[str] = set()
+        self.total = 0
+
+    def filter(self, page: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        out = []
+        for w in page:
+            self.total += 1
+            key = self.key_fn(w.get("raw", {}))
+            if key not in self.seen:
+                self.seen.add(key)
+                out.append(w)
+        return out
+
+
+class SourceOwnership:
     """
-    Retorna todos los datos combinados de todas las fuentes:
-    [{"raw": {...}, "source": "..."}]
+    Dueño de cada id_estable entre fuentes (sin resolución de identidad).
+    Cada fuente corre su propio ciclo, así que el Deduplicator ya no ve a las demás: sin
+    esto, dos fuentes con la misma persona (mismo correo -> mismo id_estable) se pisarían
+    en cada ciclo (hash_completo alterna, re-embed sin fin, el backoff nunca arranca).
+    Regla fija, como el dedup del ciclo único: gana la primera fuente del orden configurado.
+     - una fuente no escribe ids cuyo dueño vigente tiene más prioridad; con más prioridad los toma
+     - el dueño refresca su marca a lo sumo cada ttl/4; si deja de traer el id durante ttl
+       (registro borrado en esa fuente), otra fuente puede tomarlo
+     - con Redis el dueño se comparte entre réplicas (hash {prefix}:owners); sin Redis vive
+       en memoria y tras un reinicio el primer ciclo de cada fuente lo vuelve a decidir
     """
 
-    api1_url = os.getenv("API1_URL")
-    api2_url = os.getenv("API2_URL")
-    drive_folder = os.getenv("DRIVE_FOLDER_ID")
+    def __init__(self, priority: List[str], redis=None, ttl: float = 86400, prefix: str = DEFAULT_PREFIX):
+        self.rank = {key: i for i, key in enumerate(priority)}
+        self.redis = redis
+        self.ttl = ttl
+        self.key = f"{prefix}:owners"
+        self._owners: Dict[str, str] = {}
 
-    sources = []
+    def _outranks(self, source: str, owner: str) -> bool:
+        # fuentes fuera del orden van al final, desempatadas por nombre
+        n = len(self.rank)
+        return (self.rank.get(source, n), source) < (self.rank.get(owner, n), owner)
 
-    # Fuentes Supabase
-    if api1_url:
-        sources.append(GenericAPISource(api1_url, headers=SUPABASE_HEADERS))
+    async def _load(self, ids: List[str]) -> List[Optional[str]]:
+        if self.redis is None:
+            return [self._owners.get(i) for i in ids]
+        values = await self.redis.hmget(self.key, ids)
+        return [v.decode() if isinstance(v, bytes) else v for v in values]
 
-    if api2_url:
-        sources.append(GenericAPISource(api2_url, headers=SUPABASE_HEADERS))
+    async def _store(self, claims: Dict[str, str]):
+        if self.redis is None:
+            self._owners.update(claims)
+        else:
+            await self.redis.hset(self.key, mapping=claims)
 
-    # Google Drive
-    if drive_folder:
-        sources.append(DriveSource(drive_folder))
+    async def filter(self, source: str, items: List[Dict[str, Any]],
+                     now: Optional[float] = None) -> List[Dict[str, Any]]:
+        """Items de `source` que le corresponde escribir (y registra su dueño)."""
+        ids = list({it["id_estable"] for it in items if it["id_estable"] is not None})
+        if not ids:
+            return items
+        now = time.time() if now is None else now
+        owners = dict(zip(ids, await self._load(ids)))
+
+        claims: Dict[str, str] = {}
+        allowed: Set[str] = set()
+        for id_estable, value in owners.items():
+            owner, _, ts = (value or "").rpartition("|")
+            age = now - float(ts) if value else None
+            if value is None or age > self.ttl or self._outranks(source, owner):
+                claims[id_estable] = f"{source}|{now}"
+            elif owner == source:
+                if age > self.ttl / 4:
+                    claims[id_estable] = f"{source}|{now}"
+            else:
+                continue
+            allowed.add(id_estable)
+        if claims:
+            await self._store(claims)
+
+        return [it for it in items if it["id_estable"] is None or it["id_estable"] in allowed]
+
+
+def stream_sources(sources: Optional[List[Any]] = None,
+                   dedup: Optional[Deduplicator] = None) -> List[Any]:
+    """
+    Un generador async por fuente (para Pipeline.source): cada uno entrega
+    páginas ya envueltas y deduplicadas contra todo lo visto en el ciclo.
+    """
+    sources = get_sources() if sources is None else sources
+    dedup = dedup or Deduplicator()
+
+    def producer(src):
+        async def gen():
+            async for page in _safe_iter_pages(src):
+                page = dedup.filter(page)
+                if page:
+                    yield page
+        return gen
+
+    return [producer(s) for s in sources]
+
+# ===============================================
+# FUNCIÓN PRINCIPAL
+# ===============================================
+async def fetch_all_sources() -> List[Dict[str, Any]]:
+    """
+    Retorna todos los datos combinados de todas las fuentes:
+    [{"raw": {...}, "source": "..."}]
+    """
+
+    sources = build_sources()
 
     # Ejecutar concurrentemente
     tasks = [asyncio.create_task(_safe_fetch(s)) for s in sources]
@@ -110,34 +405,9 @@ async def fetch_all_sources() -> List[Dict[str, Any]]:
             continue
 
         for r in items:
-            if isinstance(r, dict) and "raw" in r:
-                merged.append(r)
-            else:
-                merged.append({
-                    "raw": r,
-                    "source": getattr(src, "url", getattr(src, "folder_id", "unknown"))
-                })
-
-    # ===============================================
-    # DEDUPLICACIÓN
-    # ===============================================
-    seen = set()
-    deduped = []
-
-    for w in merged:
-        raw = w.get("raw", {})
-
-        key = str(
-            raw.get("dni")
-            or raw.get("correo")
-            or raw.get("id")
-            or raw.get("documento")
-            or json.dumps(raw, sort_keys=True)
-        )
+            merged.append(_wrap(src, r))
 
-        if key not in seen:
-            seen.add(key)
-            deduped.append(w)
+    deduped = Deduplicator().filter(merged)
 
     logger.info(f"[merge_sources] fetched {len(merged)} items -> deduped {len(deduped)}")
 
@@ -3,46 +3,235 @@ import aiohttp
 import asyncio
 import backoff
 import logging
+import time
+import datetime
+import email.utils
+import numpy as np
+import orjson
+from typing import List, Optional, Tuple
+
+from ingestor.utils.tokens import AdaptiveTokenBudget, TokenEstimator, plan_batches
+from ingestor.monitoring.metrics import (
+    EMBED_CACHE_LOOKUPS, TEI_CALLS, TEI_IN_FLIGHT, TEI_REQUEST_SECONDS, TEI_SUBBATCH_TEXTS, TEI_TOKEN_BUDGET
+)
+
+
+class TEIOverloadError(Exception):
+    """TEI respondió 413 (batch demasiado grande) o 429 (saturado)."""
+
+    def __init__(self, status: int, retry_after: Optional[float] = None):
+        super().__init__(f"TEI overload status={status}")
+        self.status = status
+        self.retry_after = retry_after
+
+
+def _parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Retry-After en segundos o como fecha HTTP; None si no se entiende."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=datetime.timezone.utc)
+    return max(0.0, (when - datetime.datetime.now(datetime.timezone.utc)).total_seconds())
+
 
 class TEIClient:
-    def __init__(self, base_url: str, max_batch: int = 32, timeout: int = 60):
+    def __init__(self, base_url: str, max_batch: int = 32, timeout: int = 60, cache=None,
+                 max_batch_tokens: int = 16384, target_latency: float = 1.0,
+                 tokenizer_file: Optional[str] = None, max_input_tokens: int = 512,
+                 max_in_flight: int = 4, max_retry_time: float = 60):
         self.base_url = base_url.rstrip('/')
         self.max_batch = max_batch
         self.timeout = timeout
+        self.max_in_flight = max_in_flight
+        self.max_retry_time = max_retry_time
+        self._in_flight = asyncio.Semaphore(max_in_flight)
+        self._session: Optional[aiohttp.ClientSession] = None
+        self.cache = cache  # EmbeddingCache opcional
+        self.tokens = TokenEstimator(tokenizer_file, max_input_tokens=max_input_tokens)
+        self.budget = AdaptiveTokenBudget(
+            initial=max_batch_tokens // 2,
+            minimum=max_input_tokens,
+            maximum=max_batch_tokens,
+            target_latency=target_latency,
+        )
         self.logger = logging.getLogger("TEIClient")
 
-    async def _post(self, session, texts):
+    # ------------------------------------------
+    # SESIÓN HTTP PROPIA (keep-alive)
+    # ------------------------------------------
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.max_in_flight * 2,
+                limit_per_host=self.max_in_flight,
+                keepalive_timeout=60,
+                ttl_dns_cache=300,
+            )
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+            )
+        return self._session
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+
+    # ------------------------------------------
+    # REQUESTS
+    # ------------------------------------------
+
+    async def _post(self, session, texts) -> np.ndarray:
         url = f"{self.base_url}/embed"
-        payload = {"inputs": texts}
+        body = orjson.dumps({"inputs": texts, "truncate": True})
+
+        async with session.post(url, data=body, headers={"Content-Type": "application/json"}) as resp:
+            if resp.status in (413, 429):
+                raise TEIOverloadError(resp.status, _parse_retry_after(resp.headers.get("Retry-After")))
 
-        async with session.post(url, json=payload, timeout=self.timeout) as resp:
             resp.raise_for_status()
-            data = await resp.json()
+            data = orjson.loads(await resp.read())
 
             # 1️⃣ TEI tradicional: devuelve directamente una lista de vectores
             if isinstance(data, list):
-                return data
+                vectors = data
 
             # 2️⃣ Formato {"embeddings": [...]}
-            if isinstance(data, dict) and "embeddings" in data:
-                return data["embeddings"]
+            elif isinstance(data, dict) and "embeddings" in data:
+                vectors = data["embeddings"]
 
             # 3️⃣ Formato {"data": [{embedding: [...]}, ...]}
-            if isinstance(data, dict) and "data" in data:
-                return [d.get("embedding") for d in data["data"]]
+            elif isinstance(data, dict) and "data" in data:
+                vectors = [d.get("embedding") for d in data["data"]]
 
             # 4️⃣ Cualquier otra cosa es error
-            self.logger.error(f"TEI devolvió formato inesperado: {data}")
-            raise RuntimeError("Formato TEI inesperado sin embeddings")
+            else:
+                self.logger.error(f"TEI devolvió formato inesperado: {data}")
+                raise RuntimeError("Formato TEI inesperado sin embeddings")
+
+            # Matriz float32 (n, dim): de aquí en adelante no hay listas de floats Python
+            matrix = np.asarray(vectors, dtype=np.float32)
+            if matrix.ndim != 2 or matrix.shape[0] != len(texts):
+                raise RuntimeError(f"TEI devolvió embeddings con shape inesperado {matrix.shape}")
+            return matrix
+
+    async def _post_with_retry(self, session, texts) -> Tuple[np.ndarray, float]:
+        # Devuelve también la latencia del POST sin la espera del semáforo: con sub-batches
+        # en cola, contarla haría bajar el presupuesto -> más sub-batches -> más cola
+        # Reintento a nivel de sub-batch: un chunk lento o caído no repite a los demás
+        @backoff.on_exception(backoff.expo, (aiohttp.ClientError, asyncio.TimeoutError),
+                              max_time=self.max_retry_time)
+        async def attempt():
+            async with self._in_flight:
+                TEI_IN_FLIGHT.inc()
+                start = time.perf_counter()
+                outcome = "error"
+                try:
+                    matrix = await self._post(session, texts)
+                    outcome = "ok"
+                    return matrix, time.perf_counter() - start
+                except TEIOverloadError as e:
+                    outcome = str(e.status)
+                    raise
+                finally:
+                    TEI_IN_FLIGHT.dec()
+                    TEI_CALLS.labels(outcome).inc()
+                    TEI_REQUEST_SECONDS.observe(time.perf_counter() - start)
 
-    @backoff.on_exception(backoff.expo, (aiohttp.ClientError, asyncio.TimeoutError), max_time=60)
-    async def embed_batch(self, session: aiohttp.ClientSession, texts: list):
-        all_embeddings = []
+        return await attempt()
 
-        for i in range(0, len(texts), self.max_batch):
-            chunk = texts[i:i + self.max_batch]
-            self.logger.info(f"→ TEI embedding batch {i}-{i+len(chunk)}")
-            emb = await self._post(session, chunk)
-            all_embeddings.extend(emb)
+    async def _post_adaptive(self, session, texts: List[str], out: list, indices: List[int]):
+        """
+        POST de un sub-batch; ante 413 lo parte en dos, ante 429 espera y reintenta hasta
+        max_retry_time (después propaga el TEIOverloadError: error transitorio para la ingesta).
+        """
+        deadline = time.monotonic() + self.max_retry_time
+        while True:
+            try:
+                matrix, latency = await self._post_with_retry(session, [texts[i] for i in indices])
+            except TEIOverloadError as e:
+                budget = self.budget.on_overload(e.status)
+                self.logger.warning(f"→ TEI {e.status}: presupuesto de tokens -> {budget}")
+
+                if e.status == 413 and len(indices) > 1:
+                    mid = len(indices) // 2
+                    await asyncio.gather(
+                        self._post_adaptive(session, texts, out, indices[:mid]),
+                        self._post_adaptive(session, texts, out, indices[mid:]),
+                    )
+                    return
+                if e.status == 413:
+                    raise RuntimeError("TEI rechazó (413) un único texto; revisar max_input_tokens")
+
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise
+                await asyncio.sleep(min(e.retry_after or 0.5, remaining))
+                continue
+
+            self.budget.on_success(latency)
+            for i, row in zip(indices, matrix):
+                out[i] = row  # filas float32 1-D (vistas, sin copia)
+            return
+
+    async def _embed_uncached(self, session: aiohttp.ClientSession, texts: list):
+        # Batches por presupuesto de tokens (ordenados por longitud), enviados en paralelo
+        # hasta max_in_flight; el resultado vuelve en el orden original de `texts`.
+        lengths = self.tokens.count_many(texts)
+        batches = plan_batches(lengths, int(self.budget), self.max_batch)
+        all_embeddings = [None] * len(texts)
+
+        self.logger.info(
+            f"→ TEI embedding {len(texts)} textos en {len(batches)} sub-batches "
+            f"(presupuesto {int(self.budget)} tokens, max_in_flight {self.max_in_flight})"
+        )
+        TEI_TOKEN_BUDGET.set(int(self.budget))
+        for indices in batches:
+            TEI_SUBBATCH_TEXTS.observe(len(indices))
+        await asyncio.gather(*(
+            self._post_adaptive(session, texts, all_embeddings, indices) for indices in batches
+        ))
+        TEI_TOKEN_BUDGET.set(int(self.budget))
 
         return all_embeddings
+
+    async def embed_batch(self, session: Optional[aiohttp.ClientSession], texts: list):
+        """session=None usa la sesión propia del cliente (pool keep-alive)."""
+        session = session or self._get_session()
+
+        if self.cache is None:
+            return await self._embed_uncached(session, texts)
+
+        embeddings = await self.cache.get_many(texts)
+        missing = [i for i, e in enumerate(embeddings) if e is None]
+        EMBED_CACHE_LOOKUPS.labels("hit").inc(len(texts) - len(missing))
+        EMBED_CACHE_LOOKUPS.labels("miss").inc(len(missing))
+
+        if missing:
+            # Solo textos distintos van a TEI (registros con el mismo texto comparten embedding)
+            unique_texts = list(dict.fromkeys(texts[i] for i in missing))
+            fresh = await self._embed_uncached(session, unique_texts)
+
+            if len(fresh) != len(unique_texts):
+                raise RuntimeError("TEI devolvió una cantidad de embeddings distinta a la solicitada")
+
+            await self.cache.put_many(unique_texts, fresh)
+
+            by_text = dict(zip(unique_texts, fresh))
+            for i in missing:
+                embeddings[i] = by_text[texts[i]]
+
+        self.logger.info(
+            f"→ TEI cache: {len(texts) - len(missing)} hits, {len(missing)} misses "
+            f"(acumulado {self.cache.stats()})"
+        )
+        return embeddings
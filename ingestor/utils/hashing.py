@@ -1,5 +1,4 @@
 import hashlib
-import json
 
 def sha256_hex(s: str) -> str:
     return hashlib.sha256(s.encode('utf-8')).hexdigest()
@@ -10,5 +9,6 @@ def compute_hash_estable(record: dict) -> str:
     return sha256_hex(f"{dni}|{correo}")
 
 def compute_hash_completo(record: dict) -> str:
-    t = json.dumps(record, sort_keys=True, ensure_ascii=False)
-    return sha256_hex(t)
+    # Mismo hash que preprocess_record (json canónico + blake2b-128)
+    from ingestor.utils.preprocess import canonical_json, digest_canonical
+    return digest_canonical(canonical_json(record))
@@ -0,0 +1,56 @@
+# ingestor/utils/pgvector_codec.py
+"""
+Codec binario de asyncpg para el tipo `vector` de pgvector.
+Formato binario de pgvector: uint16 dim | uint16 reservado (0) | dim x float32 big-endian.
+Evita formatear/parsear la representación texto "[0.1, 0.2, ...]" en ambos lados.
+"""
+
+import struct
+from typing import Any, Optional
+
+import asyncpg
+import numpy as np
+
+_HEADER = struct.Struct(">HH")
+_BE_FLOAT32 = np.dtype(">f4")
+
+
+def to_float32_vector(emb: Any, expected_dim: Optional[int] = None) -> np.ndarray:
+    """
+    Normaliza un embedding (ndarray, array('f'), lista) a un ndarray float32 1-D.
+    Para ndarray float32 y array('f') no hay copia (se usa el buffer directamente).
+    """
+    arr = np.asarray(emb, dtype=np.float32)
+    if arr.ndim != 1:
+        raise ValueError(f"Embedding debe ser un vector 1-D, recibido shape {arr.shape}")
+    if expected_dim is not None and arr.shape[0] != expected_dim:
+        raise ValueError(f"Embedding length {arr.shape[0]} != expected {expected_dim}")
+    return arr
+
+
+def encode_vector(emb: Any) -> bytes:
+    arr = to_float32_vector(emb)
+    return _HEADER.pack(arr.shape[0], 0) + arr.astype(_BE_FLOAT32, copy=False).tobytes()
+
+
+def decode_vector(data: bytes) -> np.ndarray:
+    dim, _ = _HEADER.unpack_from(data)
+    return np.frombuffer(data, dtype=_BE_FLOAT32, count=dim, offset=_HEADER.size).astype(np.float32)
+
+
+async def register_vector_codec(conn: asyncpg.Connection):
+    """Registrar en cada conexión (usar como `init=` de create_pool)."""
+    schema = await conn.fetchval(
+        "SELECT n.nspname FROM pg_type t JOIN pg_namespace n ON n.oid = t.typnamespace "
+        "WHERE t.typname = 'vector' LIMIT 1"
+    )
+    if schema is None:
+        raise RuntimeError("Tipo 'vector' no encontrado: ¿está instalada la extensión pgvector?")
+
+    await conn.set_type_codec(
+        "vector",
+        schema=schema,
+        encoder=encode_vector,
+        decoder=decode_vector,
+        format="binary",
+    )
@@ -0,0 +1,122 @@
+# ingestor/utils/preprocess.py
+"""
+Preprocesamiento de un registro en una sola pasada.
+Reemplaza a extract_identifier_field + compute_hash_completo + build_texto_unificado
+(tres recorridos del JSON) por:
+ - un recorrido en Python que saca a la vez el identificador y el texto unificado
+   (mismo resultado que las funciones originales)
+ - una serialización canónica (orjson, claves ordenadas) que se reutiliza para el
+   hash de cambios y como payload jsonb del upsert
+ - blake2b-128 en lugar de sha256 para el hash de cambios
+ - con plantilla de proyección (ver projection.py) el texto sale de la plantilla y el
+   recorrido solo busca el identificador
+"""
+
+import json
+import hashlib
+from typing import Any, Callable, Optional, Tuple
+
+import orjson
+
+from ingestor.utils.hashing import sha256_hex
+
+_NOISE_KEYS = frozenset(("id", "uuid", "_id"))
+_EMPTY_VALUES = (None, "", " ", "null")
+_ORJSON_OPTS = orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS
+
+# (id_estable, hash_completo, json canónico, texto_unificado)
+Prepared = Tuple[Optional[str], str, str, str]
+
+
+def canonical_json(record: Any) -> bytes:
+    """Serialización determinística (claves ordenadas, sin espacios)."""
+    try:
+        return orjson.dumps(record, option=_ORJSON_OPTS)
+    except TypeError:
+        # tipos que orjson no serializa (Decimal, set, ...): camino lento
+        return json.dumps(record, sort_keys=True, ensure_ascii=False, separators=(",", ":"),
+                          default=str).encode("utf-8")
+
+
+def digest_canonical(canonical: bytes) -> str:
+    return hashlib.blake2b(canonical, digest_size=16).hexdigest()
+
+
+_MISSING = object()
+
+
+def _find_field(obj: Any, target: str) -> Any:
+    # primer match en profundidad, igual que extract_identifier_field
+    if isinstance(obj, dict):
+        for k, v in obj.items():
+            kl = k.lower() if isinstance(k, str) else str(k).lower()
+            if kl == target:
+                return v
+            if isinstance(v, (dict, list)):
+                found = _find_field(v, target)
+                if found is not _MISSING:
+                    return found
+    elif isinstance(obj, list):
+        for item in obj:
+            if isinstance(item, (dict, list)):
+                found = _find_field(item, target)
+                if found is not _MISSING:
+                    return found
+    return _MISSING
+
+
+def compile_preprocessor(id_field: str = "email", text_fn: Optional[Callable[[Any], str]] = None,
+                         salt: bytes = b"") -> Callable[[Any], Prepared]:
+    """
+    Arma la función de preprocesamiento especializada para el campo identificador.
+    text_fn reemplaza al texto universal; salt se mezcla en hash_completo para que un
+    cambio de plantilla cuente como cambio del registro (se re-embebe con el texto nuevo).
+    """
+    target = id_field.lower()
+
+    if text_fn is not None:
+        def preprocess_projected(record: Any) -> Prepared:
+            found = _find_field(record, target)
+            id_estable = sha256_hex(str(found).strip().lower()) if found is not _MISSING else None
+            canonical = canonical_json(record)
+            return id_estable, digest_canonical(canonical + salt), canonical.decode("utf-8"), text_fn(record)
+
+        return preprocess_projected
+
+    def preprocess(record: Any) -> Prepared:
+        parts = []
+        append = parts.append
+        found = []
+
+        def walk(obj):
+            if isinstance(obj, dict):
+                for k, v in obj.items():
+                    kl = k.lower() if isinstance(k, str) else str(k).lower()
+                    # primer match en profundidad, igual que extract_identifier_field
+                    if not found and kl == target:
+                        found.append(v)
+                    # no agregamos claves que sean ruido
+                    if kl not in _NOISE_KEYS:
+                        append(str(k))
+                    walk(v)
+
+            elif isinstance(obj, list):
+                for item in obj:
+                    walk(item)
+
+            # valores atómicos (ignoramos vacíos)
+            elif obj not in _EMPTY_VALUES:
+                append(str(obj))
+
+        walk(record)
+
+        id_estable = sha256_hex(str(found[0]).strip().lower()) if found else None
+        canonical = canonical_json(record)
+        texto = " ".join(" ".join(parts).split())  # normalizar espacios
+
+        return id_estable, digest_canonical(canonical + salt), canonical.decode("utf-8"), texto
+
+    return preprocess
+
+
+preprocess_record = compile_preprocessor("email")
@@ -0,0 +1,275 @@
+# ingestor/utils/projection.py
+"""
+Texto unificado por plantilla de fuente (TEXT_TEMPLATES_FILE), en lugar del recorrido
+universal que vuelca todas las claves y valores (URLs, booleanos, nombres de campo, ...).
+
+Cada plantilla dice qué campos entran, en qué orden, con qué etiqueta y con qué tope de
+tokens; el texto completo respeta además un presupuesto total de tokens: los campos se
+agregan en orden y el que no entra se corta (los siguientes se descartan), así lo que se
+pierde es siempre lo menos importante y no un corte de TEI en cualquier lugar.
+
+    {
+      "token_budget": 480,
+      "sources": {
+        "api1": {
+          "fields": [
+            {"path": "nombre|nombres", "label": "Nombre"},
+            {"path": "area|departamento", "label": "Área"},
+            {"path": "skills", "label": "Habilidades", "max_items": 15},
+            {"path": "experiencia.cargo", "label": "Cargos", "max_items": 5},
+            {"path": "resumen", "label": "Resumen", "max_tokens": 200}
+          ]
+        },
+        "drive": {"token_budget": 0, "fields": [{"path": "contenido", "label": "CV"}]}
+      }
+    }
+
+ - path: claves separadas por "."; las listas se recorren solas (experiencia.cargo = el
+   cargo de cada experiencia); "a|b" = alternativas, gana la primera con valor
+ - max_tokens / max_items: topes por campo; token_budget: total (0 = sin límite; por
+   defecto TEXT_TOKEN_BUDGET)
+ - registros mezclados por la resolución de identidad ("api1,drive"): se combinan las
+   plantillas de sus fuentes en ese orden
+ - fuentes sin plantilla: texto universal de siempre (mismo texto y mismo hash)
+
+Cada plantilla se compila una vez a una función de extracción; su huella entra en
+hash_completo, así al cambiar la plantilla los registros afectados se re-embeben.
+"""
+
+import json
+import logging
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from ingestor.utils.preprocess import Prepared, canonical_json, compile_preprocessor, digest_canonical
+from ingestor.utils.tokens import SPECIAL_TOKENS, TokenEstimator
+
+logger = logging.getLogger("projection")
+
+_NOISE_KEYS = frozenset(("id", "uuid", "_id"))
+_EMPTY_VALUES = (None, "", " ", "null")
+_FIELD_OPTIONS = frozenset(("path", "label", "max_tokens", "max_items"))
+_SOURCE_OPTIONS = frozenset(("fields", "token_budget"))
+
+FIELD_SEPARATOR = "\n"
+
+# caracteres crudos (con espacios repetidos) por token que vale la pena mirar de un campo largo
+_RAW_CHARS_PER_TOKEN = 16
+
+
+#############################################
+# EXTRACCIÓN DE VALORES
+#############################################
+
+def _collect(obj: Any, segments: Tuple[str, ...], i: int, out: List[Any]):
+    if isinstance(obj, list):
+        for item in obj:
+            _collect(item, segments, i, out)
+    elif i == len(segments):
+        out.append(obj)
+    elif isinstance(obj, dict):
+        child = obj.get(segments[i])
+        if child is not None:
+            _collect(child, segments, i + 1, out)
+
+
+def _leaf_values(obj: Any, out: List[str]):
+    # hoja con estructura (objeto entero en la plantilla): solo valores, sin nombres de campo
+    if isinstance(obj, dict):
+        for k, v in obj.items():
+            if (k.lower() if isinstance(k, str) else k) not in _NOISE_KEYS:
+                _leaf_values(v, out)
+    elif isinstance(obj, list):
+        for item in obj:
+            _leaf_values(item, out)
+    elif obj not in _EMPTY_VALUES:
+        out.append(str(obj))
+
+
+def compile_getter(path: str) -> Callable[[Any], List[str]]:
+    """'experiencia.cargo|cargos' -> función registro -> valores (strings no vacíos)."""
+    alternatives = [tuple(p.strip() for p in alt.split(".")) for alt in path.split("|") if alt.strip()]
+    if not alternatives or any(not all(seg) for seg in alternatives):
+        raise ValueError(f"path inválido en plantilla: {path!r}")
+
+    def get(record: Any) -> List[str]:
+        for segments in alternatives:
+            found: List[Any] = []
+            _collect(record, segments, 0, found)
+            values: List[str] = []
+            for v in found:
+                _leaf_values(v, values)
+            if values:
+                return values
+        return []
+
+    return get
+
+
+#############################################
+# PLANTILLAS
+#############################################
+
+class Template:
+    def __init__(self, fields: Sequence[Dict[str, Any]], token_budget: int):
+        self.fields = list(fields)
+        self.token_budget = token_budget
+
+    @property
+    def fingerprint(self) -> str:
+        return digest_canonical(canonical_json({"fields": self.fields, "token_budget": self.token_budget}))
+
+
+def _parse_field(spec: Any, source: str) -> Dict[str, Any]:
+    if isinstance(spec, str):
+        spec = {"path": spec}
+    if not isinstance(spec, dict) or not spec.get("path"):
+        raise ValueError(f"campo inválido en la plantilla de {source}: {spec!r}")
+    unknown = set(spec) - _FIELD_OPTIONS
+    if unknown:
+        raise ValueError(f"opciones desconocidas en la plantilla de {source}: {sorted(unknown)}")
+    for opt in ("max_tokens", "max_items"):
+        if opt in spec and (not isinstance(spec[opt], int) or spec[opt] < 1):
+            raise ValueError(f"{opt} debe ser un entero positivo (plantilla de {source}): {spec!r}")
+    return {
+        "path": str(spec["path"]),
+        "label": spec.get("label") or None,
+        "max_tokens": spec.get("max_tokens"),
+        "max_items": spec.get("max_items"),
+    }
+
+
+def parse_templates(config: Dict[str, Any], default_budget: int) -> Dict[str, Template]:
+    """Config (JSON ya cargado) -> {fuente: Template}; ValueError si algo no cierra."""
+    if not isinstance(config, dict) or not isinstance(config.get("sources"), dict):
+        raise ValueError("la config de plantillas debe tener un objeto 'sources'")
+    budget = int(config.get("token_budget", default_budget))
+
+    templates: Dict[str, Template] = {}
+    for source, spec in config["sources"].items():
+        if isinstance(spec, list):
+            spec = {"fields": spec}
+        if not isinstance(spec, dict) or not spec.get("fields"):
+            raise ValueError(f"la plantilla de {source} no tiene 'fields'")
+        unknown = set(spec) - _SOURCE_OPTIONS
+        if unknown:
+            raise ValueError(f"opciones desconocidas en la plantilla de {source}: {sorted(unknown)}")
+        fields = [_parse_field(f, source) for f in spec["fields"]]
+        for f in fields:
+            compile_getter(f["path"])  # validar ya, no al primer registro
+        templates[source] = Template(fields, int(spec.get("token_budget", budget)))
+    return templates
+
+
+def combine_templates(templates: Sequence[Template]) -> Template:
+    """Plantillas de varias fuentes (en orden de prioridad): campos sin repetir path."""
+    if len(templates) == 1:
+        return templates[0]
+    fields, seen = [], set()
+    for t in templates:
+        for f in t.fields:
+            if f["path"] not in seen:
+                seen.add(f["path"])
+                fields.append(f)
+    budgets = [t.token_budget for t in templates]
+    return Template(fields, 0 if 0 in budgets else max(budgets))
+
+
+#############################################
+# COMPILACIÓN A FUNCIÓN DE TEXTO
+#############################################
+
+class TextProjector:
+    def __init__(self, templates: Dict[str, Template], estimator: TokenEstimator, id_field: str = "email"):
+        self.templates = templates
+        self.estimator = estimator
+        self.id_field = id_field
+        self._generic = compile_preprocessor(id_field)
+        self._compiled: Dict[str, Callable[[Any], Prepared]] = {}
+
+    @property
+    def sources(self) -> List[str]:
+        return list(self.templates)
+
+    def compile(self, template: Template) -> Callable[[Any], str]:
+        fields = [
+            (compile_getter(f["path"]), f"{f['label']}: " if f["label"] else "", f["max_tokens"], f["max_items"])
+            for f in template.fields
+        ]
+        budget = template.token_budget
+        fit = self.estimator.fit
+
+        def text_fn(record: Any) -> str:
+            parts = []
+            remaining = budget - SPECIAL_TOKENS if budget else 0
+            for get, label, max_tokens, max_items in fields:
+                if budget and remaining <= 0:
+                    break
+                values = get(record)
+                if not values:
+                    continue
+                values = list(dict.fromkeys(values))
+                if max_items:
+                    values = values[:max_items]
+                raw = ", ".join(values)
+                # de un texto largo solo puede entrar el principio: no normalizar el resto
+                limit = min(max_tokens or remaining, remaining) if budget else max_tokens
+                if limit and len(raw) > limit * _RAW_CHARS_PER_TOKEN:
+                    raw = raw[:int(limit * _RAW_CHARS_PER_TOKEN)]
+                value = " ".join(raw.split())  # normalizar espacios
+                if max_tokens:
+                    value = fit(value, max_tokens)[0]
+                    if not value:
+                        continue
+                # el separador se mide con el campo: la suma por campo acota al texto entero
+                prefix = (FIELD_SEPARATOR if parts else "") + label
+                part = prefix + value
+                if budget:
+                    part, used, whole = fit(part, remaining)
+                    if not whole:
+                        # el campo que no entra se corta y los siguientes quedan afuera
+                        if len(part) > len(prefix):
+                            parts.append(part)
+                        break
+                    remaining -= used
+                parts.append(part)
+            return "".join(parts)
+
+        return text_fn
+
+    def preprocessor_for(self, source_key: Optional[str]) -> Callable[[Any], Prepared]:
+        """
+        Preprocesador (id, hash, json, texto) para la fuente; "api1,drive" combina las
+        plantillas de ambas. Sin plantilla: el texto universal de siempre.
+        """
+        key = source_key or ""
+        pre = self._compiled.get(key)
+        if pre is not None:
+            return pre
+
+        templates = [self.templates[s] for s in key.split(",") if s in self.templates]
+        if not templates:
+            pre = self._generic
+        else:
+            template = combine_templates(templates)
+            # la huella incluye si el conteo es exacto: cambia dónde caen los cortes
+            salt = f"|tpl:{template.fingerprint}:{int(self.estimator.exact)}".encode("utf-8")
+            pre = compile_preprocessor(self.id_field, text_fn=self.compile(template), salt=salt)
+        self._compiled[key] = pre
+        return pre
+
+
+def load_projector(path: Optional[str], estimator: TokenEstimator, token_budget: int = 0,
+                   id_field: str = "email") -> Optional[TextProjector]:
+    """TEXT_TEMPLATES_FILE -> TextProjector (None sin archivo). Config inválida = error al arrancar."""
+    if not path:
+        return None
+    with open(path, "r", encoding="utf-8") as fh:
+        config = json.load(fh)
+    templates = parse_templates(config, token_budget)
+    logger.info(json.dumps({
+        "event": "text_templates_loaded",
+        "file": path,
+        "sources": {s: {"fields": len(t.fields), "token_budget": t.token_budget} for s, t in templates.items()},
+        "exact_tokens": estimator.exact
+    }))
+    return TextProjector(templates, estimator, id_field)
@@ -0,0 +1,36 @@
+# ingestor/utils/redis_client.py
+import os
+import logging
+from typing import Dict, Optional
+
+from redis import asyncio as redis_async
+
+logger = logging.getLogger("redis_client")
+
+# Un cliente por modo de decodificación, compartido por todo el proceso.
+_clients: Dict[bool, redis_async.Redis] = {}
+
+
+def get_redis(decode_responses: bool = False) -> Optional[redis_async.Redis]:
+    """
+    Devuelve el cliente Redis compartido del proceso.
+    Si REDIS_URL no está configurada retorna None (Redis es opcional).
+    """
+    url = os.getenv("REDIS_URL")
+    if not url:
+        return None
+
+    client = _clients.get(decode_responses)
+    if client is None:
+        client = redis_async.from_url(url, decode_responses=decode_responses)
+        _clients[decode_responses] = client
+    return client
+
+
+async def close_redis():
+    for client in list(_clients.values()):
+        try:
+            await client.close()
+        except Exception as e:
+            logger.warning(f"[redis] error cerrando cliente: {e}")
+    _clients.clear()
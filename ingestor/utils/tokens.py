@@ -0,0 +1,188 @@
+# ingestor/utils/tokens.py
+"""
+Estimación de tokens para armar batches de TEI por presupuesto.
+ - si hay un tokenizer.json local (TEI_TOKENIZER_FILE) y está instalada la
+   librería `tokenizers`, se cuenta exacto
+ - si no, heurística barata basada en caracteres y palabras (conservadora)
+"""
+
+import os
+import re
+import logging
+from typing import List, Optional, Sequence, Tuple
+
+logger = logging.getLogger("tokens")
+
+# [CLS] + [SEP] que agrega el modelo a cada input
+SPECIAL_TOKENS = 2
+
+_WORD_RE = re.compile(r"\S+")
+
+# ventana de fit() con tokenizer exacto: cota de caracteres por token (WordPiece rara vez pasa de 8)
+_FIT_WINDOW_CHARS_PER_TOKEN = 8
+
+
+class TokenEstimator:
+    def __init__(self, tokenizer_file: Optional[str] = None, max_input_tokens: int = 512):
+        self.max_input_tokens = max_input_tokens
+        self._tokenizer = None
+
+        if tokenizer_file and os.path.exists(tokenizer_file):
+            try:
+                from tokenizers import Tokenizer
+                self._tokenizer = Tokenizer.from_file(tokenizer_file)
+                logger.info(f"[tokens] usando tokenizer local {tokenizer_file}")
+            except Exception as e:
+                logger.warning(f"[tokens] no se pudo cargar {tokenizer_file}, usando heurística: {e}")
+
+    @property
+    def exact(self) -> bool:
+        return self._tokenizer is not None
+
+    def count(self, text: str) -> int:
+        """Tokens del texto completo (sin truncar)."""
+        if self._tokenizer is not None:
+            return len(self._tokenizer.encode(text, add_special_tokens=True).ids)
+
+        # WordPiece en español parte bastante las palabras: ~1.4 tokens/palabra,
+        # y los textos con URLs/códigos rinden ~1 token cada 3 caracteres.
+        words = len(text.split())
+        return int(max(words * 1.4, len(text) / 3.0)) + SPECIAL_TOKENS
+
+    def count_truncated(self, text: str) -> int:
+        """Tokens que TEI procesa realmente (trunca a max_input_tokens)."""
+        return min(self.count(text), self.max_input_tokens)
+
+    def spans(self, text: str) -> List[Tuple[int, int, float]]:
+        """
+        Unidades (inicio, fin, tokens) que cubren el texto, para cortarlo por tokens.
+        Exacto: un token por unidad (offsets del tokenizer). Heurística: una palabra por unidad.
+        """
+        if self._tokenizer is not None:
+            enc = self._tokenizer.encode(text, add_special_tokens=False)
+            return [(a, b, 1.0) for a, b in enc.offsets if b > a]
+
+        return [
+            (m.start(), m.end(), max(1.4, (m.end() - m.start()) / 3.0))
+            for m in _WORD_RE.finditer(text)
+        ]
+
+    def fit(self, text: str, max_tokens: float) -> Tuple[str, float, bool]:
+        """
+        Prefijo más largo del texto que cuenta <= max_tokens (sin los especiales), cortado en
+        límite de token (exacto) o de palabra (heurística, con la misma fórmula que count).
+        Devuelve (prefijo, tokens, entró completo). Solo se tokeniza una ventana acotada:
+        un CV de 200k caracteres con tope de 200 tokens no se recorre entero.
+        """
+        if max_tokens <= 0 or not text.strip():
+            return "", 0.0, not text.strip()
+
+        if self._tokenizer is None:
+            return self._fit_heuristic(text, max_tokens)
+
+        head = text[:int(max_tokens * _FIT_WINDOW_CHARS_PER_TOKEN) + 1]
+        prefix, used, whole = self._fit_exact(head, max_tokens)
+        if whole and len(head) < len(text):
+            # la ventana entró entera (tokens muy largos): medir sobre el texto completo
+            return self._fit_exact(text, max_tokens)
+        return prefix, used, whole
+
+    def _fit_exact(self, text: str, max_tokens: float) -> Tuple[str, float, bool]:
+        end, used = 0, 0
+        for _, b, _ in self.spans(text):
+            if used + 1 > max_tokens:
+                return text[:end], used, False
+            end, used = b, used + 1
+        return text, used, True
+
+    @staticmethod
+    def _fit_heuristic(text: str, max_tokens: float) -> Tuple[str, float, bool]:
+        # count() sin especiales = max(palabras * 1.4, caracteres / 3): el prefijo más largo
+        # que entra es el menor entre el corte por caracteres y el corte por palabras
+        words = len(text.split())
+        if max(words * 1.4, len(text) / 3.0) <= max_tokens:
+            return text, max(words * 1.4, len(text) / 3.0), True
+
+        max_chars = int(max_tokens * 3.0)
+        head = text[:max_chars]
+        if len(text) > max_chars and not text[max_chars].isspace():
+            # no cortar a mitad de palabra
+            cut = max(head.rfind(" "), head.rfind("\n"))
+            head = head[:cut] if cut > 0 else ""
+        head = head.rstrip()
+
+        max_words = int(max_tokens / 1.4)
+        if (max_words + 1) * 1.4 <= max_tokens:
+            max_words += 1
+        split = head.split(None, max_words)
+        if len(split) > max_words:
+            head = head[:len(head) - len(split[-1])].rstrip()
+            words = max_words
+        else:
+            words = len(split)
+        return head, max(words * 1.4, len(head) / 3.0), False
+
+    def count_many(self, texts: Sequence[str]) -> List[int]:
+        if self._tokenizer is not None and texts:
+            encs = self._tokenizer.encode_batch(list(texts), add_special_tokens=True)
+            return [min(len(e.ids), self.max_input_tokens) for e in encs]
+        return [self.count_truncated(t) for t in texts]
+
+
+def plan_batches(lengths: Sequence[int], token_budget: int, max_batch: int) -> List[List[int]]:
+    """
+    Ordena por longitud y empaqueta índices hasta el presupuesto de tokens.
+    Con textos de largo parecido en cada batch casi no hay padding desperdiciado.
+    Un texto que por sí solo supera el presupuesto va en su propio batch.
+    """
+    order = sorted(range(len(lengths)), key=lambda i: lengths[i])
+    batches: List[List[int]] = []
+    current: List[int] = []
+    current_max = 0
+
+    for i in order:
+        n = lengths[i]
+        # costo con padding al más largo del batch (ordenados: n es el nuevo máximo)
+        new_max = max(current_max, n)
+        if current and (len(current) >= max_batch or new_max * (len(current) + 1) > token_budget):
+            batches.append(current)
+            current, new_max = [], n
+        current.append(i)
+        current_max = new_max
+
+    if current:
+        batches.append(current)
+    return batches
+
+
+class AdaptiveTokenBudget:
+    """
+    Presupuesto de tokens por request ajustado en runtime (AIMD):
+     - latencia por debajo del objetivo -> sube de a poco
+     - latencia alta -> baja
+     - 413 / 429 de TEI -> baja a la mitad
+    """
+
+    def __init__(self, initial: int = 8192, minimum: int = 512, maximum: int = 16384,
+                 target_latency: float = 1.0, step: float = 0.1):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.target_latency = target_latency
+        self.step = step
+        self.value = max(minimum, min(initial, maximum))
+
+    def on_success(self, latency: float):
+        if latency < self.target_latency * 0.8:
+            self.value = min(self.maximum, int(self.value * (1 + self.step)) + 1)
+        elif latency > self.target_latency:
+            self.value = max(self.minimum, int(self.value * 0.75))
+
+    def on_overload(self, status: int):
+        self.value = max(self.minimum, self.value // 2)
+        if status == 413:
+            # payload demasiado grande: el techo también baja, TEI nos dijo dónde está su límite
+            self.maximum = max(self.minimum, min(self.maximum, self.value * 2))
+        return self.value
+
+    def __int__(self):
+        return self.value
@@ -0,0 +1,359 @@
+# ingestor/vector_snapshot.py
+"""
+Snapshot local de embeddings para similitud en proceso (sin ir a Postgres).
+
+Layout en disco (una "generación" por reconstrucción completa):
+  <dir>/CURRENT                 nombre de la generación vigente (reemplazo atómico)
+  <dir>/gen-<ts>/vectors.f32    matriz float32 row-major (count x dim), sin cabecera
+  <dir>/gen-<ts>/ids.txt        id_estable por línea, en el mismo orden que las filas
+  <dir>/gen-<ts>/meta.json      {dim, count, normalized, version}
+
+ - el ingestor (único escritor) actualiza la generación vigente tras cada upsert:
+   filas existentes se sobrescriben en su lugar, las nuevas se agregan al final y
+   recién se hacen visibles cuando meta.json (reemplazo atómico) sube `count`
+ - los lectores mapean vectors.f32 con mmap (arranque sin copia, páginas compartidas
+   entre procesos vía page cache) y recargan cuando cambia meta.json
+ - una sobrescritura en su lugar puede leerse a medias durante microsegundos; para
+   ranking de similitud es aceptable
+"""
+
+import os
+import json
+import time
+import logging
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import asyncpg
+import numpy as np
+
+logger = logging.getLogger("vector_snapshot")
+
+VECTORS_FILE = "vectors.f32"
+IDS_FILE = "ids.txt"
+META_FILE = "meta.json"
+CURRENT_FILE = "CURRENT"
+
+LOAD_SQL = """
+SELECT id_estable, embedding
+FROM trabajadores
+WHERE id_estable > $1 AND embedding IS NOT NULL
+ORDER BY id_estable
+LIMIT $2
+"""
+
+
+def _normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def _write_atomic(path: str, data: str):
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+#############################################
+# ESCRITOR (INGESTOR)
+#############################################
+
+class VectorSnapshotWriter:
+    def __init__(self, path: str, dim: int, normalize: bool = True, page_size: int = 5000):
+        self.path = path
+        self.dim = dim
+        self.normalize = normalize
+        self.page_size = page_size
+
+        self._gen_dir: Optional[str] = None
+        self._rows: Dict[str, int] = {}
+        self._version = 0
+        self._lock = threading.Lock()
+
+    @property
+    def row_bytes(self) -> int:
+        return self.dim * 4
+
+    def __len__(self):
+        return len(self._rows)
+
+    def _prepare(self, embeddings: Sequence[Any]) -> np.ndarray:
+        matrix = np.asarray(np.stack([np.asarray(e, dtype=np.float32) for e in embeddings]), dtype=np.float32)
+        if matrix.shape[1] != self.dim:
+            raise ValueError(f"Embedding length {matrix.shape[1]} != expected {self.dim}")
+        return _normalize_rows(matrix) if self.normalize else matrix
+
+    def _write_meta(self):
+        self._version += 1
+        _write_atomic(os.path.join(self._gen_dir, META_FILE), json.dumps({
+            "dim": self.dim,
+            "count": len(self._rows),
+            "normalized": self.normalize,
+            "version": self._version,
+        }))
+
+    async def rebuild(self, pool: asyncpg.Pool):
+        """Nueva generación completa desde trabajadores (keyset pagination) y cambio atómico de CURRENT."""
+        start = time.time()
+        os.makedirs(self.path, exist_ok=True)
+        gen = f"gen-{int(time.time() * 1000)}"
+        gen_dir = os.path.join(self.path, gen)
+        os.makedirs(gen_dir)
+
+        rows: Dict[str, int] = {}
+        last_id = ""
+
+        with open(os.path.join(gen_dir, VECTORS_FILE), "wb") as fv, \
+                open(os.path.join(gen_dir, IDS_FILE), "w", encoding="utf-8") as fi:
+            while True:
+                async with pool.acquire() as conn:
+                    page = await conn.fetch(LOAD_SQL, last_id, self.page_size)
+                if not page:
+                    break
+
+                ids = [r["id_estable"] for r in page]
+                fv.write(self._prepare([r["embedding"] for r in page]).tobytes())
+                fi.write("".join(f"{i}\n" for i in ids))
+                for i in ids:
+                    rows[i] = len(rows)
+                last_id = ids[-1]
+
+        with self._lock:
+            previous = self._gen_dir or self._current_dir()
+            self._gen_dir = gen_dir
+            self._rows = rows
+            self._version = 0
+            self._write_meta()
+            _write_atomic(os.path.join(self.path, CURRENT_FILE), gen)
+            if previous is not None and previous != gen_dir:
+                self._drop_generation(previous)
+
+        logger.info(json.dumps({
+            "event": "vector_snapshot_rebuilt",
+            "generation": gen,
+            "previous": os.path.basename(previous) if previous else None,
+            "rows": len(rows),
+            "time_seconds": round(time.time() - start, 2)
+        }))
+
+    def _current_dir(self) -> Optional[str]:
+        # al arrancar: la generación vigente la dejó otro proceso (o un arranque anterior)
+        try:
+            with open(os.path.join(self.path, CURRENT_FILE), encoding="utf-8") as f:
+                gen = f.read().strip()
+        except FileNotFoundError:
+            return None
+        return os.path.join(self.path, gen) if gen else None
+
+    def _drop_generation(self, gen_dir: str):
+        # solo la generación reemplazada: otro escritor puede estar armando la suya en el
+        # mismo directorio. Los lectores con mmap abiertos conservan los inodos hasta recargar
+        if not os.path.isdir(gen_dir):
+            return
+        for f in os.listdir(gen_dir):
+            os.remove(os.path.join(gen_dir, f))
+        os.rmdir(gen_dir)
+
+    def update(self, ids: Sequence[str], embeddings: Sequence[Any]):
+        """Sobrescribe filas existentes y agrega las nuevas. Llamar tras un upsert exitoso."""
+        if not ids:
+            return
+        if self._gen_dir is None:
+            raise RuntimeError("VectorSnapshotWriter.rebuild() debe llamarse antes de update()")
+
+        matrix = self._prepare(embeddings)
+
+        # último vector por id (un mismo id puede repetirse dentro del batch)
+        latest: Dict[str, int] = {}
+        for pos, id_estable in enumerate(ids):
+            latest[id_estable] = pos
+
+        with self._lock:
+            fd = os.open(os.path.join(self._gen_dir, VECTORS_FILE), os.O_RDWR)
+            try:
+                new_ids: List[str] = []
+                new_pos: List[int] = []
+                for id_estable, pos in latest.items():
+                    row = self._rows.get(id_estable)
+                    if row is None:
+                        new_ids.append(id_estable)
+                        new_pos.append(pos)
+                    else:
+                        os.pwrite(fd, matrix[pos].tobytes(), row * self.row_bytes)
+
+                if new_ids:
+                    os.pwrite(fd, matrix[new_pos].tobytes(), len(self._rows) * self.row_bytes)
+                    with open(os.path.join(self._gen_dir, IDS_FILE), "a", encoding="utf-8") as fi:
+                        fi.write("".join(f"{i}\n" for i in new_ids))
+                    for id_estable in new_ids:
+                        self._rows[id_estable] = len(self._rows)
+            finally:
+                os.close(fd)
+
+            self._write_meta()
+
+
+#############################################
+# LECTOR (PROCESOS DE CONSULTA)
+#############################################
+
+class VectorSnapshot:
+    def __init__(self, path: str, block_rows: int = 65536):
+        self.path = path
+        self.block_rows = block_rows
+
+        self.dim = 0
+        self.normalized = True
+        self.version = -1
+        self.generation: Optional[str] = None
+        self.vectors: Optional[np.ndarray] = None
+        self.ids: List[str] = []
+        self._rows: Dict[str, int] = {}
+        self._norms: Optional[np.ndarray] = None
+        self._ids_offset = 0  # bytes de ids.txt ya leídos (recarga incremental)
+        self._meta_mtime = 0.0
+        self._last_check = 0.0
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _current_generation(self) -> str:
+        with open(os.path.join(self.path, CURRENT_FILE), encoding="utf-8") as f:
+            return f.read().strip()
+
+    def load(self) -> "VectorSnapshot":
+        gen = self._current_generation()
+        gen_dir = os.path.join(self.path, gen)
+        meta_path = os.path.join(gen_dir, META_FILE)
+        mtime = os.stat(meta_path).st_mtime
+        with open(meta_path, encoding="utf-8") as f:
+            meta = json.load(f)
+
+        count, dim = meta["count"], meta["dim"]
+        if count:
+            vectors = np.memmap(os.path.join(gen_dir, VECTORS_FILE), dtype=np.float32,
+                                mode="r", shape=(count, dim))
+        else:
+            vectors = np.zeros((0, dim), dtype=np.float32)
+
+        # misma generación y más filas: solo se leen las líneas nuevas de ids.txt
+        incremental = gen == self.generation and count >= len(self.ids)
+        ids = self.ids if incremental else []
+        offset = self._ids_offset if incremental else 0
+
+        # ids.txt puede tener filas más nuevas que meta.json: solo se toman `count`
+        with open(os.path.join(gen_dir, IDS_FILE), "rb") as f:
+            f.seek(offset)
+            added: List[str] = []
+            while len(ids) + len(added) < count:
+                line = f.readline()
+                if not line.endswith(b"\n"):
+                    break  # línea a medio escribir
+                offset += len(line)
+                added.append(line[:-1].decode("utf-8"))
+
+        rows = self._rows if incremental else {}
+        for i in added:
+            rows[i] = len(ids)
+            ids.append(i)
+
+        self.generation = gen
+        self.dim = dim
+        self.normalized = meta["normalized"]
+        self.version = meta["version"]
+        self.vectors = vectors
+        self.ids = ids
+        self._rows = rows
+        self._ids_offset = offset
+        self._norms = None
+        self._meta_mtime = mtime
+        return self
+
+    def maybe_reload(self, min_interval: float = 1.0) -> bool:
+        """Recarga si cambió la generación o meta.json (chequeo barato, como mucho cada min_interval)."""
+        now = time.monotonic()
+        if self.vectors is not None and now - self._last_check < min_interval:
+            return False
+        self._last_check = now
+
+        if self.vectors is None:
+            self.load()
+            return True
+        try:
+            gen = self._current_generation()
+            mtime = os.stat(os.path.join(self.path, gen, META_FILE)).st_mtime
+        except FileNotFoundError:
+            return False
+        if gen == self.generation and mtime == self._meta_mtime:
+            return False
+        self.load()
+        return True
+
+    def vector(self, id_estable: str) -> Optional[np.ndarray]:
+        row = self._rows.get(id_estable)
+        return None if row is None else np.asarray(self.vectors[row])
+
+    def _row_norms(self) -> np.ndarray:
+        # solo para snapshots sin pre-normalizar; se calcula una vez por carga
+        if self._norms is None:
+            norms = np.empty(len(self.ids), dtype=np.float32)
+            for start in range(0, len(self.ids), self.block_rows):
+                block = self.vectors[start:start + self.block_rows]
+                norms[start:start + len(block)] = np.linalg.norm(block, axis=1)
+            norms[norms == 0] = 1.0
+            self._norms = norms
+        return self._norms
+
+    def search(self, query: Any, k: int = 10, exclude: Optional[Iterable[str]] = None) -> List[Tuple[str, float]]:
+        """
+        Top-k por similitud coseno: producto matriz-vector por bloques sobre el mmap y
+        argpartition por bloque (O(n) en lugar de ordenar todos los scores).
+        """
+        n = len(self.ids)
+        if n == 0 or k <= 0:
+            return []
+
+        q = np.asarray(query, dtype=np.float32)
+        q_norm = float(np.linalg.norm(q))
+        if q_norm:
+            q = q / q_norm
+
+        excluded = [self._rows[i] for i in (exclude or ()) if i in self._rows]
+        want = min(k + len(excluded), n)
+
+        cand_rows: List[np.ndarray] = []
+        cand_scores: List[np.ndarray] = []
+        norms = None if self.normalized else self._row_norms()
+
+        for start in range(0, n, self.block_rows):
+            scores = self.vectors[start:start + self.block_rows] @ q
+            if norms is not None:
+                scores /= norms[start:start + len(scores)]
+            if len(scores) > want:
+                idx = np.argpartition(scores, -want)[-want:]
+                cand_rows.append(idx + start)
+                cand_scores.append(scores[idx])
+            else:
+                cand_rows.append(np.arange(start, start + len(scores)))
+                cand_scores.append(scores)
+
+        rows = np.concatenate(cand_rows)
+        scores = np.concatenate(cand_scores)
+        if excluded:
+            keep = ~np.isin(rows, excluded)
+            rows, scores = rows[keep], scores[keep]
+
+        if len(scores) > k:
+            top = np.argpartition(scores, -k)[-k:]
+            rows, scores = rows[top], scores[top]
+        order = np.argsort(-scores)
+
+        return [(self.ids[r], float(s)) for r, s in zip(rows[order], scores[order])]
+
+    def similar_to(self, id_estable: str, k: int = 10) -> List[Tuple[str, float]]:
+        vec = self.vector(id_estable)
+        if vec is None:
+            return []
+        return self.search(vec, k, exclude=[id_estable])
@@ -0,0 +1,298 @@
+# ingestor/work_queue.py
+"""
+Cola de trabajo durable en Redis Streams entre el diff y el embed/write.
+
+El diff encola cada registro cambiado (XADD) y el ciclo puede confirmar la fuente
+apenas el XADD respondió: a partir de ahí el registro no se pierde aunque TEI o la BD
+estén caídos o el proceso se reinicie. Un consumer group ("workers") embebe y escribe:
+ - XACK (+ XDEL) solo tras el upsert
+ - lo que queda pendiente más de claim_idle_ms (fallos, workers muertos) se reclama
+   con XCLAIM y se reintenta: tras una caída se reprocesa solo el trabajo sin terminar
+ - los fallos propios del registro (no de infraestructura) se cuentan por mensaje; al
+   llegar a max_failures el mensaje pasa al stream de dead letters con el error
+ - por shard se guarda el último hash encolado de cada id con mensajes sin ack (y
+   cuántos hay): el diff no vuelve a encolar lo que ya espera en el stream, y el
+   consumidor descarta (ack sin escribir) un mensaje cuyo hash ya no es el último
+   encolado para su id, así un pendiente reclamado tarde no pisa datos más nuevos
+ - el id de cada mensaje se guarda también fuera del stream (hash msgs por shard): un
+   pendiente cuyo contenido recortó MAXLEN igual libera su id al hacer ack o ir a dead
+   letters; si no, el hash latest seguiría descartando cada nuevo encolado de ese id
+
+Un stream por shard: sin sharding hay uno solo (SingleShard); con sharding cada worker
+consume los streams de los shards cuyo lease tiene (ver ingestor/sharding.py).
+"""
+
+import json
+import time
+import logging
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+import orjson
+from redis.exceptions import ResponseError
+
+from ingestor.sharding import DEFAULT_PREFIX, shard_of
+
+logger = logging.getLogger("work_queue")
+
+GROUP = "workers"
+
+# Campos que viajan por el stream; json_data se reconstruye de json_text al consumir
+_FIELDS = ("id_estable", "hash_completo", "json_text", "texto_unificado")
+
+# XADD solo si el id no tiene ya pendiente ese mismo hash; registra el último hash encolado
+# y el id del mensaje (para liberarlo aunque MAXLEN recorte el contenido)
+_ENQUEUE_LUA = """
+if redis.call('hget', KEYS[2], ARGV[1]) == ARGV[2] then
+    return 0
+end
+local msg_id = redis.call('xadd', KEYS[1], 'MAXLEN', '~', ARGV[4], '*', 'd', ARGV[3])
+redis.call('hset', KEYS[2], ARGV[1], ARGV[2])
+redis.call('hincrby', KEYS[3], ARGV[1], 1)
+redis.call('hset', KEYS[4], msg_id, ARGV[1])
+return 1
+"""
+
+# XACK + XDEL y, si el ack fue efectivo (no repetido), liberar el id: sin mensajes
+# pendientes para el id se olvida su último hash. El id sale del hash msgs; ARGV[3] es
+# el del payload, para mensajes encolados antes de existir msgs
+_ACK_LUA = """
+local acked = redis.call('xack', KEYS[1], ARGV[1], ARGV[2])
+redis.call('xdel', KEYS[1], ARGV[2])
+local id = redis.call('hget', KEYS[4], ARGV[2])
+if id then
+    redis.call('hdel', KEYS[4], ARGV[2])
+elseif ARGV[3] ~= '' then
+    id = ARGV[3]
+end
+if acked == 0 or not id then
+    return 0
+end
+local n = redis.call('hincrby', KEYS[3], id, -1)
+if n <= 0 then
+    redis.call('hdel', KEYS[3], id)
+    redis.call('hdel', KEYS[2], id)
+end
+return 1
+"""
+
+Message = Tuple[int, bytes, Optional[Dict[str, Any]]]  # (shard, id del mensaje, item o None si no decodifica)
+
+
+class SingleShard:
+    """Dueño trivial cuando no hay sharding: un único stream, siempre propio."""
+
+    num_shards = 1
+
+    def __init__(self, worker_id: str):
+        self.worker_id = worker_id
+        self.owned: Set[int] = {0}
+
+    def owns(self, id_estable: Optional[str]) -> bool:
+        return True
+
+
+class WorkQueue:
+    def __init__(self, redis, owner, prefix: str = DEFAULT_PREFIX, claim_idle_ms: int = 60_000,
+                 max_failures: int = 3, maxlen: int = 1_000_000, block_ms: int = 1000):
+        self.redis = redis
+        self.owner = owner  # SingleShard o ShardLeaseManager
+        self.prefix = prefix
+        self.claim_idle_ms = claim_idle_ms
+        self.max_failures = max_failures
+        self.maxlen = maxlen
+        self.block_ms = block_ms
+        self._groups_ready: Set[int] = set()
+        self._enqueue = redis.register_script(_ENQUEUE_LUA)
+        self._ack = redis.register_script(_ACK_LUA)
+
+    @property
+    def consumer(self) -> str:
+        return self.owner.worker_id
+
+    @property
+    def dead_letter_stream(self) -> str:
+        return f"{self.prefix}:work:dead"
+
+    @property
+    def _failures_key(self) -> str:
+        return f"{self.prefix}:work:failures"
+
+    def stream(self, shard: int) -> str:
+        return f"{self.prefix}:work:{shard}"
+
+    def _latest_key(self, shard: int) -> str:
+        return f"{self.prefix}:work:{shard}:latest"
+
+    def _pending_key(self, shard: int) -> str:
+        return f"{self.prefix}:work:{shard}:pending"
+
+    def _msgs_key(self, shard: int) -> str:
+        return f"{self.prefix}:work:{shard}:msgs"
+
+    def _keys(self, shard: int) -> List[str]:
+        return [self.stream(shard), self._latest_key(shard), self._pending_key(shard), self._msgs_key(shard)]
+
+    def _shard(self, id_estable: Optional[str]) -> int:
+        if self.owner.num_shards == 1 or id_estable is None:
+            return 0
+        return shard_of(id_estable, self.owner.num_shards)
+
+    async def _ensure_group(self, shard: int):
+        if shard in self._groups_ready:
+            return
+        try:
+            await self.redis.xgroup_create(self.stream(shard), GROUP, id="0", mkstream=True)
+        except ResponseError as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+        self._groups_ready.add(shard)
+
+    # ------------------------------------------
+    # PRODUCTOR
+    # ------------------------------------------
+
+    async def enqueue(self, items: List[Dict[str, Any]]) -> int:
+        """
+        XADD de items ya preparados al stream de su shard (un pipeline por llamada).
+        Los que ya esperan en el stream con el mismo hash no se repiten; devuelve cuántos
+        se encolaron.
+        """
+        if not items:
+            return 0
+        pipe = self.redis.pipeline(transaction=False)
+        for it in items:
+            shard = self._shard(it["id_estable"])
+            payload = orjson.dumps({k: it.get(k) for k in _FIELDS})
+            await self._enqueue(
+                keys=self._keys(shard),
+                args=[it["id_estable"], it["hash_completo"], payload, self.maxlen],
+                client=pipe
+            )
+        added = await pipe.execute()
+        return sum(added)
+
+    # ------------------------------------------
+    # CONSUMIDOR
+    # ------------------------------------------
+
+    @staticmethod
+    def _decode(shard: int, entries) -> List[Message]:
+        out = []
+        for msg_id, fields in entries:
+            if not fields:
+                # pendiente cuyo contenido ya fue recortado por MAXLEN
+                out.append((shard, msg_id, None))
+                continue
+            try:
+                it = orjson.loads(fields[b"d"])
+                it["json_data"] = orjson.loads(it["json_text"]) if it.get("json_text") else {}
+            except (KeyError, TypeError, orjson.JSONDecodeError):
+                it = None
+            out.append((shard, msg_id, it))
+        return out
+
+    async def read(self, count: int) -> List[Message]:
+        """Mensajes nuevos de los shards propios (bloquea hasta block_ms si no hay)."""
+        owned = sorted(self.owner.owned)
+        if not owned:
+            return []
+        for shard in owned:
+            await self._ensure_group(shard)
+
+        res = await self.redis.xreadgroup(GROUP, self.consumer, {self.stream(s): ">" for s in owned},
+                                          count=count, block=self.block_ms)
+        by_stream = {self.stream(s): s for s in owned}
+        out: List[Message] = []
+        for stream, entries in res or []:
+            name = stream.decode() if isinstance(stream, bytes) else stream
+            out.extend(self._decode(by_stream[name], entries))
+        return out
+
+    async def reclaim(self, count: int) -> List[Message]:
+        """XCLAIM de pendientes con más de claim_idle_ms sin ack (propios o de otro worker)."""
+        out: List[Message] = []
+        for shard in sorted(self.owner.owned):
+            await self._ensure_group(shard)
+            pending = await self.redis.xpending_range(self.stream(shard), GROUP, min="-", max="+",
+                                                      count=count - len(out), idle=self.claim_idle_ms)
+            if not pending:
+                continue
+            ids = [p["message_id"] for p in pending]
+            claimed = await self.redis.xclaim(self.stream(shard), GROUP, self.consumer,
+                                              self.claim_idle_ms, ids)
+            out.extend(self._decode(shard, claimed))
+            if len(out) >= count:
+                break
+        if out:
+            logger.info(json.dumps({"event": "work_reclaimed", "messages": len(out)}))
+        return out
+
+    async def superseded(self, messages: List[Message]) -> Set[bytes]:
+        """Ids de mensaje cuyo hash ya no es el último encolado para su id (hay uno más nuevo)."""
+        if not messages:
+            return set()
+        pipe = self.redis.pipeline(transaction=False)
+        for shard, _, it in messages:
+            pipe.hget(self._latest_key(shard), it["id_estable"])
+        latest = await pipe.execute()
+        return {
+            msg_id for (_, msg_id, it), h in zip(messages, latest)
+            if h is not None and (h.decode() if isinstance(h, bytes) else h) != it["hash_completo"]
+        }
+
+    async def ack(self, messages: List[Message]):
+        if not messages:
+            return
+        pipe = self.redis.pipeline(transaction=False)
+        for shard, msg_id, it in messages:
+            # también los ilegibles o recortados: el id sale del hash msgs
+            id_estable = it.get("id_estable") if it is not None else None
+            await self._ack(keys=self._keys(shard), args=[GROUP, msg_id, id_estable or ""], client=pipe)
+        pipe.hdel(self._failures_key, *[m[1] for m in messages])
+        await pipe.execute()
+
+    async def fail(self, messages: List[Message], error: str) -> int:
+        """
+        Registrar un fallo propio de estos registros. Los que llegan a max_failures van
+        a dead letters; el resto queda pendiente y se reintenta al reclamarlo.
+        Devuelve cuántos se descartaron.
+        """
+        pipe = self.redis.pipeline(transaction=False)
+        for _, msg_id, _ in messages:
+            pipe.hincrby(self._failures_key, msg_id, 1)
+        counts = await pipe.execute()
+        dead = [m for m, n in zip(messages, counts) if n >= self.max_failures]
+        await self.dead_letter(dead, error)
+        return len(dead)
+
+    async def dead_letter(self, messages: List[Message], error: str):
+        if not messages:
+            return
+        pipe = self.redis.pipeline(transaction=False)
+        for shard, msg_id, it in messages:
+            payload = orjson.dumps({k: it.get(k) for k in _FIELDS}) if it is not None else b""
+            pipe.xadd(self.dead_letter_stream, {
+                "stream": self.stream(shard),
+                "message_id": msg_id,
+                "d": payload,
+                "error": error[:1000],
+                "failed_at": str(time.time())
+            }, maxlen=self.maxlen, approximate=True)
+        await pipe.execute()
+        await self.ack(messages)
+        logger.error(json.dumps({
+            "event": "work_dead_lettered",
+            "messages": len(messages),
+            "ids": [it.get("id_estable") if it else None for _, _, it in messages][:20],
+            "error": error[:300]
+        }))
+
+    async def depth(self) -> Dict[str, int]:
+        """Largo y pendientes de los streams propios (para logs/diagnóstico)."""
+        out = {"length": 0, "pending": 0}
+        for shard in sorted(self.owner.owned):
+            await self._ensure_group(shard)
+            out["length"] += await self.redis.xlen(self.stream(shard))
+            info = await self.redis.xpending(self.stream(shard), GROUP)
+            out["pending"] += int(info.get("pending", 0))
+        return out
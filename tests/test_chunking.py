@@ -0,0 +1,74 @@
+# tests/test_chunking.py
+import asyncio
+
+from ingestor.chunking import DELETE_CHUNK_ROWS_SQL, DELETE_CHUNKS_SQL, ChunkedIds, write_chunks
+
+
+class _Conn:
+    def __init__(self):
+        self.executed = []
+        self.copied = []
+
+    async def execute(self, sql, *args):
+        self.executed.append((sql, args))
+
+    async def copy_records_to_table(self, table, records, columns=None):
+        self.copied.extend(records)
+
+
+def _item(id_estable, hashes, stored=None):
+    return {
+        "id_estable": id_estable,
+        "chunks": [{"chunk_no": n, "chunk_hash": h, "embedding": f"v-{h}"} for n, h in enumerate(hashes)],
+        "chunks_stored": stored or {},
+    }
+
+
+def _write(items, chunked=None):
+    conn = _Conn()
+    asyncio.run(write_chunks(conn, items, chunked))
+    return conn
+
+
+def test_registro_nuevo_solo_copy():
+    conn = _write([_item("a", ["h0", "h1"])], ChunkedIds())
+    assert conn.executed == []
+    assert [r[:3] for r in conn.copied] == [("a", 0, "h0"), ("a", 1, "h1")]
+
+
+def test_solo_reescribe_chunks_cambiados_y_borra_sobrantes():
+    stored = {0: "h0", 1: "h1", 2: "h2", 3: "h3"}
+    conn = _write([_item("a", ["h0", "h1", "x2"], stored)], ChunkedIds())
+
+    assert conn.executed == [(DELETE_CHUNK_ROWS_SQL, (["a", "a"], [2, 3]))]
+    assert [r[:3] for r in conn.copied] == [("a", 2, "x2")]
+
+
+def test_sin_cambios_no_escribe_nada():
+    conn = _write([_item("a", ["h0", "h1"], {0: "h0", 1: "h1"})], ChunkedIds())
+    assert conn.executed == [] and conn.copied == []
+
+
+def test_un_pasaje_borra_solo_si_tenia_chunks():
+    chunked = ChunkedIds()
+    chunked.update([_item("tenia", ["h0", "h1"])])
+
+    conn = _write([_item("nuevo", []), _item("tenia", [])], chunked)
+    assert conn.executed == [(DELETE_CHUNKS_SQL, (["tenia"],))]
+
+    # sin ChunkedIds: comportamiento conservador, borra siempre
+    conn = _write([_item("nuevo", [])])
+    assert conn.executed == [(DELETE_CHUNKS_SQL, (["nuevo"],))]
+
+
+def test_id_repetido_en_el_batch_gana_la_ultima_version():
+    conn = _write([_item("a", ["h0", "h1"]), _item("a", ["z0", "z1"])], ChunkedIds())
+    assert [r[:3] for r in conn.copied] == [("a", 0, "z0"), ("a", 1, "z1")]
+
+
+def test_chunked_ids_sigue_las_escrituras():
+    chunked = ChunkedIds()
+    chunked.update([_item("a", ["h0", "h1"]), _item("b", [])])
+    assert "a" in chunked and "b" not in chunked
+    chunked.update([_item("a", [])])
+    assert "a" not in chunked
@@ -0,0 +1,121 @@
+# tests/test_generic_api.py
+import asyncio
+
+import orjson
+
+from ingestor.sources.impl.generic_api import GenericAPISource, _watermark_sort_key
+
+
+def test_numeros_por_valor_y_no_como_texto():
+    assert _watermark_sort_key(10) > _watermark_sort_key(9)
+    assert _watermark_sort_key("10") > _watermark_sort_key("9")
+    assert _watermark_sort_key(10) > _watermark_sort_key("9.5")
+
+
+def test_fechas_iso_con_distinta_zona():
+    assert _watermark_sort_key("2024-01-01T10:00:00Z") == _watermark_sort_key("2024-01-01T10:00:00+00:00")
+    assert _watermark_sort_key("2024-01-01T10:00:00+00:00") > _watermark_sort_key("2024-01-01T11:00:00+02:00")
+    # sin zona = UTC
+    assert _watermark_sort_key("2024-01-01T10:00:00") == _watermark_sort_key("2024-01-01T10:00:00Z")
+
+
+def test_texto_y_watermark_guardado():
+    assert _watermark_sort_key("b") > _watermark_sort_key("a")
+    # el watermark vuelve de Redis como string: mismo orden que el valor tipado
+    assert _watermark_sort_key(str(1500)) == _watermark_sort_key(1500)
+    assert max(["9", "10", "2"], key=_watermark_sort_key) == "10"
+
+
+#############################################
+# REQUESTS CONDICIONALES POR PÁGINA
+#############################################
+
+class _FakePipeline:
+    def __init__(self, redis):
+        self.redis = redis
+        self.ops = []
+
+    def delete(self, key):
+        self.ops.append(lambda: self.redis.data.pop(key, None))
+
+    def hset(self, key, mapping):
+        self.ops.append(lambda: self.redis.data.setdefault(key, {}).update(mapping))
+
+    async def execute(self):
+        for op in self.ops:
+            op()
+
+
+class _FakeRedis:
+    def __init__(self):
+        self.data = {}
+
+    async def hgetall(self, key):
+        return dict(self.data.get(key, {}))
+
+    async def get(self, key):
+        return self.data.get(key)
+
+    async def set(self, key, value):
+        self.data[key] = value
+
+    def pipeline(self, transaction=True):
+        return _FakePipeline(self)
+
+
+class _FakeAPI(GenericAPISource):
+    """Simula PostgREST con Range: ETag = digest de la página."""
+
+    def __init__(self, rows, **kw):
+        super().__init__("http://api/trabajadores", pagination="range", page_size=2,
+                         redis=_FakeRedis(), **kw)
+        self.rows = rows
+        self.requests = 0
+
+    async def _get(self, params, headers):
+        self.requests += 1
+        start, end = (int(x) for x in headers["Range"].split("-"))
+        page = self.rows[start:end + 1]
+        if not page:
+            return 416, {}, b""
+        body = orjson.dumps(page)
+        etag = f'"{len(body)}-{hash(body)}"'
+        if headers.get("If-None-Match") == etag:
+            return 304, {}, b""
+        return 200, {"ETag": etag}, body
+
+
+async def _cycle(src):
+    seen = []
+    async for page in src.iter_pages():
+        seen.extend(w["raw"]["id"] for w in page)
+    await src.commit()
+    return seen
+
+
+def test_paginas_sin_cambios_no_se_reprocesan():
+    rows = [{"id": i, "v": 0} for i in range(5)]
+    src = _FakeAPI(rows)
+
+    assert asyncio.run(_cycle(src)) == [0, 1, 2, 3, 4]
+    assert src.not_modified_count == 0
+
+    # nada cambió: todas las páginas 304, ninguna fila re-procesada
+    assert asyncio.run(_cycle(src)) == []
+    assert src.not_modified_count == 1
+
+    # cambia una fila de la segunda página: solo esa página vuelve
+    rows[3]["v"] = 1
+    assert asyncio.run(_cycle(src)) == [2, 3]
+    assert src.not_modified_count == 1
+
+
+def test_validadores_pendientes_hasta_commit():
+    src = _FakeAPI([{"id": i} for i in range(3)])
+
+    async def without_commit():
+        return [w["raw"]["id"] async for page in src.iter_pages() for w in page]
+
+    assert asyncio.run(without_commit()) == [0, 1, 2]
+    # ciclo sin commit (falló): el siguiente vuelve a descargar todo
+    assert asyncio.run(_cycle(src)) == [0, 1, 2]
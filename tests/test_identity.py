@@ -0,0 +1,88 @@
+# tests/test_identity.py
+import asyncio
+
+from ingestor.identity import IdentityResolver, email_keys, dni_key, identity_keys, merge_records
+from ingestor.sources.merge_sources import Deduplicator, exact_key
+from ingestor.utils.preprocess import preprocess_record
+from benchmarks.e2e.memory_db import MemoryDB
+
+API1 = {"id": 7, "email": "Ana.Perez+cv@Gmail.com", "nombre": "Ana", "skills": ["python"]}
+API2 = {"id": "x1", "correo": "anaperez@gmail.com", "nombre": "Ana P.", "area": "ventas", "skills": ["sql"]}
+DRIVE = {"file_id": "f1", "documento": "cv_ana.pdf", "contenido": "Ana Pérez - anaperez@gmail.com\nExperiencia..."}
+
+
+def _wrap(source, raw):
+    return {"raw": raw, "source": source, "source_key": source}
+
+
+def _resolve(resolver, pool, page):
+    async def run():
+        async with pool.acquire() as conn:
+            return await resolver.resolve(conn, page)
+
+    return asyncio.run(run())
+
+
+def test_claves_normalizadas():
+    assert email_keys(" Ana.Perez+cv@Gmail.com ") == ["email:ana.perez+cv@gmail.com", "email:anaperez@gmail.com"]
+    assert email_keys("sin-arroba") == []
+    assert dni_key("00.123.456-k") == "dni:123456k"
+    assert identity_keys(DRIVE, "drive") == ["file:f1", "email:anaperez@gmail.com"]
+    assert identity_keys({"id": 3}, "api1") == ["src:api1:3"]
+    assert identity_keys({"nombre": "sin claves"}, "api1") == []
+
+
+def test_merge_records_por_prioridad():
+    merged = merge_records([API1, API2])
+    assert merged["nombre"] == "Ana"
+    assert merged["area"] == "ventas"
+    assert merged["skills"] == ["python", "sql"]
+    assert merge_records([{"a": None}, {"a": 1}]) == {"a": 1}
+
+
+def test_misma_persona_en_tres_fuentes_un_solo_registro():
+    pool = MemoryDB(rtt_ms=0)
+    resolver = IdentityResolver(["api1", "api2", "drive"])
+
+    (drive,) = _resolve(resolver, pool, [_wrap("drive", DRIVE)])
+    (api2,) = _resolve(resolver, pool, [_wrap("api2", API2)])
+    (api1,) = _resolve(resolver, pool, [_wrap("api1", API1)])
+
+    assert drive["id_estable"] == api2["id_estable"] == api1["id_estable"]
+    assert api1["source"] == "api1,api2,drive"
+    assert api1["raw"]["nombre"] == "Ana"
+    assert api1["raw"]["area"] == "ventas"
+    assert api1["raw"]["file_id"] == "f1"
+
+    # el resultado no depende del orden en que corren las fuentes
+    other = IdentityResolver(["api1", "api2", "drive"])
+    pool2 = MemoryDB(rtt_ms=0)
+    _resolve(other, pool2, [_wrap("api1", API1)])
+    _resolve(other, pool2, [_wrap("api2", API2)])
+    (again,) = _resolve(other, pool2, [_wrap("drive", DRIVE)])
+    assert again["raw"] == api1["raw"]
+
+
+def test_id_canonico_compatible_con_el_preprocesamiento():
+    resolver = IdentityResolver(["api1"])
+    record = {"email": "luis@x.com", "nombre": "Luis"}
+    (out,) = _resolve(resolver, MemoryDB(rtt_ms=0), [_wrap("api1", record)])
+    assert out["id_estable"] == preprocess_record(record)[0]
+
+
+def test_registros_sin_claves_se_descartan():
+    resolver = IdentityResolver()
+    assert _resolve(resolver, MemoryDB(rtt_ms=0), [_wrap("api1", {"nombre": "x"})]) == []
+
+
+def test_deduplicator_por_dni_o_correo():
+    dedup = Deduplicator()
+    page = [_wrap("api1", {"dni": "1", "nombre": "a"}), _wrap("api2", {"dni": "1", "nombre": "b"}),
+            _wrap("api2", {"correo": "c@x.com"})]
+    assert [w["raw"].get("nombre") for w in dedup.filter(page)] == ["a", None]
+    assert dedup.filter([_wrap("drive", {"correo": "c@x.com", "extra": 1})]) == []
+    assert dedup.total == 4
+
+    # con resolución de identidad solo se descartan los idénticos
+    exact = Deduplicator(exact_key)
+    assert len(exact.filter(page + [_wrap("api1", {"dni": "1", "nombre": "a"})])) == 3
@@ -0,0 +1,75 @@
+# tests/test_merge_sources.py
+import json
+import asyncio
+
+import numpy as np
+
+from ingestor.core import configure_core, run_ingest_cycle
+from ingestor.hash_index import HashIndex
+from ingestor.sources.merge_sources import SourceOwnership
+from benchmarks.e2e.memory_db import MemoryDB
+
+
+class _Source:
+    def __init__(self, key, records):
+        self.key = self.name = key
+        self.records = records
+
+    async def iter_pages(self):
+        yield list(self.records)
+
+    async def commit(self):
+        pass
+
+
+class _TEI:
+    def tokens(self, text):
+        return len(text.split())
+
+    async def embed_batch(self, session, texts):
+        return [np.ones(4, dtype=np.float32) for _ in texts]
+
+
+def _item(id_estable):
+    return {"id_estable": id_estable}
+
+
+def test_ownership_gana_la_fuente_prioritaria():
+    async def run():
+        owners = SourceOwnership(["api1", "api2"], ttl=100)
+        # api2 corre primero y toma el id; api1 (más prioridad) se lo queda
+        assert len(await owners.filter("api2", [_item("a")], now=0)) == 1
+        assert len(await owners.filter("api1", [_item("a")], now=1)) == 1
+        for t in range(2, 10):
+            assert await owners.filter("api2", [_item("a"), _item("b")], now=t) == [_item("b")]
+            assert len(await owners.filter("api1", [_item("a")], now=t)) == 1
+        # api1 deja de traerlo más de ttl: api2 puede tomarlo
+        assert len(await owners.filter("api2", [_item("a")], now=200)) == 1
+        assert await owners.filter("api1", [_item(None)], now=200) == [_item(None)]
+
+    asyncio.run(run())
+
+
+def test_dos_fuentes_con_el_mismo_correo_no_se_pisan():
+    configure_core(database_url="memory://", tei_url="http://fake-tei", batch_size=4,
+                   expected_embedding_dim=4, chunking_enabled=False)
+    api1 = _Source("api1", [{"email": "ana@x.com", "nombre": "Ana", "area": "ventas"}])
+    api2 = _Source("api2", [{"email": "ana@x.com", "nombre": "Ana María"}])
+
+    async def run():
+        pool = MemoryDB(rtt_ms=0)
+        hash_index = HashIndex(refresh_interval=0, full_reload_interval=0)
+        owners = SourceOwnership(["api1", "api2"])
+
+        changed = []
+        for source in (api2, api1, api2, api1, api2):
+            stats = await run_ingest_cycle(None, pool, _TEI(), hash_index, sources=[source], ownership=owners)
+            assert stats["errors"] == 0
+            changed.append(stats["changed"])
+        return pool, changed
+
+    pool, changed = asyncio.run(run())
+    # api2 escribe primero, api1 la reemplaza una vez y desde ahí nada cambia
+    assert changed == [1, 1, 0, 0, 0]
+    (row,) = pool.rows.values()
+    assert json.loads(row["json_data"])["nombre"] == "Ana"
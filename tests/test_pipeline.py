@@ -0,0 +1,59 @@
+# tests/test_pipeline.py
+import asyncio
+
+from ingestor.pipeline import Pipeline
+
+
+def _run(pipe):
+    return asyncio.run(pipe.run())
+
+
+def test_run_devuelve_errores_por_etapa():
+    out = []
+
+    def build():
+        pipe = Pipeline("test")
+        q_in = pipe.queue("in", 4)
+        q_out = pipe.queue("out", 4)
+
+        async def gen():
+            for i in range(5):
+                yield i
+
+        async def boom():
+            yield 100
+            raise RuntimeError("fuente caída")
+
+        async def double(x, emit):
+            if x == 3:
+                raise ValueError("registro roto")
+            await emit(x * 2)
+
+        async def collect(x, emit):
+            out.append(x)
+
+        pipe.source("sources", [gen, boom], q_in, concurrency=2)
+        pipe.stage("double", double, q_in, q_out, concurrency=2)
+        pipe.stage("collect", collect, q_out, None)
+        return pipe
+
+    failed = _run(build())
+
+    assert failed == {"sources": 1, "double": 1}
+    assert sorted(out) == [0, 2, 4, 8, 200]
+
+
+def test_run_sin_errores_devuelve_vacio():
+    pipe = Pipeline("test")
+    q = pipe.queue("in", 2)
+
+    async def gen():
+        yield 1
+
+    async def sink(x, emit):
+        pass
+
+    pipe.source("sources", [gen], q)
+    pipe.stage("sink", sink, q, None)
+
+    assert _run(pipe) == {}
@@ -0,0 +1,79 @@
+# tests/test_projection.py
+from ingestor.utils.preprocess import preprocess_record
+from ingestor.utils.projection import TextProjector, combine_templates, parse_templates
+from ingestor.utils.tokens import TokenEstimator
+
+CONFIG = {
+    "token_budget": 40,
+    "sources": {
+        "api1": {"fields": [
+            {"path": "nombre|nombres", "label": "Nombre"},
+            {"path": "skills", "label": "Habilidades", "max_items": 2},
+            {"path": "resumen", "label": "Resumen", "max_tokens": 10},
+        ]},
+        "drive": {"token_budget": 0, "fields": [{"path": "contenido", "label": "CV"}, "nombre"]},
+        "api2": {"token_budget": 60, "fields": ["area", "nombre"]},
+    },
+}
+
+RECORD = {
+    "email": "ana@x.com",
+    "nombres": "Ana",
+    "skills": ["python", "sql", "python", "go"],
+    "resumen": "uno dos tres cuatro cinco seis siete ocho nueve diez once doce trece catorce",
+    "area": "ventas",
+    "contenido": "cv " * 50,
+}
+
+
+def _projector():
+    return TextProjector(parse_templates(CONFIG, 480), TokenEstimator())
+
+
+def test_combine_templates_respeta_prioridad_sin_repetir_campos():
+    t = parse_templates(CONFIG, 480)
+    assert combine_templates([t["api1"]]) is t["api1"]
+
+    combined = combine_templates([t["api2"], t["api1"]])
+    assert [f["path"] for f in combined.fields] == ["area", "nombre", "nombre|nombres", "skills", "resumen"]
+    assert combined.token_budget == 60
+    # una fuente sin límite deja sin límite a la combinación
+    assert combine_templates([t["api1"], t["drive"]]).token_budget == 0
+
+
+def test_texto_por_plantilla_con_topes_por_campo():
+    projector = _projector()
+    _, _, _, texto = projector.preprocessor_for("api1")(RECORD)
+    nombre, skills, resumen = texto.split("\n")
+
+    assert nombre == "Nombre: Ana"
+    assert skills == "Habilidades: python, sql"
+    assert resumen.startswith("Resumen: uno dos")
+    assert "catorce" not in resumen
+
+
+def test_presupuesto_total_corta_el_ultimo_campo_y_descarta_los_siguientes():
+    estimator = TokenEstimator()
+    config = {"token_budget": 20, "sources": {"drive": {"fields": [
+        {"path": "nombres", "label": "Nombre"}, {"path": "contenido", "label": "CV"}, "area"
+    ]}}}
+    projector = TextProjector(parse_templates(config, 480), estimator)
+    _, _, _, texto = projector.preprocessor_for("drive")(RECORD)
+
+    assert texto.startswith("Nombre: Ana\nCV: cv cv")
+    assert 0 < texto.count("cv") < 50
+    assert "ventas" not in texto
+    assert estimator.count(texto) <= 20
+
+
+def test_fuente_sin_plantilla_usa_el_texto_universal():
+    assert _projector().preprocessor_for("otra")(RECORD) == preprocess_record(RECORD)
+
+
+def test_cambiar_la_plantilla_cambia_el_hash():
+    before = _projector().preprocessor_for("api2")(RECORD)
+    config = dict(CONFIG, sources=dict(CONFIG["sources"], api2={"token_budget": 60, "fields": ["nombre", "area"]}))
+    after = TextProjector(parse_templates(config, 480), TokenEstimator()).preprocessor_for("api2")(RECORD)
+
+    assert before[0] == after[0]
+    assert before[1] != after[1]
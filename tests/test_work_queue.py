@@ -0,0 +1,80 @@
+# tests/test_work_queue.py
+import asyncio
+
+import fakeredis
+
+from ingestor.work_queue import SingleShard, WorkQueue
+
+
+def _item(id_estable, h):
+    return {"id_estable": id_estable, "hash_completo": h, "json_text": '{"a": 1}', "texto_unificado": "a"}
+
+
+def _run(test):
+    async def run():
+        queue = WorkQueue(fakeredis.FakeAsyncRedis(), SingleShard("w1"), max_failures=2, block_ms=1)
+        await test(queue)
+
+    asyncio.run(run())
+
+
+def test_no_repite_lo_que_ya_espera_y_ack_libera():
+    async def test(queue):
+        assert await queue.enqueue([_item("a", "h1"), _item("b", "h1")]) == 2
+        assert await queue.enqueue([_item("a", "h1")]) == 0
+
+        messages = await queue.read(10)
+        assert [it["id_estable"] for _, _, it in messages] == ["a", "b"]
+        assert messages[0][2]["json_data"] == {"a": 1}
+        await queue.ack(messages)
+        # el ack repetido (p. ej. tras un reclamo) no descuenta de más
+        await queue.ack(messages)
+
+        assert await queue.enqueue([_item("a", "h1")]) == 1
+        assert (await queue.depth())["length"] == 1
+
+    _run(test)
+
+
+def test_mensaje_viejo_queda_reemplazado():
+    async def test(queue):
+        await queue.enqueue([_item("a", "h1")])
+        await queue.enqueue([_item("a", "h2")])
+
+        old, new = await queue.read(10)
+        assert await queue.superseded([old, new]) == {old[1]}
+
+        await queue.ack([old])
+        # sigue pendiente h2: el mismo hash no se vuelve a encolar
+        assert await queue.enqueue([_item("a", "h2")]) == 0
+        await queue.ack([new])
+        assert await queue.enqueue([_item("a", "h2")]) == 1
+
+    _run(test)
+
+
+def test_mensaje_recortado_libera_su_id():
+    async def test(queue):
+        await queue.enqueue([_item("a", "h1")])
+        (shard, msg_id, _), = await queue.read(10)
+
+        # contenido recortado por MAXLEN: el consumidor solo tiene el id del mensaje
+        await queue.dead_letter([(shard, msg_id, None)], "recortado")
+
+        assert await queue.redis.xlen(queue.dead_letter_stream) == 1
+        assert await queue.enqueue([_item("a", "h1")]) == 1
+
+    _run(test)
+
+
+def test_fallos_propios_van_a_dead_letters():
+    async def test(queue):
+        await queue.enqueue([_item("a", "h1")])
+        messages = await queue.read(10)
+
+        assert await queue.fail(messages, "registro roto") == 0
+        assert await queue.fail(messages, "registro roto") == 1
+        assert (await queue.depth()) == {"length": 0, "pending": 0}
+        assert await queue.enqueue([_item("a", "h1")]) == 1
+
+    _run(test)